@@ -1,13 +1,21 @@
 import csv, json
 import sys
 import argparse
+import hashlib
 import os
+import re
+import sqlite3
+import time
 
 DATA_DIR = os.path.dirname(os.path.abspath(__file__))
 PMACS_FILE = os.path.join(DATA_DIR, "pmacs.csv")
 SMACS_FILE = os.path.join(DATA_DIR, "smacs.csv")
 TEST_PIDS_FILE = os.path.join(DATA_DIR, "test_pids.csv")
 TEST_GIDS_FILE = os.path.join(DATA_DIR, "test_gids.csv")
+DB_FILE = os.path.join(DATA_DIR, "provision.db")
+DEFAULT_HALL = "default"  # the hall described by the CSVs in DATA_DIR
+
+_db = None  # (path, connection)
 
 
 def load_csv(filepath):
@@ -22,63 +30,407 @@ def load_csv(filepath):
     return data
 
 
-def get_mappings():
-    pmacs = {row["pmac"]: row["pid"] for row in load_csv(PMACS_FILE)}
-    smacs = {row["smac"]: row["sid"] for row in load_csv(SMACS_FILE)}
-    gids = {row["gid"].upper(): row["color"] for row in load_csv(TEST_GIDS_FILE)}
-    return pmacs, smacs, gids
-
-
-def lookup(mac):
-    pmacs, smacs, gids = get_mappings()
-    # Normalize MAC
-    mac_norm = mac.replace(":", "").upper()
-
-    # Check PMACS (Pole IDs)
-    for pmac, pid in pmacs.items():
-        if pmac.replace(":", "").upper() == mac_norm:
-            result = f"Found PID: {pid} for MAC: {pmac}"
-            # Enrich with test data if available
-            test_data = load_csv(TEST_PIDS_FILE)
-            for row in test_data:
-                # Normalize both and check if one is a suffix of the other (test data often omits prefix)
-                norm_row = row["pmac"].replace(":", "").upper()
-                norm_factory = pmac.replace(":", "").upper()
-                if norm_row in norm_factory or norm_factory in norm_row:
-                    color = gids.get(row["gid"].upper(), "unknown")
-                    result += f"\nDeployment: Booth {row['bid']}, Slave {row['sid']}, Group {row['gid']} ({color})"
-            return result
-
-    # Check SMACS (Slave IDs)
-    for smac, sid in smacs.items():
-        if smac.upper() == mac_norm:
-            return f"Found SID: {sid} for MAC: {smac}"
+def norm_mac(mac):
+    return mac.replace(":", "").replace("-", "").replace(" ", "").upper()
+
+
+# --- Provisioning database ---
+# SQLite store (WAL, so lookups keep working while an import or scan writes)
+# holding the factory list, the slaves and each hall's deployment plan.
+# Pillars and slaves are keyed by normalized MAC (12 hex digits) with the
+# reversed MAC indexed too, so a 4/6/8 digit suffix is a range scan. The CSVs
+# stay the exchange format: a hall is imported from a directory of them and
+# the default hall follows DATA_DIR, re-imported when a source file's content
+# changes (mtime/size first, then its hash).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS halls (hid INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS slaves (
+    mac TEXT PRIMARY KEY, rmac TEXT NOT NULL, label TEXT, sid TEXT, hid INTEGER REFERENCES halls
+);
+CREATE INDEX IF NOT EXISTS slaves_rmac ON slaves (rmac);
+CREATE INDEX IF NOT EXISTS slaves_sid ON slaves (hid, sid);
+CREATE TABLE IF NOT EXISTS groups (
+    hid INTEGER REFERENCES halls, gid TEXT, color TEXT, PRIMARY KEY (hid, gid)
+);
+CREATE TABLE IF NOT EXISTS booths (
+    hid INTEGER REFERENCES halls, bid TEXT, gid TEXT, sid TEXT, PRIMARY KEY (hid, bid)
+);
+CREATE TABLE IF NOT EXISTS pillars (
+    mac TEXT PRIMARY KEY, rmac TEXT NOT NULL, pid TEXT, label TEXT,
+    hid INTEGER REFERENCES halls, sid TEXT, bid TEXT, gid TEXT, dpid TEXT, pos INTEGER,
+    seen_at INTEGER, seen_by TEXT
+);
+CREATE INDEX IF NOT EXISTS pillars_rmac ON pillars (rmac);
+CREATE INDEX IF NOT EXISTS pillars_pid ON pillars (pid);
+CREATE INDEX IF NOT EXISTS pillars_sid ON pillars (hid, sid, pos);
+CREATE INDEX IF NOT EXISTS pillars_bid ON pillars (hid, bid);
+CREATE INDEX IF NOT EXISTS pillars_gid ON pillars (hid, gid);
+"""
+# mac, pid, sid, bid, gid, color of a pillar with its deployment joined in
+PILLAR_ROW = """
+SELECT p.mac, p.label, p.pid, COALESCE(p.dpid, p.pid) AS dpid, p.sid, p.bid, p.gid,
+       COALESCE(g.color, 'unknown') AS color, h.name AS hall, p.pos
+FROM pillars p
+LEFT JOIN groups g ON g.hid = p.hid AND g.gid = p.gid
+LEFT JOIN halls h ON h.hid = p.hid
+"""
+
+
+def source_files(data_dir=DATA_DIR):
+    return [os.path.join(data_dir, os.path.basename(p)) for p in (PMACS_FILE, SMACS_FILE, TEST_PIDS_FILE, TEST_GIDS_FILE)]
+
+
+def source_state(path, with_hash=True):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    state = [st.st_mtime_ns, st.st_size]
+    if with_hash:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        state.append(h.hexdigest())
+    return state
+
+
+def open_db(path=None):
+    db = sqlite3.connect(path or DB_FILE)
+    db.row_factory = sqlite3.Row
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+    except sqlite3.OperationalError:
+        pass  # read-only checkout: readers still work
+    db.executescript(SCHEMA)
+    return db
+
+
+def hall_id(db, name):
+    db.execute("INSERT OR IGNORE INTO halls (name) VALUES (?)", (name,))
+    return db.execute("SELECT hid FROM halls WHERE name = ?", (name,)).fetchone()[0]
+
+
+def meta(db, key, value=None):
+    if value is None:
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
 
-    return f"MAC address {mac} not found in factory mappings."
 
+def suffix_range(key):
+    # rmac bounds for every MAC ending in key
+    rev = key[::-1]
+    return rev, rev + "~"
 
-def generate_pillars():
-    pmacs, smacs, gids = get_mappings()
-    test_data = load_csv(TEST_PIDS_FILE)
 
-    pillars = []
-    for row in test_data:
-        # gid,sid,bid,pmac,pid
-        factory_pid = pmacs.get(row["pmac"])
-        if factory_pid and factory_pid != row["pid"]:
-            print(
-                f"Warning: Mismatch for PMAC {row['pmac']}. Factory PID: {factory_pid}, Test PID: {row['pid']}"
+def import_csv(db, hall=DEFAULT_HALL, data_dir=DATA_DIR):
+    # One transaction: factory rows are upserted, the hall's slaves, groups,
+    # booths and planned deployment are replaced; scan results and pillars
+    # placed by --scan --assign (no plan position) are kept
+    files = source_files(data_dir)
+    pmacs, smacs, tpids, tgids = (load_csv(p) for p in files)
+    with db:
+        hid = hall_id(db, hall)
+        db.executemany(
+            "INSERT INTO pillars (mac, rmac, pid, label) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (mac) DO UPDATE SET pid = excluded.pid, label = excluded.label",
+            ((k, k[::-1], r["pid"].upper(), r["pmac"]) for r, k in ((r, norm_mac(r["pmac"])) for r in pmacs)),
+        )
+        db.execute("UPDATE slaves SET hid = NULL, sid = NULL WHERE hid = ?", (hid,))
+        db.executemany(
+            "INSERT INTO slaves (mac, rmac, label, sid, hid) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (mac) DO UPDATE SET label = excluded.label, sid = excluded.sid, hid = excluded.hid",
+            ((k, k[::-1], r["smac"], r["sid"], hid) for r, k in ((r, norm_mac(r["smac"])) for r in smacs)),
+        )
+        db.execute("DELETE FROM groups WHERE hid = ?", (hid,))
+        db.executemany(
+            "INSERT OR REPLACE INTO groups (hid, gid, color) VALUES (?, ?, ?)",
+            ((hid, r["gid"].upper(), r["color"]) for r in tgids),
+        )
+        db.execute("DELETE FROM booths WHERE hid = ?", (hid,))
+        db.execute(
+            "UPDATE pillars SET hid = NULL, sid = NULL, bid = NULL, gid = NULL, dpid = NULL, pos = NULL "
+            "WHERE hid = ? AND pos IS NOT NULL",
+            (hid,),
+        )
+        unmatched = 0
+        for pos, row in enumerate(tpids):
+            # Test data often omits the MAC prefix: a short entry matches as a suffix
+            norm = norm_mac(row["pmac"])
+            if len(norm) == 12:
+                keys = [norm]
+            elif len(norm) < 12:
+                keys = [r[0] for r in db.execute("SELECT mac FROM pillars WHERE rmac >= ? AND rmac < ?", suffix_range(norm))]
+            else:
+                keys = [r[0] for r in db.execute("SELECT mac FROM pillars") if r[0] in norm]
+            if not keys:
+                print(f"Warning: No factory MAC matches PMAC {row['pmac']} (Test PID: {row['pid']}), row skipped")
+                unmatched += 1
+                continue
+            for key in keys:
+                found = db.execute("SELECT pid FROM pillars WHERE mac = ?", (key,)).fetchone()
+                if found is None:
+                    db.execute("INSERT INTO pillars (mac, rmac, pid) VALUES (?, ?, ?)", (key, key[::-1], row["pid"].upper()))
+                elif found[0] != row["pid"].upper():
+                    print(f"Warning: Mismatch for PMAC {row['pmac']}. Factory PID: {found[0]}, Test PID: {row['pid']}")
+                db.execute(
+                    "UPDATE pillars SET hid = ?, sid = ?, bid = ?, gid = ?, dpid = ?, pos = ? WHERE mac = ?",
+                    (hid, row["sid"].upper(), row["bid"].upper(), row["gid"].upper(), row["pid"].upper(), pos, key),
+                )
+            db.execute(
+                "INSERT OR REPLACE INTO booths (hid, bid, gid, sid) VALUES (?, ?, ?, ?)",
+                (hid, row["bid"].upper(), row["gid"].upper(), row["sid"].upper()),
             )
+        meta(db, f"sources:{hall}", {"dir": os.path.abspath(data_dir), "files": {os.path.basename(p): source_state(p) for p in files}})
+    return {
+        "pillars": db.execute("SELECT COUNT(*) FROM pillars").fetchone()[0],
+        "slaves": len(smacs),
+        "deployed": db.execute("SELECT COUNT(*) FROM pillars WHERE hid = ?", (hid,)).fetchone()[0],
+        "unmatched": unmatched,
+    }
+
+
+def sources_fresh(db, hall, data_dir):
+    # True when no source changed; a touched but identical file only updates
+    # the stored stat
+    stored = meta(db, f"sources:{hall}")
+    if not stored or stored["dir"] != os.path.abspath(data_dir):
+        return False
+    touched = False
+    for path in source_files(data_dir):
+        known = stored["files"].get(os.path.basename(path))
+        state = source_state(path, with_hash=False)
+        if state is None or known is None:
+            if state != known:
+                return False
+            continue
+        if state == known[:2]:
+            continue
+        state = source_state(path)
+        if state[2] != known[2]:
+            return False
+        stored["files"][os.path.basename(path)] = state
+        touched = True
+    if touched:
+        with db:
+            meta(db, f"sources:{hall}", stored)
+    return True
+
+
+def get_db(path=None, hall=DEFAULT_HALL, data_dir=None):
+    # The default hall follows DATA_DIR, others the directory they came from
+    global _db
+    path = path or DB_FILE
+    if _db is None or _db[0] != path:
+        _db = (path, open_db(path))
+    db = _db[1]
+    if data_dir is None:
+        stored = meta(db, f"sources:{hall}")
+        data_dir = DATA_DIR if hall == DEFAULT_HALL else stored and stored["dir"]
+    if data_dir and os.path.isdir(data_dir):
+        try:
+            if not sources_fresh(db, hall, data_dir):
+                import_csv(db, hall, data_dir)
+        except sqlite3.OperationalError:
+            pass  # read-only database: answer from what it holds
+    return db
+
+
+def resolve(db, mac):
+    # -> [("pillar" | "slave", row)]; a partial MAC matches by suffix
+    key = norm_mac(mac)
+    if not key:
+        return []
+    if len(key) >= 12:
+        row = db.execute(PILLAR_ROW + "WHERE p.mac = ?", (key,)).fetchone()
+        if row:
+            return [("pillar", row)]
+        row = db.execute("SELECT * FROM slaves WHERE mac = ?", (key,)).fetchone()
+        return [("slave", row)] if row else []
+    span = suffix_range(key)
+    pillars = db.execute(PILLAR_ROW + "WHERE p.rmac >= ? AND p.rmac < ? ORDER BY p.rowid", span).fetchall()
+    slaves = db.execute("SELECT * FROM slaves WHERE rmac >= ? AND rmac < ? ORDER BY rowid", span).fetchall()
+    return [("pillar", r) for r in pillars] + [("slave", r) for r in slaves]
+
+
+def lookup(mac, db=None):
+    db = db or get_db()
+    results = []
+    for kind, row in resolve(db, mac):
+        if kind == "slave":
+            results.append(f"Found SID: {row['sid']} for MAC: {row['label']}")
+            continue
+        result = f"Found PID: {row['pid']} for MAC: {row['label'] or row['mac']}"
+        if row["sid"]:
+            hall = f" [{row['hall']}]" if row["hall"] != DEFAULT_HALL else ""
+            result += f"\nDeployment: Booth {row['bid'] or '-'}, Slave {row['sid']}, Group {row['gid'] or '-'} ({row['color']}){hall}"
+        results.append(result)
+    if results:
+        return "\n".join(results)
+    return f"MAC address {mac} not found in factory mappings."
+
+
+# --- Batch lookup ---
+# One MAC per line, raw ZSCAN replies ("ZSCAN,['02db', ...]") or the master's
+# status lines ({"sid": 3, "msg": "ZSCAN,..."}). A short ID that matches
+# several pillars is narrowed to the ones deployed on the scanning slave.
+BATCH_FIELDS = ["input", "mac", "kind", "pid", "sid", "bid", "gid", "color", "scan_sid", "matches"]
+MAC_TOKEN = re.compile(r"\b[0-9A-Fa-f]{2}(?:[:-]?[0-9A-Fa-f]{2}){1,5}\b")
+
+
+def sid_num(sid):
+    return str(sid).upper().lstrip("S") if sid not in (None, "") else ""
 
-        row["color"] = gids.get(row["gid"].upper(), "unknown")
-        pillars.append(row)
 
-    return pillars
+def scan_tokens(line):
+    # -> (scanning SID or None, MAC/suffix tokens in the line)
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None, []
+    sid = None
+    if line.startswith("{"):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = {}
+        if isinstance(data, dict):
+            sid = data.get("sid")
+            line = str(data.get("msg", ""))
+    return sid, MAC_TOKEN.findall(line)
+
+
+def narrow(found, scan_sid):
+    if scan_sid is None or len(found) < 2:
+        return found
+    mine = [(kind, row) for kind, row in found if kind == "pillar" and sid_num(row["sid"]) == sid_num(scan_sid)]
+    return mine or found
+
+
+def batch_records(db, token, scan_sid=None):
+    found = narrow(resolve(db, token), scan_sid)
+    base = {"input": token, "scan_sid": sid_num(scan_sid), "matches": len(found)}
+    if not found:
+        yield dict(base, kind="none")
+    for kind, row in found:
+        if kind == "slave":
+            yield dict(base, mac=row["mac"], kind="slave", sid=row["sid"])
+        elif row["sid"]:
+            deploy = {k: row[k] for k in ("sid", "bid", "gid", "color")}
+            yield dict(base, mac=row["mac"], kind="pillar", pid=row["pid"], **deploy)
+        else:
+            yield dict(base, mac=row["mac"], kind="pillar", pid=row["pid"])
+
+
+def batch(lines, out, fmt="csv", db=None):
+    # Streams one record per match as the input is read; returns (tokens, resolved)
+    db = db or get_db()
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=BATCH_FIELDS, restval="")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda rec: out.write(json.dumps(rec) + "\n")
+    tokens = resolved = 0
+    for line in lines:
+        scan_sid, found = scan_tokens(line)
+        for token in found:
+            tokens += 1
+            for rec in batch_records(db, token, scan_sid):
+                write(rec)
+            resolved += rec["kind"] != "none"
+    return tokens, resolved
+
+
+def scan(db, lines, hall=DEFAULT_HALL, assign=False):
+    # Field scans update the store in place: every pillar a slave reports is
+    # marked seen by it, and with assign an undeployed one joins that slave.
+    # Ambiguous suffixes are skipped. -> (seen, assigned, skipped)
+    hid = hall_id(db, hall)
+    now = int(time.time())
+    seen = assigned = skipped = 0
+    with db:
+        for line in lines:
+            scan_sid, found = scan_tokens(line)
+            sid = f"S{sid_num(scan_sid)}" if scan_sid is not None else None
+            for token in found:
+                rows = [row for kind, row in narrow(resolve(db, token), scan_sid) if kind == "pillar"]
+                if len(rows) != 1:
+                    skipped += 1
+                    continue
+                db.execute("UPDATE pillars SET seen_at = ?, seen_by = ? WHERE mac = ?", (now, sid, rows[0]["mac"]))
+                seen += 1
+                if assign and sid and not rows[0]["sid"]:
+                    db.execute("UPDATE pillars SET hid = ?, sid = ? WHERE mac = ?", (hid, sid, rows[0]["mac"]))
+                    assigned += 1
+    return seen, assigned, skipped
+
+
+def generate_pillars(db=None, hall=DEFAULT_HALL, sid=None):
+    # The hall's deployment in plan order, shaped like test_pids.csv plus color
+    db = db or get_db(hall=hall)
+    sql = PILLAR_ROW + "WHERE p.hid = (SELECT hid FROM halls WHERE name = ?) AND p.sid IS NOT NULL"
+    params = [hall]
+    if sid:
+        sql += " AND p.sid = ?"
+        params.append(sid.upper())
+    return [
+        {"gid": r["gid"] or "", "sid": r["sid"], "bid": r["bid"] or "", "pmac": r["mac"], "pid": r["dpid"], "color": r["color"]}
+        for r in db.execute(sql + " ORDER BY p.pos IS NULL, p.pos, p.mac", params)
+    ]
+
+
+def generate_members(pillars):
+    """Build the master's group/booth membership table from the pillar list.
+
+    pids maps each PID to [sid, pmac suffix, pmac]; the 4-char suffix is what
+    the slaves key their p4dict on, so the master can send compact batch
+    frames. The full MAC is for a fallback slave, which has no p4dict entry.
+    """
+    members = {"groups": {}, "booths": {}, "pids": {}}
+    for p in pillars:
+        pid = p["pid"].upper()
+        sid = int(p["sid"].upper().lstrip("S"))
+        pmac = p["pmac"].replace(":", "").lower()
+        members["pids"][pid] = [sid, pmac[-4:], pmac]
+        if p["gid"]:
+            members["groups"].setdefault(p["gid"].upper(), []).append(pid)
+        if p["bid"]:
+            members["booths"].setdefault(p["bid"].upper(), []).append(pid)
+    return members
 
 
 def main():
     parser = argparse.ArgumentParser(description="NNARA Provisioning Utility")
-    parser.add_argument("--lookup", help="Lookup PID/SID by MAC address")
+    parser.add_argument("--lookup", help="Lookup PID/SID by MAC address (or its last 4/6/8 hex digits)")
+    parser.add_argument(
+        "--batch",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="resolve every MAC or ZSCAN line in FILE (default stdin)",
+    )
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="--batch output format")
+    parser.add_argument("--out", help="--batch output file (default stdout)")
+    parser.add_argument("--db", help=f"provisioning database (default {os.path.relpath(DB_FILE)})")
+    parser.add_argument("--hall", default=DEFAULT_HALL, help="hall to import into or generate for")
+    parser.add_argument("--data", help="directory with the hall's CSVs (default: where it was imported from)")
+    parser.add_argument(
+        "--import",
+        dest="do_import",
+        action="store_true",
+        help="import the CSVs into the database even if they look unchanged",
+    )
+    parser.add_argument(
+        "--scan",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="record the pillars seen in ZSCAN lines from FILE (default stdin)",
+    )
+    parser.add_argument("--assign", action="store_true", help="--scan: deploy unassigned pillars on the scanning slave")
     parser.add_argument(
         "--verify",
         action="store_true",
@@ -89,45 +441,59 @@ def main():
         action="store_true",
         help="write pmacs_sid.csv",
     )
+    parser.add_argument(
+        "--members",
+        action="store_true",
+        help="write members.json (group/booth fan-out table for the master)",
+    )
     args = parser.parse_args()
 
-    if args.lookup:
-        print(lookup(args.lookup))
+    if args.do_import:
+        counts = import_csv(get_db(args.db, args.hall, False), args.hall, args.data or DATA_DIR)
+        print(
+            f"Imported hall {args.hall}: {counts['deployed']} of {counts['pillars']} pillars deployed, "
+            f"{counts['slaves']} slaves, {counts['unmatched']} test rows unmatched."
+        )
+    db = get_db(args.db, args.hall, args.data)
+    if args.scan:
+        src = sys.stdin if args.scan == "-" else open(args.scan, encoding="utf-8")
+        with src:
+            seen, assigned, skipped = scan(db, src, args.hall, args.assign)
+        print(f"Seen {seen} pillars, assigned {assigned}, skipped {skipped} unknown or ambiguous.")
+    elif args.batch:
+        src = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+        dst = open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout
+        with src, dst:
+            tokens, resolved = batch(src, dst, args.format, db)
+        print(f"Resolved {resolved} of {tokens} MACs.", file=sys.stderr)
+    elif args.lookup:
+        print(lookup(args.lookup, db))
     elif args.verify:
         s = {}
-        pillars = generate_pillars()
+        pillars = generate_pillars(db, args.hall)
         print(f"Verified {type(pillars)} with {len(pillars)} records.")
         # print(pillars)
-        for p in [p for p in pillars if p["sid"] == "S1"]:
+        for p in generate_pillars(db, args.hall, "S1"):
             print(p["pid"], p["pmac"])
             s[p["pid"]] = p["pmac"]
         print(s)
 
     elif args.write:
-        pillars = generate_pillars()
-        for sid in set(row["sid"] for row in pillars):
-            s = {}
-            for p in [p for p in pillars if p["sid"] == sid]:
-                # print(p["pid"], p["pmac"])
-                s[p["pid"]] = p["pmac"]
+        # One pass over the deployment, split by slave
+        by_sid = {}
+        for p in generate_pillars(db, args.hall):
+            by_sid.setdefault(p["sid"], {})[p["pid"]] = p["pmac"]
+        for sid, s in sorted(by_sid.items()):
             json.dump(s, open(f"pids_{sid[1:]}.json", "w"))
             print(s)
-
-            # csvfile = f"pmacs_{sid}.csv"
-            # with open(csvfile, "w", newline="") as csvfile:
-            #     fieldnames = ["pid", "pmac", "bid"]
-            #     writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            #     writer.writeheader()
-            #     for p in [p for p in pillars if p["sid"] == sid]:
-            #         writer.writerow(
-            #             {
-            #                 "pid": p["pid"],
-            #                 "pmac": p["pmac"],
-            #                 "bid": p["bid"],
-            #             }
-            #         )
-            # print(f"Wrote {csvfile}.")
-    else:
+    elif args.members:
+        members = generate_members(generate_pillars(db, args.hall))
+        json.dump(members, open("members.json", "w"))
+        print(
+            f"Wrote members.json: {len(members['pids'])} pillars, "
+            f"{len(members['groups'])} groups, {len(members['booths'])} booths."
+        )
+    elif not args.do_import:
         parser.print_help()
 
 
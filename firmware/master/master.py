@@ -1,16 +1,29 @@
 import network
-import espnow
+import asyncio
+import aioespnow
 from umqtt.simple import MQTTClient
+import io
+import os
 import json
 import time
 import binascii
+import struct
 import machine
 import esp32
 import nara_cmd
+import nara_proto
 
 # --- Configuration & State ---
 CONFIG_FILE = "nmaster.json"
 SID_FILE = "msids.json"
+FX_BASES = "fxbases.json"  # cached fxb_<crc>.bin files, oldest first
+MEMBER_FILE = "members.json"
+HELD_FILE = "held.jsonl"  # publishes spilled to flash during a broker outage
+TRACE_FILE = "trace.bin"  # session recording, see TRACE below
+TRACE_OLD = "trace.1.bin"  # the previous file after a rotation
+FANOUT_TARGETS = ("GROUP", "BOOTH", "SUBSET")
+# Reference clock for execute-at: Unix ms (MicroPython's epoch is 2000-01-01)
+EPOCH_MS = 946684800000 if time.gmtime(0)[0] == 2000 else 0
 
 config = {
     "mid": "MA",
@@ -20,19 +33,232 @@ config = {
     "password": "nano1234",
     "mqtt_broker": "localhost",
     "mqtt_topic_stat": "nara/master/status",
+    "mqtt_topic_result": "nara/master/result",
+    "mqtt_topic_fleet": "nara/master/fleet",  # retained snapshot, deltas on .../delta
+    "mqtt_topic_live": "nara/master/live",  # slave alive/suspect/dead transitions
+    "cmd_timeout": 5000,  # ms, plus pillar_timeout per pillar of the longest sweep
+    "pillar_timeout": 3500,
+    "pillar_typ": 1000,  # ms per pillar of a typical sweep, for the ones queued ahead
+    "fx_window": 12,  # file-transfer chunks in flight per session
+    "fx_rto": 400,  # ms before an unacked chunk is resent
+    "fx_stall": 15000,  # ms without progress before a transfer is dropped
+    "fx_gap": 20,  # ms between broadcast bursts of fx_window chunks
+    "fx_rounds": 10,  # multicast repair rounds before giving up
+    "fx_retries": 5,  # multicast START/POLL/END attempts per slave
+    "fx_bases": 4,  # previously pushed files kept as delta bases
+    "max_peers": 16,  # ESP-NOW peer table slots we use (driver limit is 20)
+    "txq": 64,  # queued ESP-NOW sends
+    "pubq": 64,  # queued MQTT publishes
+    "pub_batch_ms": 50,  # slave status lines are sent as one JSON array per window
+    "pub_batch_n": 20,  # ... or as soon as this many are waiting
+    "mqtt_poll": 2,  # ms between non-blocking MQTT socket checks
+    "mqtt_timeout": 500,  # ms a broker connect or socket write may block the loop
+    "held_ram": 200,  # publishes held in RAM while the broker is unreachable
+    "held_flash": 65536,  # bytes of older held publishes spilled to flash
+    "mqtt_backoff": 60,  # s, reconnect delay cap (doubles from 1 s)
+    "fleet_stale": 90,  # s before STAT/NARA queries go to the slave again
+    "live_suspect": 6000,  # ms without any frame (slaves beacon every 2 s)
+    "live_dead": 12000,
+    "fallback": {},  # SID: SID whose BLE range covers the same pillars
+    "rate_slave": 1.0,  # commands/s per slave, burst less its reported backlog
+    "burst_slave": 4,
+    "rate_global": 20.0,  # frames/s across the radio
+    "burst_global": 40,
+    "rate_mode": "coalesce",  # over the limit: "coalesce" (latest waits) or "reject"
+    "lt_idle": 1000,  # ms without link-test replies before a run is reported
+    "trace": 0,  # record commands, results and ESP-NOW frames to TRACE_FILE
+    "trace_max": 262144,  # bytes per trace file before it rotates
 }
 
 sids = {}  # MAC: SID
+members = {"groups": {}, "booths": {}, "pids": {}}  # see provision.py --members
+pillar_counts = {}  # SID: pillars per slave, from members
+pending = {}  # tag: in-flight command record
+fleet = {}  # SID: live slave state, see fleet_note()
+fleet_dirty = {}  # SID: fields changed since the last delta
+live_tick = 0
+buckets = {}  # SID: Bucket
+deferred = {}  # SID or "*": (sends, tag, tick) waiting for a token
+rate_stats = [0, 0]  # rejected, coalesced
+cues = {}  # cue (ARM tag): {sid: "armed/staged"} from ARM replies
+last_cue = None
+cmd_seq = 0
+frag_id = 0
+rx = nara_proto.Reassembler()  # slave replies larger than one frame
+xfers = {}  # session: file-transfer record
+fx_seq = 0
+lt = None  # running LINKTEST, see handle_linktest()
+lt_run = 0
+trace = None  # [start tick, unwritten records, bytes in TRACE_FILE, last flush tick]
 bcast = b"\xff" * 6
+mqtt_ok = False
 
 # --- Hardware ---
 wdt = machine.WDT(timeout=300000)
 led = machine.Pin(5, machine.Pin.OUT)
 
 
+# --- Task Queues ---
+class Queue:
+    # Bounded FIFO between tasks (MicroPython asyncio has none).
+    # put() never blocks: when full the oldest item is dropped and counted.
+    def __init__(self, size):
+        self.size = size
+        self.items = []
+        self.dropped = 0
+        self.ev = asyncio.Event()
+
+    def put(self, item):
+        if len(self.items) >= self.size:
+            self.items.pop(0)
+            self.dropped += 1
+        self.items.append(item)
+        self.ev.set()
+
+    async def get(self):
+        while not self.items:
+            self.ev.clear()
+            await self.ev.wait()
+        return self.items.pop(0)
+
+
+class Held:
+    # Store-and-forward for publishes made while the broker is unreachable:
+    # a RAM ring whose oldest entries spill to flash, replayed oldest first.
+    # The replay position is kept next to the file, so a reset mid-replay
+    # resumes after the last line handed to the broker instead of line 0.
+    def __init__(self, size, path, cap):
+        self.ring = []  # [topic, payload, Unix ms]
+        self.size = size
+        self.path = path
+        self.pos_path = path + ".pos"
+        self.cap = cap
+        self.spilled = 0  # bytes in path
+        self.sent = 0  # bytes of path already replayed
+        self.dropped = 0
+        self.busy = False
+        try:
+            self.spilled = os.stat(path)[6]  # left over from before a reboot
+            with open(self.pos_path) as f:
+                self.sent = int(f.read())
+        except:
+            pass
+
+    def __len__(self):
+        return len(self.ring) + (1 if self.spilled else 0)
+
+    def hold(self, topic, payload):
+        self.ring.append([topic, payload, master_ms()])
+        if len(self.ring) <= self.size:
+            return
+        if self.busy:
+            # The flash file is being replayed: nothing may be appended to it
+            self.ring.pop(0)
+            self.dropped += 1
+            return
+        line = json.dumps(self.ring.pop(0)) + "\n"
+        if self.spilled + len(line) > self.cap:
+            self.dropped += 1
+            return
+        try:
+            with open(self.path, "a") as f:
+                f.write(line)
+            self.spilled += len(line)
+        except:
+            self.dropped += 1
+
+    async def replay(self, send):
+        # send(topic, payload) -> False when the broker went away again
+        if self.busy:
+            return
+        self.busy = True
+        try:
+            await self.drain(send)
+        finally:
+            self.busy = False
+
+    def mark(self, pos):
+        self.sent = pos
+        try:
+            with open(self.pos_path, "w") as f:
+                f.write(str(pos))
+        except:
+            pass
+
+    async def drain(self, send):
+        if self.spilled:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self.sent)
+                    pos = self.sent
+                    while True:
+                        line = f.readline()
+                        if not line:
+                            break
+                        try:
+                            entry = json.loads(line.decode())
+                        except ValueError:
+                            entry = None  # cut short by a reset mid-write
+                        if entry and not send(*held_payload(entry)):
+                            return
+                        pos += len(line)
+                        self.mark(pos)
+                        await asyncio.sleep(0)
+                os.remove(self.path)
+            except OSError:
+                pass
+            try:
+                os.remove(self.pos_path)
+            except OSError:
+                pass
+            self.spilled = self.sent = 0
+        while self.ring:
+            if not send(*held_payload(self.ring[0])):
+                return
+            self.ring.pop(0)
+            await asyncio.sleep(0)
+
+
+def held_payload(entry):
+    # Replayed JSON objects carry the time they were first published
+    topic, payload, t = entry
+    if payload.startswith("{"):
+        payload = f'{payload[:-1]}, "held": {t}}}'
+    return topic, payload
+
+
+class Bucket:
+    # Token bucket: rate tokens/s, holding at most cap (burst unless narrowed)
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.t = time.ticks_ms()
+
+    def take(self, cap=None):
+        now = time.ticks_ms()
+        cap = self.burst if cap is None else cap
+        self.tokens = min(cap, self.tokens + time.ticks_diff(now, self.t) * self.rate / 1000)
+        self.t = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+gbucket = None
+txq = None  # (mac, frame, sync) for send_task
+pubq = None  # (topic, payload, batch, hold, retain) for publish_task
+held = None
+
+
 # --- Helpers ---
+def master_ms():
+    return time.time_ns() // 1000000 + EPOCH_MS
+
+
 def load_config():
-    global config, sids
+    global config, sids, members
     try:
         with open(CONFIG_FILE, "r") as f:
             config.update(json.load(f))
@@ -48,6 +274,14 @@ def load_config():
                 sids.update(data)
     except:
         pass
+    try:
+        with open(MEMBER_FILE, "r") as f:
+            members.update(json.load(f))
+    except:
+        pass
+    for entry in members["pids"].values():
+        sid = str(entry[0])
+        pillar_counts[sid] = pillar_counts.get(sid, 0) + 1
 
 
 def save_state():
@@ -67,6 +301,1095 @@ def get_mac_by_sid(target_sid):
     return None
 
 
+def esend(mac, msg, sync=True):
+    # Queue for send_task, fragmenting anything above the payload limit
+    global frag_id
+    data = msg.encode() if isinstance(msg, str) else msg
+    frames = nara_proto.fragment(data, frag_id)
+    if len(frames) > 1:
+        frag_id = (frag_id + 1) & 0xFF
+    for frame in frames:
+        txq.put((mac, frame, sync))
+
+
+def publish(topic, payload, batch=False, hold=True, retain=False):
+    # Queued for publish_task so a slow broker never stalls the radio side.
+    # batch: may be merged with others for the topic into one JSON array.
+    # hold: kept for replay if the broker is unreachable.
+    pubq.put((topic, payload, batch, hold, retain))
+    if trace and topic == config["mqtt_topic_result"]:
+        trace_rec(TR_RESULT, b"", payload.encode())
+
+
+# --- Fan-out Planner ---
+def resolve_pids(target, tid):
+    # Group/Booth ids come from members.json, Subset/PID carry the PIDs themselves
+    if target == "GROUP":
+        return members["groups"].get(str(tid).upper(), [])
+    if target == "BOOTH":
+        return members["booths"].get(str(tid).upper(), [])
+    if isinstance(tid, str):
+        tid = tid.replace(" ", "").split(",")
+    return [str(p).upper() for p in tid]
+
+
+def plan_fanout(pids):
+    # ({sid: [pmac suffix, ...]} - one member subset per affected slave, [unknown PIDs])
+    plan, unknown = {}, []
+    for pid in pids:
+        entry = members["pids"].get(pid)
+        if entry:
+            plan.setdefault(str(entry[0]), []).append(entry[1])
+        else:
+            unknown.append(pid)
+            if config["debug"]:
+                print(f"Unknown PID: {pid}")
+    return plan, unknown
+
+
+def known_sid(sid):
+    return str(sid) in [str(s) for s in sids.values()]
+
+
+def fallback_macs(sid, suffixes):
+    # Full MACs of a dead slave's pillars; members.json without them
+    # (pre-fallback) leaves the pillars unroutable
+    want = set(suffixes)
+    return [e[2] for e in members["pids"].values() if str(e[0]) == sid and e[1] in want and len(e) > 2]
+
+
+def batch_frames(sid, cmd, suffixes, tag, at=0, kind="SUB"):
+    # SUB|sid|cmd|s1,s2,...|tag[|at] split so each frame fits the ESP-NOW payload.
+    # SUBM carries full MACs instead, for pillars the slave has no p4dict entry for.
+    head = f"{kind}|{sid}|{cmd}|"
+    tail = f"|{tag}|{at}" if at else f"|{tag}"
+    frames, body = [], ""
+    for s in suffixes:
+        if body and len(head) + len(body) + 1 + len(s) + len(tail) > nara_proto.MAX_FRAME:
+            frames.append(head + body + tail)
+            body = ""
+        body = f"{body},{s}" if body else s
+    if body:
+        frames.append(head + body + tail)
+    return frames
+
+
+def send_fanout(cmd, plan, tag, at=0):
+    # Fire every slave's batch back-to-back without waiting for per-peer acks.
+    # Dead slaves' pillars go to their fallback slave, if that one is alive,
+    # as full MACs: the suffixes only mean something to their own slave.
+    # Returns ({sid: frames owed} for the completion tracker,
+    #          {"dead"|"rate": {sid: suffixes}} for pillars that will not be lit).
+    expect, failed, routes = {}, {}, {}
+    for sid, suffixes in plan.items():
+        dst = live_route(sid)
+        if dst is not None and dst != sid:
+            macs = fallback_macs(sid, suffixes)
+            if len(macs) < len(suffixes):
+                dst = None
+        if dst is None:
+            failed.setdefault("dead", {})[sid] = suffixes
+            continue
+        routes.setdefault(dst, {})[sid] = suffixes if dst == sid else macs
+    # One batch (and one gate call) per slave, even when it also covers for
+    # dead ones: a second call would replace the first one's deferred frames
+    for dst, by_sid in routes.items():
+        mac = get_mac_by_sid(dst)
+        if mac is None:
+            if config["debug"]:
+                print(f"No route to slave {dst}")
+            continue
+        frames = []
+        for sid, ids in by_sid.items():
+            frames += batch_frames(dst, cmd, ids, tag, at, "SUB" if sid == dst else "SUBM")
+        if not gate(dst, [(mac, frame, False) for frame in frames], tag):
+            failed.setdefault("rate", {}).update({sid: [x[-4:] for x in ids] for sid, ids in by_sid.items()})
+            continue
+        if config["debug"]:
+            for frame in frames:
+                print(f"FWD -> {dst}: {frame}")
+        expect[dst] = len(frames)
+    return expect, failed
+
+
+# --- Admission Control ---
+# Per-slave buckets keep a slave from being handed sweeps faster than it runs them
+# (narrowed by the backlog it reports), the global one protects the radio.
+def admit(key):
+    b = None
+    if key != "*":
+        b = buckets.get(key)
+        if b is None:
+            b = buckets[key] = Bucket(config["rate_slave"], config["burst_slave"])
+        q = fleet.get(key, {}).get("q", 0)
+        if not b.take(max(1, config["burst_slave"] - q)):
+            return False
+    if gbucket.take():
+        return True
+    if b:
+        b.tokens += 1  # refund: the global limit refused it
+    return False
+
+
+def gate(key, sends, tag):
+    # sends: [(mac, frame, sync)] for one slave (or "*" for a broadcast).
+    # False when rejected; a coalesced command replaces the one key had waiting.
+    if key not in deferred and admit(key):
+        for mac, frame, sync in sends:
+            esend(mac, frame, sync)
+        return True
+    if config["rate_mode"] != "coalesce":
+        rate_stats[0] += 1
+        return False
+    old = deferred.get(key)
+    if old:
+        rate_stats[1] += 1
+        rec = pending.get(old[1])
+        if rec:
+            for sid in list(rec["expect"]) if key == "*" else [key]:
+                if rec["expect"].pop(sid, None) is not None:
+                    rec.setdefault("coalesced", []).append(sid)
+    deferred[key] = (sends, tag, time.ticks_ms())
+    return True
+
+
+def rate_release():
+    for key in list(deferred):
+        if not admit(key):
+            continue
+        sends, tag, t = deferred.pop(key)
+        for mac, frame, sync in sends:
+            esend(mac, frame, sync)
+        rec = pending.get(tag)
+        if rec:
+            # The completion deadline does not count time spent waiting here
+            rec["deadline"] = time.ticks_add(rec["deadline"], time.ticks_diff(time.ticks_ms(), t))
+
+
+# --- Command Tracking ---
+def next_tag():
+    global cmd_seq
+    cmd_seq = (cmd_seq + 1) % 10000
+    return str(cmd_seq)
+
+
+def expected_sids(target, tid, dst):
+    if dst != "broadcast":
+        sid = sids.get(dst.replace(":", "").replace("-", "").lower())
+        return [str(sid)] if sid is not None else []
+    if target == "GLOBAL" or tid == "all":
+        return [str(s) for s in sids.values()]
+    return [str(tid)]
+
+
+def backlog(sid):
+    # Commands a slave runs before one sent now: what it last reported queued,
+    # or what we still wait on from it if that is more (reports lag by a beacon)
+    ahead = sum(1 for rec in pending.values() if sid in rec["expect"])
+    return max(ahead, fleet.get(sid, {}).get("q", 0))
+
+
+def track(tag, cmd, target, tid, expect, at=0, failed=None):
+    # expect: {sid: RESP frames still owed}. The deadline covers the longest sweep,
+    # including the sweeps queued ahead of it, plus the wait for a scheduled execute-at.
+    # failed: {"dead"|"rate"|"unknown": ...} left out of the send. It rides on the
+    # completion record, so a tag gets one result; only with nothing sent at all
+    # does it go out at once as an error.
+    if not expect:
+        if failed:
+            report_error(tag, cmd, target, tid, failed)
+        return
+    timeout = config["cmd_timeout"] + max(
+        pillar_counts.get(sid, 1) * (config["pillar_timeout"] + config["pillar_typ"] * backlog(sid)) for sid in expect
+    )
+    if at:
+        timeout += max(0, at - master_ms())
+    pending[tag] = {
+        "cmd": cmd,
+        "target": target,
+        "id": tid,
+        "t0": time.ticks_ms(),
+        "deadline": time.ticks_add(time.ticks_ms(), timeout),
+        "expect": expect,
+        "ok": [],
+        "ng": {},
+        "lat": {},
+    }
+    if failed:
+        pending[tag].update(failed)
+
+
+def on_resp(parts):
+    # RESP,sid,cmd,OK|NG,tag[,failed;suffixes[,armed|reason]] -> True when absorbed by a tracker
+    rec = pending.get(parts[4]) if len(parts) > 4 else None
+    sid = parts[1]
+    if rec is None or sid not in rec["expect"]:
+        return False
+    if parts[3] != "OK":
+        failed = rec["ng"].setdefault(sid, [])
+        if len(parts) > 5 and parts[5]:
+            failed.extend(parts[5].split(";"))
+    if len(parts) > 6 and parts[2] == "ARM":
+        # ARM replies also carry armed/staged pillar counts
+        rec.setdefault("armed", {})[sid] = parts[6]
+        cues.setdefault(parts[4], {})[sid] = parts[6]
+    elif len(parts) > 6:
+        # NG reason, e.g. unsynced: an execute-at the slave could not place
+        rec.setdefault("reason", {})[sid] = parts[6]
+    rec["expect"][sid] -= 1
+    if rec["expect"][sid] <= 0:
+        del rec["expect"][sid]
+        rec["lat"][sid] = time.ticks_diff(time.ticks_ms(), rec["t0"])
+        if sid not in rec["ng"]:
+            rec["ok"].append(sid)
+    return True
+
+
+def check_pending():
+    # Publish one completion record per command once all replied or it timed out
+    now = time.ticks_ms()
+    for tag, rec in list(pending.items()):
+        if rec["expect"] and time.ticks_diff(rec["deadline"], now) > 0:
+            continue
+        del pending[tag]
+        report = {
+            "mid": config["mid"],
+            "tag": tag,
+            "cmd": rec["cmd"],
+            "target": rec["target"],
+            "id": rec["id"],
+            "done": not rec["expect"],
+            "ok": sorted(rec["ok"]),
+            "ng": rec["ng"],
+            "missing": sorted(rec["expect"]),
+        }
+        lat = sorted(rec["lat"].values())
+        if lat:
+            report["lat"] = {"min": lat[0], "med": lat[len(lat) // 2], "max": lat[-1]}
+        if "armed" in rec:
+            report["armed"] = rec["armed"]
+        if "coalesced" in rec:
+            report["coalesced"] = sorted(rec["coalesced"])
+        if "reason" in rec:
+            report["reason"] = rec["reason"]
+        for error in ("dead", "rate", "unknown"):
+            if error in rec:
+                report[error] = rec[error]
+        publish(config["mqtt_topic_result"], json.dumps(report))
+
+
+# --- Fleet State ---
+# Heartbeats and replies keep a per-slave table so dashboard STAT/NARA polls are
+# answered here; fields older than fleet_stale s are asked for by radio.
+FLEET_QUERIES = ("STAT", "NARA")
+
+
+def fleet_note(sid, msg_str):
+    # status,<sid>,<bat>V[,q[,uptime s]] | STAT,<sid>,<bat>V[,q] | NARA,OK,S:..,B:..,V:..
+    # | RESP,... | HB,<q>. seen is any frame; bat_t/ver_t date the cached
+    # fields themselves, which is what fleet_query ages
+    parts = msg_str.split(",")
+    rec = fleet.setdefault(sid, {})
+    now = rec["seen"] = master_ms()
+    f = {}
+    try:
+        if parts[0] == "HB" and len(parts) > 1:
+            f["q"] = int(parts[1])
+        elif parts[0] in ("status", "STAT") and len(parts) > 2:
+            f["bat"] = float(parts[2].rstrip("V"))
+            rec["bat_t"] = now
+            if len(parts) > 3:
+                f["q"] = int(parts[3])
+            if len(parts) > 4:
+                up = int(parts[4])
+                if up < rec.get("up", 0):
+                    fleet_forget(sid)
+                rec["up"] = up
+        elif parts[0] == "NARA" and len(parts) > 2:
+            kv = dict(p.split(":", 1) for p in parts[2:] if ":" in p)
+            if "B" in kv:
+                f["bat"] = float(kv["B"])
+                rec["bat_t"] = now
+            if "V" in kv:
+                f["ver"] = kv["V"]
+                rec["ver_t"] = now
+            if "R" in kv:
+                f["rtt"] = int(kv["R"])
+            if "D" in kv:
+                f["drift"] = float(kv["D"])
+        elif parts[0] == "RESP" and len(parts) > 3:
+            f["last"] = [parts[2], parts[3]]
+    except ValueError:
+        pass
+    for k, v in f.items():
+        if rec.get(k) != v:
+            rec[k] = v
+            fleet_dirty.setdefault(sid, {})[k] = v
+
+
+def fleet_forget(sid):
+    # After a reset or a pushed .py the running version is unknown until the
+    # next NARA reply
+    rec = fleet.get(sid)
+    if rec:
+        rec.pop("ver_t", None)
+        if rec.pop("ver", None) is not None:
+            fleet_dirty.setdefault(sid, {})["ver"] = None
+
+
+def live_state(sid):
+    # Slaves not heard from since boot count as alive until their first timeout
+    rec = fleet.get(str(sid))
+    return rec.get("state", "alive") if rec else "alive"
+
+
+def live_route(sid):
+    # The slave itself, its live fallback, or None when the command would be lost
+    sid = str(sid)
+    if live_state(sid) != "dead":
+        return sid
+    alt = config["fallback"].get(sid)
+    if alt is not None and live_state(alt) != "dead":
+        return str(alt)
+    return None
+
+
+def live_check():
+    # alive -> suspect -> dead as frames stop coming; any frame revives
+    global live_tick
+    if time.ticks_diff(time.ticks_ms(), live_tick) < 250:
+        return
+    live_tick = time.ticks_ms()
+    now = master_ms()
+    for sid, rec in fleet.items():
+        age = now - rec["seen"]
+        state = "alive"
+        if age > config["live_dead"]:
+            state = "dead"
+        elif age > config["live_suspect"]:
+            state = "suspect"
+        prev = rec.get("state", "alive")
+        if state != prev:
+            rec["state"] = state
+            fleet_dirty.setdefault(sid, {})["state"] = state
+            publish(
+                config["mqtt_topic_live"],
+                json.dumps({"mid": config["mid"], "sid": sid, "state": state, "prev": prev, "age": age}),
+            )
+
+
+def report_error(tag, cmd, target, tid, failed):
+    # Fail fast instead of waiting out the completion deadline.
+    # failed: {error: detail}, error: "dead" (slave down), "rate" (rejected by
+    # admission control), "unknown" (ids not in members.json/msids.json) or
+    # "empty" (no members); "error" names the first
+    report = {
+        "mid": config["mid"],
+        "tag": tag,
+        "cmd": cmd,
+        "target": target,
+        "id": tid,
+        "done": False,
+        "error": next(iter(failed)),
+    }
+    report.update(failed)
+    publish(config["mqtt_topic_result"], json.dumps(report))
+
+
+def fleet_flush():
+    # Changed fields go out as one delta; the retained snapshot follows the heartbeat
+    global fleet_dirty
+    if fleet_dirty:
+        publish(config["mqtt_topic_fleet"] + "/delta", json.dumps(fleet_dirty))
+        fleet_dirty = {}
+
+
+def fleet_snapshot():
+    snap = {"mid": config["mid"], "t": master_ms(), "sids": fleet}
+    publish(config["mqtt_topic_fleet"], json.dumps(snap), hold=False, retain=True)
+
+
+def fleet_query(cmd, target, tid):
+    now = master_ms()
+    if target == "GLOBAL" or tid == "all":
+        want = [str(s) for s in sids.values()]
+    else:
+        want = [str(tid)[1:] if str(tid).upper().startswith("S") else str(tid)]
+    for sid in want:
+        rec = fleet.get(sid)
+        t = rec and rec.get("ver_t" if cmd == "NARA" else "bat_t")
+        if t and now - t < config["fleet_stale"] * 1000:
+            ans = {"sid": sid, "cached": True}
+            ans.update(rec)
+            publish(config["mqtt_topic_stat"], json.dumps(ans), True)
+            continue
+        mac = get_mac_by_sid(sid)
+        if mac is not None:
+            esend(mac, cmd)
+            if config["debug"]:
+                print(f"FWD -> {sid}: {cmd} (stale)")
+
+
+# --- Link Test ---
+# LINKTEST sid [echo|flood|up] [count] [size] [gap ms] measures the raw link,
+# sending straight to the radio (not through txq or the rate limiter):
+#   echo:  LT,E,run,seq,pad -> LT,R,run,seq,pad                   RTT per frame
+#   flood: LT,F,run,seq,n,pad back to back, LT,Q,run -> LT,S,run,recv,reorder,dup,ms,drops
+#   up:    LT,U,run,n,size,gap -> LT,D,run,seq,n,pad from the slave, then LT,X,run,sent,fail
+# The report goes to mqtt_topic_result.
+def handle_linktest(args):
+    global lt, lt_run
+    if lt:
+        print("LINKTEST busy")
+        return
+    sid = str(args[0]).upper().lstrip("S") if args else ""
+    mac = get_mac_by_sid(sid)
+    if mac is None:
+        print(f"LINKTEST: unknown SID {sid}")
+        return
+    mode = str(args[1]).lower() if len(args) > 1 else "echo"
+    if mode not in ("echo", "flood", "up"):
+        print(f"LINKTEST: unknown mode {mode}")
+        return
+    lt_run = (lt_run + 1) % 1000
+    lt = {
+        "run": str(lt_run),
+        "sid": sid,
+        "mac": mac,
+        "mode": mode,
+        "count": max(1, int(args[2])) if len(args) > 2 else 100,
+        "size": min(max(int(args[3]), 16), nara_proto.MAX_FRAME) if len(args) > 3 else 32,
+        "gap": int(args[4]) if len(args) > 4 else (20 if mode == "echo" else 0),
+        "sent": 0,
+        "txfail": 0,
+        "recv": 0,
+        "max": -1,
+        "reorder": 0,
+        "dup": 0,
+        "rtt": [],
+        "stamp": {},  # seq: ticks_us sent, echo only
+        "first": None,  # ticks_ms of the first/last reply
+        "last": None,
+        "peer": None,  # LT,S / LT,X fields from the slave
+    }
+    lt["seen"] = nara_proto.bitmap(lt["count"])
+    asyncio.create_task(linktest(lt))
+
+
+def lt_rx(mac, msg_str):
+    t = lt
+    parts = msg_str.split(",", 4)  # the filler stays in one piece
+    if not t or len(parts) < 4 or parts[2] != t["run"] or bytes(mac) != t["mac"]:
+        return
+    now = time.ticks_ms()
+    kind = parts[1]
+    if kind in ("R", "D"):
+        seq = int(parts[3])
+        if seq >= t["count"]:
+            return
+        if kind == "R" and seq in t["stamp"]:
+            t["rtt"].append(time.ticks_diff(time.ticks_us(), t["stamp"].pop(seq)))
+        if nara_proto.bit_get(t["seen"], seq):
+            t["dup"] += 1
+            return
+        nara_proto.bit_set(t["seen"], seq)
+        t["recv"] += 1
+        if seq < t["max"]:
+            t["reorder"] += 1
+        t["max"] = max(t["max"], seq)
+        t["first"] = t["first"] if t["first"] is not None else now
+        t["last"] = now
+    elif kind in ("S", "X"):
+        t["peer"] = msg_str.split(",")[3:]
+        t["last"] = now
+
+
+async def lt_wait(t, done, idle):
+    # Until done(t), or idle ms pass without a reply
+    t0 = time.ticks_ms()
+    while not done(t):
+        ref = t["last"] if t["last"] is not None and time.ticks_diff(t["last"], t0) > 0 else t0
+        if time.ticks_diff(time.ticks_ms(), ref) > idle:
+            return
+        await asyncio.sleep(0.005)
+
+
+async def linktest(t):
+    global lt
+    run, mac, n, gap = t["run"], t["mac"], t["count"], t["gap"]
+    t0 = time.ticks_ms()
+    try:
+        if t["mode"] == "up":
+            for _ in range(3):
+                peers.send(mac, f"LT,U,{run},{n},{t['size']},{gap}", False)
+                await lt_wait(t, lambda t: t["recv"] or t["peer"], 300)
+                if t["recv"] or t["peer"]:
+                    break
+            await lt_wait(t, lambda t: t["peer"], config["lt_idle"])
+        else:
+            echo = t["mode"] == "echo"
+            for seq in range(n):
+                head = f"LT,E,{run},{seq}" if echo else f"LT,F,{run},{seq},{n}"
+                if echo:
+                    t["stamp"][seq] = time.ticks_us()
+                try:
+                    peers.send(mac, nara_proto.pad(head, t["size"]), False)
+                    t["sent"] += 1
+                except OSError:
+                    t["txfail"] += 1
+                if gap:
+                    await asyncio.sleep(gap / 1000)
+                elif seq % 8 == 7:
+                    await asyncio.sleep(0)  # let replies in between bursts
+            t["tx_ms"] = time.ticks_diff(time.ticks_ms(), t0)
+            if echo:
+                await lt_wait(t, lambda t: t["recv"] >= t["sent"], config["lt_idle"])
+            else:
+                for _ in range(3):
+                    peers.send(mac, f"LT,Q,{run}", False)
+                    await lt_wait(t, lambda t: t["peer"], 300)
+                    if t["peer"]:
+                        break
+        lt_report(t, time.ticks_diff(time.ticks_ms(), t0))
+    finally:
+        lt = None
+
+
+def lt_report(t, ms):
+    report = {
+        "mid": config["mid"],
+        "linktest": t["mode"],
+        "sid": t["sid"],
+        "count": t["count"],
+        "size": t["size"],
+        "gap": t["gap"],
+        "ms": ms,
+    }
+    peer = t["peer"] or []
+    if t["mode"] == "flood":
+        # Counted on the slave: what actually made it through its receive ring
+        sent = t["sent"]
+        recv, reorder, dup, span, drops = (int(x) for x in peer[:5]) if len(peer) >= 5 else (0, 0, 0, 0, 0)
+        report.update(tx_fps=round(sent * 1000 / max(1, t["tx_ms"]), 1), drops=drops)
+    else:
+        sent = t["sent"] if t["mode"] == "echo" else (int(peer[0]) if peer else t["count"])
+        recv, reorder, dup = t["recv"], t["reorder"], t["dup"]
+        span = time.ticks_diff(t["last"], t["first"]) if t["recv"] > 1 else 0
+    report.update(
+        sent=sent,
+        txfail=t["txfail"] if t["mode"] != "up" else (int(peer[1]) if len(peer) > 1 else 0),
+        recv=recv,
+        loss=round(1 - recv / sent, 4) if sent else 1.0,
+        reorder=reorder,
+        dup=dup,
+        fps=round((recv - 1) * 1000 / span, 1) if span else 0,
+    )
+    report["kbps"] = round(report["fps"] * t["size"] * 8 / 1000, 1)
+    if t["rtt"]:
+        v = sorted(t["rtt"])
+        report["rtt"] = {
+            p: round(v[min(len(v) - 1, int(q * len(v)))] / 1000, 2)
+            for p, q in (("min", 0), ("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1))
+        }
+    publish(config["mqtt_topic_result"], json.dumps(report))
+
+
+# --- Trace ---
+# TRACE [on|off|flush] records the session for sim/replay.py. Each file starts
+# with b"NTR1" and the Unix ms it was opened (u64). Then come records: kind
+# (u8), ms since the file opened (u32), body length (u16), body:
+#   M  topic length (u8), topic, payload   MQTT command taken
+#   R  payload                             published on mqtt_topic_result
+#   T  peer MAC, frame                     ESP-NOW frame to the driver
+#   F  peer MAC, frame                     ESP-NOW frame received
+# Records are buffered and appended in about 2 KB writes. At trace_max the
+# file moves to TRACE_OLD and a new one starts.
+TR_MQTT, TR_RESULT, TR_TX, TR_RX = b"MRTF"
+
+
+def trace_open():
+    global trace
+    try:
+        os.remove(TRACE_OLD)
+    except:
+        pass
+    try:
+        os.rename(TRACE_FILE, TRACE_OLD)
+    except:
+        pass
+    now = time.ticks_ms()
+    trace = [now, bytearray(struct.pack(">4sQ", b"NTR1", master_ms())), 0, now]
+
+
+def trace_rec(kind, head, body):
+    t = trace
+    body = body[: 0xFFFF - len(head)]
+    t[1] += struct.pack(">BIH", kind, time.ticks_diff(time.ticks_ms(), t[0]), len(head) + len(body))
+    t[1] += head
+    t[1] += body
+    if len(t[1]) >= 2048:
+        trace_flush()
+
+
+def trace_tx(mac, data):
+    # PeerTable tap: every frame handed to the driver, whatever queued it
+    if trace:
+        trace_rec(TR_TX, bytes(mac), data.encode() if isinstance(data, str) else data)
+
+
+def trace_flush():
+    t = trace
+    if not t:
+        return
+    t[3] = time.ticks_ms()
+    if not t[1]:
+        return
+    try:
+        with open(TRACE_FILE, "ab") as f:
+            f.write(t[1])
+        t[2] += len(t[1])
+    except:
+        pass  # flash full: this chunk is lost, the trace goes on
+    t[1] = bytearray()
+    if t[2] >= config["trace_max"]:
+        trace_open()
+
+
+def trace_tick():
+    # Nothing sits in RAM for more than a second
+    if trace and time.ticks_diff(time.ticks_ms(), trace[3]) > 1000:
+        trace_flush()
+
+
+def handle_trace(args):
+    global trace
+    mode = str(args[0]).lower() if args else ("off" if trace else "on")
+    if mode == "on":
+        trace_flush()
+        trace_open()
+    elif mode == "off":
+        trace_flush()
+        trace = None
+    elif mode == "flush":
+        trace_flush()
+        return
+    config["trace"] = 1 if trace else 0
+    save_state()
+    print(f"TRACE: {'on' if trace else 'off'}")
+
+
+# --- File Transfer ---
+# FX,HASH -> FX,START -> raw 0x1F chunks in a sliding window -> FX,ACK bitmaps -> FX,END -> FX,DONE
+# Multicast (FWCAST): chunks broadcast once, FX,POLL for bitmaps, repair rounds resend holes
+# Delta: when the CRC a slave reports for the file matches a cached fxb_<crc>.bin,
+# a compressed block delta is sent instead and the slave rebuilds the file.
+def fx_targets(arg):
+    if str(arg).lower() == "all":
+        return [str(s) for s in sids.values()]
+    return [t.strip().upper().lstrip("S") for t in str(arg).split(",")]
+
+
+def fx_sids(x):
+    return x["peers"].keys() if "peers" in x else (x["sid"],)
+
+
+def fx_busy(x):
+    # A slave runs one session at a time; later sessions queue behind it
+    mine = fx_sids(x)
+    for y in xfers.values():
+        if y is not x and not y["wait"] and any(sid in mine for sid in fx_sids(y)):
+            return True
+    return False
+
+
+def fx_new_sess():
+    global fx_seq
+    fx_seq = (fx_seq + 1) & 0xFF
+    while fx_seq in xfers:
+        fx_seq = (fx_seq + 1) & 0xFF
+    return fx_seq
+
+
+def fx_open(src):
+    # One pass for size and CRC32; chunks are read back from flash on demand
+    f = open(src, "rb")
+    size, crc = nara_proto.file_crc(f)
+    return f, size, crc
+
+
+def fx_set_payload(x, f, size, crc):
+    x["f"].close()
+    x["f"], x["size"], x["crc"] = f, size, crc
+    x["n"] = nara_proto.fx_chunks(size)
+    for p in x["peers"].values() if "peers" in x else (x,):
+        p["acked"] = nara_proto.bitmap(x["n"])
+
+
+def fx_plan(x, have):
+    # have: CRC the slave reports for the file. Returns False if nothing to send.
+    if have == f"{x['new_crc']:08x}":
+        return False
+    try:
+        with open(f"fxb_{have}.bin", "rb") as bf:
+            base = bf.read()
+    except OSError:
+        return True
+    x["f"].seek(0)
+    delta = nara_proto.delta_build(base, x["f"].read())
+    if len(delta) < x["size"]:
+        fx_set_payload(x, io.BytesIO(delta), len(delta), binascii.crc32(delta) & 0xFFFFFFFF)
+        x["delta"] = True
+    return True
+
+
+def fx_start_msg(x):
+    flags = ("M" if "peers" in x else "") + ("D" if x["delta"] else "")
+    msg = f"FX,START,{x['sess']},{x['size']},{x['crc']:08x},{x['name']}"
+    return f"{msg},{flags}" if flags else msg
+
+
+def fx_cache(x):
+    # Keep what the slaves now run as the base for the next delta
+    base = f"fxb_{x['new_crc']:08x}.bin"
+    try:
+        with open(FX_BASES, "r") as f:
+            bases = json.load(f)
+    except:
+        bases = []
+    if base in bases:
+        return
+    try:
+        with open(x["src"], "rb") as src, open(base, "wb") as dst:
+            while True:
+                buf = src.read(1024)
+                if not buf:
+                    break
+                dst.write(buf)
+    except OSError:
+        return
+    bases.append(base)
+    while len(bases) > config["fx_bases"]:
+        try:
+            os.remove(bases.pop(0))
+        except OSError:
+            pass
+    with open(FX_BASES, "w") as f:
+        json.dump(bases, f)
+
+
+def fx_send_chunk(x, seq, now):
+    x["f"].seek(seq * nara_proto.FX_CHUNK)
+    frame = nara_proto.fx_frame(x["sess"], seq, x["f"].read(nara_proto.FX_CHUNK))
+    if seq in x["inflight"]:
+        x["resent"] += 1
+    x["inflight"][seq] = now
+    try:
+        peers.send(x["mac"], frame, False)
+    except:
+        pass  # tx queue full: the RTO resends it
+
+
+def fx_finish(x, result):
+    del xfers[x["sess"]]
+    x["f"].close()
+    report = {
+        "mid": config["mid"],
+        "fx": x["name"],
+        "result": result,
+        "bytes": x["size"],
+        "chunks": x["n"],
+        "resent": x["resent"],
+        "delta": x["delta"],
+        "ms": time.ticks_diff(time.ticks_ms(), x["t0"]),
+    }
+    if "peers" in x:
+        results = {sid: p["result"] for sid, p in x["peers"].items()}
+        report["sids"] = results
+        report["rounds"] = x["round"]
+    else:
+        results = {x["sid"]: result}
+        report["sid"] = x["sid"]
+    publish(config["mqtt_topic_result"], json.dumps(report))
+    if "OK" in results.values():
+        fx_cache(x)
+        if x["name"].endswith(".py"):
+            for sid, r in results.items():
+                if r == "OK":
+                    fleet_forget(str(sid))
+    # Base mismatch on the slave: fall back to a full transfer
+    retry = [sid for sid, r in results.items() if r == "BASE"]
+    if retry:
+        fx_begin(retry, x["src"], x["name"], "peers" in x, True)
+
+
+def fx_on_msg(sid, parts):
+    # FX,HASH,sess,crc | FX,ACK,sess,bitmap | FX,DONE,sess,OK|NG|BASE | FX,NOSESS,sess
+    x = xfers.get(int(parts[2])) if len(parts) > 2 else None
+    if x is None:
+        return
+    x["last"] = time.ticks_ms()
+    if "peers" in x:
+        fx_cast_on_msg(x, x["peers"].get(str(sid)), parts)
+    elif parts[1] == "HASH":
+        if x["state"] == "hash":
+            if fx_plan(x, parts[3]):
+                x["state"] = "start"
+                x["ctl"] = None
+            else:
+                fx_finish(x, "SAME")
+    elif parts[1] == "ACK":
+        bm = binascii.unhexlify(parts[3]) if len(parts) > 3 else b""
+        for i in range(len(bm)):
+            x["acked"][i] |= bm[i]
+        top = -1
+        for seq in list(x["inflight"]):
+            if nara_proto.bit_get(x["acked"], seq):
+                del x["inflight"][seq]
+                top = max(top, seq)
+        # Selective retransmit: holes below the newest acked chunk are lost
+        lost = time.ticks_add(x["last"], -config["fx_rto"] - 1)
+        for seq in x["inflight"]:
+            if seq < top:
+                x["inflight"][seq] = lost
+        if x["state"] == "start":
+            x["state"] = "send"
+    elif parts[1] == "DONE":
+        fx_finish(x, parts[3] if len(parts) > 3 else "NG")
+    elif parts[1] == "NOSESS":
+        # Slave lost the session: restart, its resume bitmap comes back in the ACK
+        x["state"] = "start"
+        x["ctl"] = None
+        x["next"] = 0
+        x["inflight"] = {}
+        x["acked"] = nara_proto.bitmap(x["n"])
+
+
+def fx_pump():
+    now = time.ticks_ms()
+    for x in list(xfers.values()):
+        if x["wait"]:
+            if fx_busy(x):
+                continue
+            x["wait"] = False
+            x["t0"] = x["last"] = now
+        if time.ticks_diff(now, x["last"]) > config["fx_stall"]:
+            fx_finish(x, "STALL")
+            continue
+        if "peers" in x:
+            fx_cast_pump(x, now)
+            continue
+        if x["state"] == "send":
+            for seq, sent in list(x["inflight"].items()):
+                if time.ticks_diff(now, sent) > config["fx_rto"]:
+                    fx_send_chunk(x, seq, now)
+            while len(x["inflight"]) < config["fx_window"] and x["next"] < x["n"]:
+                seq = x["next"]
+                x["next"] += 1
+                if not nara_proto.bit_get(x["acked"], seq):
+                    fx_send_chunk(x, seq, now)
+            if not x["inflight"] and x["next"] >= x["n"]:
+                x["state"] = "end"
+                x["ctl"] = None
+        # HASH/START/END are plain frames, repeated until the slave answers
+        if x["state"] != "send" and (x["ctl"] is None or time.ticks_diff(now, x["ctl"]) > 1000):
+            x["ctl"] = now
+            if x["state"] == "hash":
+                esend(x["mac"], f"FX,HASH,{x['sess']},{x['name']}")
+            elif x["state"] == "start":
+                esend(x["mac"], fx_start_msg(x))
+            else:
+                esend(x["mac"], f"FX,END,{x['sess']}")
+
+
+def fx_cast_on_msg(x, peer, parts):
+    if peer is None:
+        return
+    if parts[1] == "HASH" and peer["state"] == "hash":
+        peer["have"] = parts[3]
+        peer["state"] = "start"
+    elif parts[1] == "ACK":
+        bm = binascii.unhexlify(parts[3]) if len(parts) > 3 else b""
+        for i in range(len(bm)):
+            peer["acked"][i] |= bm[i]
+        if peer["state"] in ("start", "poll"):
+            peer["state"] = "ready"
+    elif parts[1] == "DONE" and peer["state"] == "end":
+        peer["result"] = parts[3] if len(parts) > 3 else "NG"
+        peer["state"] = "done"
+    elif parts[1] == "NOSESS" and peer["state"] != "done":
+        peer["state"] = "lost"
+        peer["result"] = "NOSESS"
+
+
+def fx_cast_plan(x):
+    # Slaves already on the new file are done; a delta only if all share one base
+    active = []
+    for p in x["peers"].values():
+        if p["state"] == "start":
+            if p["have"] == f"{x['new_crc']:08x}":
+                p["state"], p["result"] = "done", "SAME"
+            else:
+                active.append(p)
+    haves = set(p["have"] for p in active)
+    if len(haves) == 1:
+        fx_plan(x, haves.pop())
+    x["state"] = "start"
+    x["ctl"] = None
+    x["tries"] = 0
+
+
+def fx_cast_missing(x):
+    # Union of the holes of every slave still in the session
+    missing = []
+    for seq in range(x["n"]):
+        for p in x["peers"].values():
+            if p["state"] == "ready" and not nara_proto.bit_get(p["acked"], seq):
+                missing.append(seq)
+                break
+    return missing
+
+
+def fx_cast_pump(x, now):
+    slaves = x["peers"].values()
+    if x["state"] == "send":
+        if x["ctl"] is not None and time.ticks_diff(now, x["ctl"]) < config["fx_gap"]:
+            return
+        x["ctl"] = now
+        for _ in range(config["fx_window"]):
+            if not x["queue"]:
+                break
+            seq = x["queue"].pop(0)
+            x["f"].seek(seq * nara_proto.FX_CHUNK)
+            frame = nara_proto.fx_frame(x["sess"], seq, x["f"].read(nara_proto.FX_CHUNK))
+            try:
+                peers.send(bcast, frame, False)
+            except:
+                x["queue"].append(seq)
+            if x["round"]:
+                x["resent"] += 1
+        if not x["queue"]:
+            x["state"] = "poll"
+            x["ctl"] = None
+            x["tries"] = 0
+            for p in slaves:
+                if p["state"] == "ready":
+                    p["state"] = "poll"
+        return
+
+    # START/POLL/END go unicast to each slave still owing an answer
+    waiting = [p for p in slaves if p["state"] == x["state"]]
+    if waiting:
+        if x["ctl"] is not None and time.ticks_diff(now, x["ctl"]) < 1000:
+            return
+        if x["tries"] < config["fx_retries"]:
+            x["ctl"] = now
+            x["tries"] += 1
+            for p in waiting:
+                if x["state"] == "hash":
+                    msg = f"FX,HASH,{x['sess']},{x['name']}"
+                elif x["state"] == "start":
+                    msg = fx_start_msg(x)
+                elif x["state"] == "poll":
+                    msg = f"FX,POLL,{x['sess']}"
+                else:
+                    msg = f"FX,END,{x['sess']}"
+                esend(p["mac"], msg)
+            return
+    for p in waiting:
+        p["state"] = "lost"
+        p["result"] = "LOST"
+    if x["state"] == "hash":
+        fx_cast_plan(x)
+        return
+    if x["state"] == "end":
+        fx_finish(x, "OK" if all(p["result"] in ("OK", "SAME") for p in slaves) else "NG")
+        return
+    x["queue"] = fx_cast_missing(x)
+    if not x["queue"] or x["round"] >= config["fx_rounds"]:
+        # Complete (or out of rounds): verify on every slave that is still with us
+        x["state"] = "end"
+        for p in slaves:
+            if p["state"] == "ready":
+                p["state"] = "end"
+    else:
+        if x["state"] == "poll":
+            x["round"] += 1
+        x["state"] = "send"
+    x["ctl"] = None
+    x["tries"] = 0
+
+
+def fx_begin(sid_list, src, name, mcast=False, full=False):
+    # Unicast: one windowed session per slave ("{sid}" in src picks per-slave files).
+    # Multicast: one broadcast session shared by every slave in sid_list.
+    # full skips the HASH/delta step.
+    routes = []
+    for sid in sid_list:
+        mac = get_mac_by_sid(sid)
+        if mac is None:
+            print(f"FX: no route to slave {sid}")
+            continue
+        routes.append((sid, mac))
+    if mcast:
+        routes = [routes] if routes else []
+    for route in routes:
+        path = src if mcast else src.replace("{sid}", route[0])
+        try:
+            f, size, crc = fx_open(path)
+        except Exception as ex:
+            print("FX:", path, ex)
+            continue
+        sess = fx_new_sess()
+        n = nara_proto.fx_chunks(size)
+        x = {
+            "sess": sess,
+            "name": name or path.split("/")[-1],
+            "src": path,
+            "f": f,
+            "size": size,
+            "crc": crc,
+            "new_crc": crc,
+            "n": n,
+            "delta": False,
+            "state": "start" if full else "hash",
+            "wait": True,  # until no other session holds these slaves
+            "resent": 0,
+            "t0": time.ticks_ms(),
+            "last": time.ticks_ms(),
+            "ctl": None,  # ticks of the last START/END (burst/POLL for multicast)
+        }
+        if mcast:
+            x["peers"] = {
+                sid: {"mac": mac, "acked": nara_proto.bitmap(n), "state": x["state"], "result": "NG"}
+                for sid, mac in route
+            }
+            x["queue"] = []
+            x["round"] = 0
+            x["tries"] = 0
+        else:
+            x["sid"], x["mac"] = route
+            x["acked"] = nara_proto.bitmap(n)
+            x["inflight"] = {}  # seq: ticks sent
+            x["next"] = 0
+        xfers[sess] = x
+
+
+def handle_fwsend(args):
+    # FWSEND [sid|sid,sid|all, source file, name on slave]: stream a file from master flash
+    if len(args) < 2:
+        print("FWSEND: need sid and file")
+        return
+    fx_begin(fx_targets(args[0]), args[1], args[2] if len(args) > 2 else "")
+
+
+def handle_fwcast(args):
+    # FWCAST [sid,sid|all, source file, name on slave]: one broadcast for the whole fleet
+    if len(args) < 2:
+        print("FWCAST: need sids and file")
+        return
+    fx_begin(fx_targets(args[0]), args[1], args[2] if len(args) > 2 else "", True)
+
+
 # --- Dispatch Handlers ---
 def handle_mdebug(args):
     config["debug"] = int(args[0]) if args else (0 if config["debug"] else 1)
@@ -82,11 +1405,47 @@ MASTER_DISPATCH = {
     "MDEBUG": handle_mdebug,
     "MRESET": handle_mreset,
     "MREBOOT": handle_mreset,
+    "FWSEND": handle_fwsend,
+    "FWCAST": handle_fwcast,
+    "LINKTEST": handle_linktest,
+    "TRACE": handle_trace,
 }
 
 
+def fire_cue(cue, at=0):
+    # One broadcast FIRE frame for every slave that armed the cue
+    global last_cue
+    cue = str(cue or last_cue or "")
+    if not cue:
+        return
+    armed = cues.pop(cue, {})
+    if cue == last_cue:
+        last_cue = None
+    tag = next_tag()
+    msg = f"FIRE,{cue},{tag},{at}" if at else f"FIRE,{cue},{tag}"
+    esend(bcast, msg, False)
+    if config["debug"]:
+        print(f"FWD -> broadcast: {msg}")
+    track(tag, "FIRE", "CUE", cue, {sid: 1 for sid in armed}, at)
+
+
+def disarm_cue(cue):
+    global last_cue
+    cue = str(cue or "")
+    if cue:
+        cues.pop(cue, None)
+    else:
+        cues.clear()
+    if not cue or cue == last_cue:
+        last_cue = None
+    esend(bcast, f"DISARM,{cue}", False)
+
+
 # --- MQTT Callback ---
 def mqtt_callback(topic, msg):
+    global last_cue
+    if trace:
+        trace_rec(TR_MQTT, bytes((len(topic),)) + topic, msg)
     try:
         t_str = topic.decode()
         m_str = msg.decode()
@@ -94,6 +1453,16 @@ def mqtt_callback(topic, msg):
             print(f".M>[{t_str}] {m_str}")
         data = json.loads(m_str)
 
+        # nara/group/<gid|bid>: the target comes from the topic
+        if t_str.startswith("nara/group/"):
+            gid = t_str.split("/")[2].upper()
+            if "target" not in data:
+                data["target"] = "Booth" if gid in members["booths"] else "Group"
+            data.setdefault("id", gid)
+        elif t_str == "nara/master/global":
+            data.setdefault("target", "Global")
+            data.setdefault("id", "all")
+
         # Prevent double processing (incomplete message)
         if "target" not in data and "id" not in data:
             if config["debug"]:
@@ -112,9 +1481,27 @@ def mqtt_callback(topic, msg):
         dst = data.get("dst", "broadcast")
         pmac = data.get("pmac", "")
 
+        # Status polls are answered from the fleet table when it is fresh
+        if raw_cmd in FLEET_QUERIES and target in ("SLAVE", "GLOBAL"):
+            fleet_query(raw_cmd, target, tid)
+            return
+
         # 1. Check Master Dispatch
         if raw_cmd in MASTER_DISPATCH:
-            MASTER_DISPATCH[raw_cmd]([])
+            MASTER_DISPATCH[raw_cmd](data.get("args", []))
+            return
+
+        # Execute-at: "at" is Unix ms on the master clock, "in" is ms from now
+        at = int(data.get("at", 0))
+        if not at and data.get("in"):
+            at = master_ms() + int(data["in"])
+
+        # Two-phase cues: {"cmd": ..., "arm": true} connects ahead, then FIRE/DISARM
+        if raw_cmd == "FIRE":
+            fire_cue(data.get("cue"), at)
+            return
+        if raw_cmd == "DISARM":
+            disarm_cue(data.get("cue"))
             return
 
         # 2. Routing via nara_cmd
@@ -122,109 +1509,367 @@ def mqtt_callback(topic, msg):
         if raw_cmd in nara_cmd.MELK:
             final_cmd = nara_cmd.MELK[raw_cmd]
 
+        tag = next_tag()
+        if data.get("arm"):
+            # The tag names the cue; slaves reply with armed/staged counts
+            final_cmd = f"ARM:{final_cmd}"
+            last_cue, at = tag, 0
+
+        # 3a. Group/Booth/Subset (and bare PIDs): per-slave batch frames
+        if target == "PID" and str(tid).upper() in members["pids"]:
+            target = "SUBSET"
+        if target in FANOUT_TARGETS:
+            plan, unknown = plan_fanout(resolve_pids(target, tid))
+            if not plan:
+                # Nothing to light: say so now instead of never (or at the deadline)
+                if unknown:
+                    report_error(tag, final_cmd, target, tid, {"unknown": unknown})
+                else:
+                    report_error(tag, final_cmd, target, tid, {"empty": [str(tid)]})
+                return
+            expect, failed = send_fanout(final_cmd, plan, tag, at)
+            if unknown:
+                failed["unknown"] = unknown
+            track(tag, final_cmd, target, tid, expect, at, failed)
+            return
+
+        # Slaves match their numeric SID, dashboards send "S4"
+        if target == "SLAVE" and str(tid).upper().startswith("S"):
+            tid = tid[1:]
+        # No slave answers to an id it does not have; a PID outside members.json
+        # only reaches its slave as {"id": sid, "pmac": ...}
+        if target == "PID":
+            unknown = not pmac or (sids and not known_sid(tid))
+        else:
+            unknown = target == "SLAVE" and sids and not known_sid(tid)
+        if unknown:
+            report_error(tag, final_cmd, target, tid, {"unknown": [str(tid)]})
+            return
+        if target == "SLAVE" and live_state(tid) == "dead":
+            report_error(tag, final_cmd, target, tid, {"dead": {str(tid): []}})
+            return
+
         # 3. Construct Payload
-        # data format: target|tid|cmd|pmac
-        payload = f"{target}|{tid}|{final_cmd}|{pmac}"
+        # data format: target|tid|cmd|pmac|tag[|at]
+        payload = f"{target}|{tid}|{final_cmd}|{pmac}|{tag}"
+        if at:
+            payload += f"|{at}"
 
         target_mac = bcast
         if dst != "broadcast":
             target_mac = binascii.unhexlify(dst.replace(":", "").replace("-", ""))
-            try:
-                e.add_peer(target_mac)
-            except:
-                pass
 
-        e.send(target_mac, payload)
-        if config["debug"]:
+        expect = {s: 1 for s in expected_sids(target, tid, dst)}
+        failed = {}
+        dead = {s: [] for s in expect if live_state(s) == "dead"}
+        for s in dead:
+            del expect[s]
+        if dead:
+            failed["dead"] = dead
+        # One slave's bucket for unicast or SLAVE targets, the global one otherwise
+        key = list(expect)[0] if len(expect) == 1 and (target == "SLAVE" or dst != "broadcast") else "*"
+        if not gate(key, [(target_mac, payload, True)], tag):
+            if expect:
+                failed["rate"] = {s: [] for s in expect}
+            expect = {}
+        elif config["debug"]:
             print(f"FWD -> {dst}: {payload}")
+        track(tag, final_cmd, target, tid, expect, at, failed)
 
     except Exception as ex:
         print("MQTT Error:", ex)
 
 
-# --- ESP-NOW Callbacks ---
-def recv_cb(esp):
-    while True:
-        mac, msg = esp.irecv(0)
-        if mac is None:
-            break
+# --- ESP-NOW Receive ---
+def on_espnow(mac, msg):
+    if trace:
+        trace_rec(TR_RX, bytes(mac), msg)
+    # Only complete messages go further; fragments wait in the reassembler
+    msg = rx.feed(mac, msg)
+    if msg is None:
+        return
 
-        mac_hex = mac.hex()
+    mac_hex = mac.hex()
 
-        # STRICT FILTERING: Ignore unknown peers
-        # Exception: Allow NARAINIT for pairing
-        msg_str = msg.decode()
+    # STRICT FILTERING: Ignore unknown peers
+    # Exception: Allow NARAINIT for pairing
+    msg_str = msg.decode()
+    if config["debug"]:
         print(f"Recv: {msg_str}")
-        # if "NARA" in msg_str:
-        #     # Pairing Mode
-        #     parts = msg_str.split(',')
-        #     if len(parts) > 1:
-        #         sids[mac_hex] = parts[1]
-        #         save_state()
-        #         # Auto-add peer
-        #         try: e.add_peer(mac)
-        #         except: pass
-        #         print(f"Paired: {parts[1]} ({mac_hex})")
-
-        if mac_hex not in sids:
-            if config["debug"]:
-                print(f"Ignored unknown peer: {mac_hex}")
-            continue
+    # if "NARA" in msg_str:
+    #     # Pairing Mode
+    #     parts = msg_str.split(',')
+    #     if len(parts) > 1:
+    #         sids[mac_hex] = parts[1]
+    #         save_state()
+    #         # Auto-add peer
+    #         try: e.add_peer(mac)
+    #         except: pass
+    #         print(f"Paired: {parts[1]} ({mac_hex})")
 
-        # Valid Message Processing
-        sid_name = sids.get(mac_hex, mac_hex)
-        status_payload = {
-            "sid": sid_name,
-            "mac": mac_hex,
-            "msg": msg_str,
-            "time": time.time(),
-        }
-        client.publish(config["mqtt_topic_stat"], json.dumps(status_payload))
+    if mac_hex not in sids:
+        if config["debug"]:
+            print(f"Ignored unknown peer: {mac_hex}")
+        return
 
+    if msg_str.startswith("LT,"):
+        lt_rx(mac, msg_str)  # link-test traffic stays out of fleet/liveness stats
+        return
 
-# --- Initialization ---
-load_config()
-wlan = network.WLAN(network.STA_IF)
-wlan.active(True)
-wlan.connect(config["ssid"], config["password"])
-
-while not wlan.isconnected():
-    time.sleep(0.5)
-    print("WiFi...")
-
-# ESP-NOW
-e = espnow.ESPNow()
-e.active(True)
-e.add_peer(bcast)
-e.irq(recv_cb)
-
-# MQTT
-client = MQTTClient(f"NaraMaster_{config['mid']}", config["mqtt_broker"])
-client.set_callback(mqtt_callback)
-client.connect()
-client.subscribe(b"nara/master/global")
-client.subscribe(b"nara/slave/#")
-client.subscribe(b"nara/group/#")
-
-print(f"Master {config['mid']} Online")
-
-# --- Main Loop ---
-last_hbeat = 0
-while True:
-    try:
-        client.check_msg()
-    except:
+    fleet_note(str(sids[mac_hex]), msg_str)
+    if msg_str.startswith("HB,"):
+        return  # liveness beacon only
+
+    # Time sync: TS,t1 -> TS,t1,t2 stamped with the reference clock, sent
+    # directly rather than queued so the stamp is not aged by txq
+    if msg_str.startswith("TS,"):
+        peers.send(mac, f"{msg_str},{master_ms()}", False)
+        return
+
+    # Tracked command replies are folded into one completion record
+    if msg_str.startswith("RESP,") and on_resp(msg_str.split(",")):
+        return
+    # File-transfer acks drive fx_pump() and are not republished
+    if msg_str.startswith("FX,"):
+        fx_on_msg(sids[mac_hex], msg_str.split(","))
+        return
+
+    # Valid Message Processing
+    sid_name = sids.get(mac_hex, mac_hex)
+    status_payload = {
+        "sid": sid_name,
+        "mac": mac_hex,
+        "msg": msg_str,
+        "time": time.time(),
+    }
+    publish(config["mqtt_topic_stat"], json.dumps(status_payload), True)
+
+
+# --- Tasks ---
+async def espnow_task():
+    async for mac, msg in e:
         try:
-            client.connect()
-        except:
-            pass
+            on_espnow(mac, msg)
+        except Exception as ex:
+            print("ESP-NOW Error:", ex)
+
+
+async def send_task():
+    while True:
+        mac, frame, sync = await txq.get()
+        try:
+            peers.send(mac, frame, sync)
+        except Exception as ex:
+            print("Send Error:", ex)
+
+
+async def mqtt_task():
+    # check_msg() reads the socket non-blocking; a burst is drained in one wake
+    global mqtt_ok
+    while True:
+        if mqtt_ok:
+            try:
+                for _ in range(8):
+                    client.check_msg()
+            except:
+                mqtt_ok = False
+        await asyncio.sleep(config["mqtt_poll"] / 1000)
+
+
+def mqtt_bound():
+    # umqtt.simple writes on a blocking socket (check_msg() puts it back that
+    # way), so a stalled broker would hold every task; a timeout turns that
+    # into a dropped session and held publishes. A publish is a few writes.
+    try:
+        client.sock.settimeout(config["mqtt_timeout"] / 1000)
+    except:
+        pass
+
+
+def mqtt_publish(topic, payload, retain=False):
+    global mqtt_ok
+    if not mqtt_ok:
+        return False
+    try:
+        mqtt_bound()
+        client.publish(topic, payload, retain)
+        return True
+    except:
+        mqtt_ok = False
+        return False
 
-    if time.time() - last_hbeat > 60:
-        last_hbeat = time.time()
+
+def mqtt_send(topic, payloads, hold=True, retain=False):
+    payload = payloads[0] if len(payloads) == 1 else "[" + ",".join(payloads) + "]"
+    # Behind earlier held publishes, or the broker is down: keep them in order
+    if (hold and len(held)) or not mqtt_publish(topic, payload, retain):
+        if hold:
+            for p in payloads:
+                held.hold(topic, p)
+
+
+async def publish_task():
+    # A reply storm of 25 status lines becomes one or two TCP writes
+    batch, t0 = {}, 0  # topic: [payloads] for the open window
+    while True:
+        item = None
+        if not batch:
+            item = await pubq.get()
+        else:
+            left = config["pub_batch_ms"] - time.ticks_diff(time.ticks_ms(), t0)
+            if left > 0:
+                try:
+                    item = await asyncio.wait_for(pubq.get(), left / 1000)
+                except asyncio.TimeoutError:
+                    pass
+        if item is None:
+            for topic, payloads in batch.items():
+                mqtt_send(topic, payloads)
+            batch = {}
+        else:
+            topic, payload, grouped, hold, retain = item
+            if not grouped:
+                mqtt_send(topic, [payload], hold, retain)
+            else:
+                if not batch:
+                    t0 = time.ticks_ms()
+                batch.setdefault(topic, []).append(payload)
+                if len(batch[topic]) >= config["pub_batch_n"]:
+                    mqtt_send(topic, batch.pop(topic))
+        await asyncio.sleep(0)
+
+
+async def pump_task():
+    while True:
+        rate_release()
+        check_pending()
+        live_check()
+        fleet_flush()
+        fx_pump()
+        trace_tick()
+        await asyncio.sleep(0.005 if xfers else 0.05)
+
+
+async def heartbeat_task():
+    while True:
         wdt.feed()
-        client.publish(
+        publish(
             config["mqtt_topic_stat"],
-            json.dumps({"mid": config["mid"], "status": "online"}),
+            json.dumps(
+                {
+                    "mid": config["mid"],
+                    "status": "online",
+                    "frag_lost": rx.expired,
+                    "peers": peers.stats(),
+                    "txq": [len(txq.items), txq.dropped],
+                    "pubq": [len(pubq.items), pubq.dropped],
+                    "held": [len(held.ring), held.spilled, held.dropped],
+                    "rate": rate_stats,
+                }
+            ),
+            hold=False,
         )
+        fleet_snapshot()
+        await asyncio.sleep(60)
+
+
+def mqtt_connect():
+    # The broker address should be an IP: the DNS lookup cannot be bounded
+    try:
+        client.connect(timeout=config["mqtt_timeout"] / 1000)
+    except TypeError:
+        client.connect()  # umqtt.simple before 1.4 has no connect timeout
+    mqtt_bound()
+    client.subscribe(b"nara/master/global")
+    client.subscribe(b"nara/slave/#")
+    client.subscribe(b"nara/group/#")
+
+
+async def supervisor_task():
+    # Brings Wi-Fi and the broker session back; the radio side keeps running.
+    # Failed broker connects back off 1, 2, 4 ... mqtt_backoff s.
+    global mqtt_ok
+    backoff = 1
+    while True:
+        if not wlan.isconnected():
+            mqtt_ok = False
+            try:
+                wlan.connect(config["ssid"], config["password"])
+            except:
+                pass
+        elif not mqtt_ok:
+            try:
+                mqtt_connect()
+                mqtt_ok = True
+                backoff = 1
+                print("MQTT reconnected")
+            except:
+                backoff = min(backoff * 2, config["mqtt_backoff"])
+                await asyncio.sleep(backoff)
+                continue
+        if mqtt_ok and len(held):
+            # New publishes queue up behind these until the replay catches up
+            await held.replay(mqtt_publish)
+        await asyncio.sleep(2)
+
+
+# --- Initialization ---
+async def main():
+    global wlan, e, peers, client, txq, pubq, held, gbucket, mqtt_ok
+    load_config()
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    wlan.connect(config["ssid"], config["password"])
+
+    while not wlan.isconnected():
+        await asyncio.sleep(0.5)
+        print("WiFi...")
+
+    # ESP-NOW
+    e = aioespnow.AIOESPNow()
+    e.active(True)
+    peers = nara_proto.PeerTable(e, config["max_peers"], (bcast,))
+    peers.tap = trace_tx
+    txq = Queue(config["txq"])
+    pubq = Queue(config["pubq"])
+    held = Held(config["held_ram"], HELD_FILE, config["held_flash"])
+    gbucket = Bucket(config["rate_global"], config["burst_global"])
+
+    # MQTT
+    client = MQTTClient(f"NaraMaster_{config['mid']}", config["mqtt_broker"])
+    client.set_callback(mqtt_callback)
+    try:
+        mqtt_connect()
+        mqtt_ok = True
+    except Exception as ex:
+        print("MQTT Error:", ex)  # supervisor_task retries
+
+    # Reference clock from NTP when the broker network has it
+    try:
+        import ntptime
+
+        ntptime.settime()
+    except:
+        pass
+    if config["trace"]:
+        trace_open()  # after NTP, the file header carries the Unix time
+    # Every provisioned slave starts on the liveness clock now, so one that
+    # never speaks goes suspect/dead just like one that stopped
+    boot = master_ms()
+    for sid in sids.values():
+        fleet.setdefault(str(sid), {"seen": boot})
+
+    print(f"Master {config['mid']} Online")
+    await asyncio.gather(
+        espnow_task(),
+        send_task(),
+        mqtt_task(),
+        publish_task(),
+        pump_task(),
+        heartbeat_task(),
+        supervisor_task(),
+    )
+
 
-    time.sleep(0.1)
+if __name__ == "__main__":
+    asyncio.run(main())
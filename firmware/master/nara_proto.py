@@ -0,0 +1,301 @@
+# ESP-NOW wire helpers shared by master and slave (keep both copies identical)
+import time
+import binascii
+import struct
+
+try:
+    import io
+    import deflate  # MicroPython 1.21+
+except ImportError:
+    deflate = None
+    import zlib
+
+MAX_FRAME = 250  # ESP-NOW payload limit
+
+# Fragment frame: 0x1E, msg id, index, total, data...
+FRAG = 0x1E
+FRAG_HEAD = 4
+FRAG_DATA = MAX_FRAME - FRAG_HEAD
+
+
+def fragment(data, msgid):
+    # Split an oversized message into frames; small ones go out untouched
+    if len(data) <= MAX_FRAME:
+        return [data]
+    total = (len(data) + FRAG_DATA - 1) // FRAG_DATA
+    if total > 255:
+        raise ValueError("message too large")
+    return [
+        bytes((FRAG, msgid & 0xFF, i, total)) + data[i * FRAG_DATA : (i + 1) * FRAG_DATA]
+        for i in range(total)
+    ]
+
+
+class Reassembler:
+    def __init__(self, timeout_ms=2000):
+        self.timeout_ms = timeout_ms
+        self.parts = {}  # (mac, msgid): [first tick, total, {index: data}]
+        self.expired = 0
+
+    def feed(self, mac, frame):
+        # Returns the frame itself, the completed message, or None while incomplete
+        if not frame or frame[0] != FRAG:
+            return frame
+        self.purge()
+        if len(frame) < FRAG_HEAD or frame[2] >= frame[3]:
+            return None
+        key = (bytes(mac), frame[1])
+        entry = self.parts.get(key)
+        if entry is None or entry[1] != frame[3]:
+            entry = self.parts[key] = [time.ticks_ms(), frame[3], {}]
+        # irecv() reuses its buffer, so keep a copy
+        entry[2][frame[2]] = bytes(frame[FRAG_HEAD:])
+        if len(entry[2]) < entry[1]:
+            return None
+        del self.parts[key]
+        return b"".join(entry[2][i] for i in range(entry[1]))
+
+    def purge(self):
+        now = time.ticks_ms()
+        for key in [k for k, v in self.parts.items() if time.ticks_diff(now, v[0]) > self.timeout_ms]:
+            del self.parts[key]
+            self.expired += 1
+
+
+# File-transfer data frame: 0x1F, session, seq (2 bytes, big endian), raw chunk...
+FX_DATA = 0x1F
+FX_HEAD = 4
+FX_CHUNK = MAX_FRAME - FX_HEAD
+
+
+def fx_frame(sess, seq, chunk):
+    return bytes((FX_DATA, sess & 0xFF, seq >> 8, seq & 0xFF)) + chunk
+
+
+def fx_parse(frame):
+    return frame[1], (frame[2] << 8) | frame[3], frame[FX_HEAD:]
+
+
+def fx_chunks(size):
+    return (size + FX_CHUNK - 1) // FX_CHUNK
+
+
+# Received-chunk bitmaps travel as hex in FX,ACK replies
+def bitmap(n):
+    return bytearray((n + 7) // 8)
+
+
+def bit_set(bm, i):
+    bm[i >> 3] |= 1 << (i & 7)
+
+
+def bit_get(bm, i):
+    return (bm[i >> 3] >> (i & 7)) & 1
+
+
+def bit_count(bm, n):
+    return sum(bit_get(bm, i) for i in range(n))
+
+
+def file_crc(f):
+    # (size, CRC32) of an open file, read in 1 KB steps
+    f.seek(0)
+    size, crc = 0, 0
+    while True:
+        buf = f.read(1024)
+        if not buf:
+            break
+        size += len(buf)
+        crc = binascii.crc32(buf, crc)
+    return size, crc & 0xFFFFFFFF
+
+
+# Delta container: b"NDZ" + deflate(body) or b"NDR" + body, where
+# body = base crc, new size, new crc (3 x u32) + ops:
+#   b"C" off(u32) len(u16): copy from the base file
+#   b"A" len(u16) data:     literal bytes
+DELTA_BLOCK = 64
+
+
+def compress(data):
+    if deflate is None:
+        return zlib.compress(data)
+    buf = io.BytesIO()
+    d = deflate.DeflateIO(buf, deflate.ZLIB)
+    d.write(data)
+    d.close()
+    return buf.getvalue()
+
+
+def decompress(data):
+    if deflate is None:
+        return zlib.decompress(data)
+    return deflate.DeflateIO(io.BytesIO(data), deflate.ZLIB).read()
+
+
+def delta_build(base, new):
+    # Index the base by aligned blocks, then scan the new file byte by byte so
+    # inserted lines only cost their own bytes
+    index = {}
+    for off in range(0, len(base) - DELTA_BLOCK + 1, DELTA_BLOCK):
+        index.setdefault(base[off : off + DELTA_BLOCK], off)
+    ops = []
+    lit = bytearray()
+    copy = None  # [base offset, length]
+    i = 0
+    while i < len(new):
+        off = None
+        if i + DELTA_BLOCK <= len(new):
+            off = index.get(new[i : i + DELTA_BLOCK])
+        if off is None:
+            if copy:
+                ops.append(struct.pack(">BIH", 67, copy[0], copy[1]))
+                copy = None
+            lit.append(new[i])
+            i += 1
+            continue
+        while lit:
+            ops.append(struct.pack(">BH", 65, len(lit[:0xFFFF])) + lit[:0xFFFF])
+            lit = lit[0xFFFF:]
+        if copy and copy[0] + copy[1] == off and copy[1] + DELTA_BLOCK <= 0xFFFF:
+            copy[1] += DELTA_BLOCK
+        else:
+            if copy:
+                ops.append(struct.pack(">BIH", 67, copy[0], copy[1]))
+            copy = [off, DELTA_BLOCK]
+        i += DELTA_BLOCK
+    if copy:
+        ops.append(struct.pack(">BIH", 67, copy[0], copy[1]))
+    while lit:
+        ops.append(struct.pack(">BH", 65, len(lit[:0xFFFF])) + lit[:0xFFFF])
+        lit = lit[0xFFFF:]
+    crc_base = binascii.crc32(base) & 0xFFFFFFFF
+    crc_new = binascii.crc32(new) & 0xFFFFFFFF
+    body = struct.pack(">III", crc_base, len(new), crc_new) + b"".join(ops)
+    try:
+        return b"NDZ" + compress(body)
+    except Exception:
+        return b"NDR" + body  # firmware built without deflate compression
+
+
+def delta_apply(delta, base_f, out_f):
+    # Rebuild into out_f; returns (size, crc) the result must match.
+    # ValueError("base") when base_f is not the file the delta was made against.
+    if delta[:3] == b"NDZ":
+        body = decompress(delta[3:])
+    elif delta[:3] == b"NDR":
+        body = delta[3:]
+    else:
+        raise ValueError("delta")
+    crc_base, size, crc = struct.unpack(">III", body[:12])
+    if file_crc(base_f)[1] != crc_base:
+        raise ValueError("base")
+    i = 12
+    while i < len(body):
+        if body[i] == 67:
+            off, n = struct.unpack(">IH", body[i + 1 : i + 7])
+            i += 7
+            base_f.seek(off)
+            out_f.write(base_f.read(n))
+        else:
+            n = struct.unpack(">H", body[i + 1 : i + 3])[0]
+            i += 3
+            out_f.write(body[i : i + n])
+            i += n
+    return size, crc
+
+
+def pad(head, size):
+    # Link-test frame: head, then filler up to size bytes
+    head = head.encode()
+    if size > len(head) + 1:
+        return head + b"," + b"x" * (size - len(head) - 1)
+    return head
+
+
+def esp_err(ex):
+    # MicroPython espnow raises OSError(code, "ESP_ERR_ESPNOW_...")
+    return ex.args[1] if len(ex.args) > 1 else ""
+
+
+class PeerTable:
+    # ESP-NOW keeps at most ~20 peers (fewer when encrypted): register on first
+    # use and evict the least recently used unicast peer when the table is full
+    def __init__(self, esp, max_peers=16, pinned=()):
+        self.esp = esp
+        self.max_peers = max_peers
+        self.pinned = [bytes(m) for m in pinned]  # never evicted (broadcast, master)
+        self.lru = []  # least recently used first
+        self.evictions = 0
+        self.send_fail = 0
+        self.tap = None  # f(mac, data) for every frame handed to the driver
+        for mac in self.pinned:
+            try:
+                esp.add_peer(mac)
+            except:
+                pass  # already registered
+
+    def use(self, mac):
+        mac = bytes(mac)
+        if mac in self.pinned:
+            return
+        if mac in self.lru:
+            self.lru.remove(mac)
+            self.lru.append(mac)
+            return
+        if len(self.lru) + len(self.pinned) >= self.max_peers:
+            self.evict()
+        try:
+            self.esp.add_peer(mac)
+        except OSError as ex:
+            # Driver table full (peers added elsewhere): make room once more
+            if esp_err(ex) == "ESP_ERR_ESPNOW_FULL" and self.lru:
+                self.evict()
+                try:
+                    self.esp.add_peer(mac)
+                except OSError:
+                    pass
+        self.lru.append(mac)
+
+    def evict(self):
+        mac = self.lru.pop(0)
+        try:
+            self.esp.del_peer(mac)
+        except:
+            pass
+        self.evictions += 1
+
+    def forget(self, mac):
+        mac = bytes(mac)
+        if mac in self.lru:
+            self.lru.remove(mac)
+            try:
+                self.esp.del_peer(mac)
+            except:
+                pass
+
+    def send(self, mac, data, sync=True):
+        # False (and counted) when a synchronous send was not acked
+        if self.tap:
+            self.tap(mac, data)
+        self.use(mac)
+        try:
+            ok = self.esp.send(mac, data, sync)
+        except OSError as ex:
+            if esp_err(ex) != "ESP_ERR_ESPNOW_NOT_FOUND":
+                self.send_fail += 1
+                raise
+            # Peer dropped behind our back: register again and retry once
+            self.forget(mac)
+            self.use(mac)
+            try:
+                ok = self.esp.send(mac, data, sync)
+            except OSError:
+                self.send_fail += 1
+                raise
+        if ok is False:
+            self.send_fail += 1
+        return ok
+
+    def stats(self):
+        return {"n": len(self.lru) + len(self.pinned), "evict": self.evictions, "fail": self.send_fail}
@@ -10,16 +10,31 @@ import bluetooth
 import gc
 import esp32
 import nara_cmd
+import nara_proto
 import os
 
 # --- Configuration & Constants ---
 VER = "nslave_0211a"
 CONFIG_FILE = "nslave.json"
 CIDS_FILE = "cids.json"
+FX_STATE = "fx.json"  # resumable file-transfer session
+FX_ACK_EVERY = 8
+SYNC_FAST = 4  # TS samples taken 1 s apart after boot, then every sync_s
 SERVICE_UUID = bluetooth.UUID(0xFFF0)
 CHAR_UUID = bluetooth.UUID(0xFFF3)
 
-config = {"sid": 1, "master": "24ec4aca5e20", "ch": 11, "debug": 1}
+config = {
+    "sid": 1,
+    "master": "24ec4aca5e20",
+    "ch": 11,
+    "debug": 1,
+    "sync_s": 30,
+    "max_conn": 4,  # NimBLE connection limit; ARM holds all but one
+    "arm_s": 120,  # an unfired cue releases its links after this
+    "max_peers": 8,  # master plus pairing/zone peers
+    "hb_s": 2,  # liveness beacon to the master
+    "sync_hold": 5000,  # ms an execute-at waits for the first TS sample
+}
 
 # --- Hardware ---
 wdt = machine.WDT(timeout=300000)
@@ -64,6 +79,7 @@ class NLED:
             # Previous code assumed "be28" + suffix.
             clean_mac = "be28" + clean_mac
 
+        self.cid = mac_hex
         self.mac_bytes = binascii.unhexlify(clean_mac)
         self.device = aioble.Device(aioble.ADDR_PUBLIC, self.mac_bytes)
         self.connection = None
@@ -89,12 +105,18 @@ class NLED:
         self.char = None
 
     async def write(self, cmd_hex, repeat=1):
-        if not self.connection or not self.char:
-            return False
         try:
             # Resolve command using nara_cmd if it's a name
             final_hex = nara_cmd.MELK.get(cmd_hex.upper(), cmd_hex)
             payload = binascii.unhexlify(final_hex)
+        except:
+            return False
+        return await self.send(payload, repeat)
+
+    async def send(self, payload, repeat=1):
+        if not self.connection or not self.char:
+            return False
+        try:
             for _ in range(repeat):
                 await self.char.write(payload)
             return True
@@ -102,11 +124,66 @@ class NLED:
             return False
 
 
+# --- Time Sync ---
+class SyncClock:
+    # Maps the local clock onto the master's from TS round trips: offset + drift.
+    # Times are ~1e12 ms and ESP32 floats are single precision (a step is over
+    # a minute up there), so absolute times stay ints and only small deltas
+    # from base ever meet a float.
+    def __init__(self):
+        self.samples = []  # (local ms, offset ms, rtt ms)
+        self.base = 0
+        self.offset = 0
+        self.drift = 0.0
+        self.rtt = 0
+        self.synced = False
+
+    def now(self):
+        return time.time_ns() // 1000000
+
+    def update(self, t1, t2, t3):
+        # t1/t3: local send/receive, t2: master receive time
+        rtt = t3 - t1
+        if rtt < 0 or rtt > 200:
+            return
+        self.samples.append((t3, t2 + rtt // 2 - t3, rtt))
+        self.samples = self.samples[-8:]
+        # The fastest round trips carry the least queueing asymmetry
+        best = sorted(self.samples, key=lambda s: s[2])[: max(2, len(self.samples) // 2)]
+        n = len(best)
+        x0, y0 = best[0][0], best[0][1]
+        mx = x0 + sum(s[0] - x0 for s in best) // n
+        my = y0 + sum(s[1] - y0 for s in best) // n
+        sxx = sum((s[0] - mx) ** 2 for s in best)
+        if sxx > 100000000:  # >10 s of spread before trusting a slope
+            self.drift = sum((s[0] - mx) * (s[1] - my) for s in best) / sxx
+        self.base, self.offset, self.rtt = mx, my, best[0][2]
+        self.synced = True
+
+    def to_master(self, local):
+        return local + self.offset + int(self.drift * (local - self.base))
+
+    def to_local(self, master):
+        d = master - self.offset - self.base
+        return self.base + d - int(self.drift * d / (1 + self.drift))
+
+
 # --- Main Logic ---
 class SlaveNode:
     def __init__(self):
         self.esp = espnow.ESPNow()
+        self.esp.config(rxbuf=4096)  # room for a full file-transfer window
         self.esp.active(True)
+        self.rx = nara_proto.Reassembler()
+        self.frag_id = 0
+        self.fx = None
+        self.fx_done = None  # (sess, result) of the last finished transfer
+        self.clock = SyncClock()
+        self.sync_wait = False
+        self.ble_lock = asyncio.Lock()  # scheduled and live sweeps share the radio
+        self.cue = None  # armed cue: id, payload, staged NLEDs
+        self.backlog = 0  # commands running or scheduled, reported as queue depth
+        self.lt = None  # link-test run in progress, see lt_rx()
         self.load_state()
         self.init_network()
 
@@ -124,19 +201,17 @@ class SlaveNode:
             self.sta.config(channel=config["ch"])
         except:
             pass
-        try:
-            self.esp.add_peer(self.master_mac)
-        except:
-            pass
+        self.peers = nara_proto.PeerTable(self.esp, config["max_peers"], (self.master_mac,))
 
     def send_msg(self, msg, peer=None):
         target = peer if peer else self.master_mac
         try:
-            self.esp.add_peer(target)
-        except:
-            pass
-        try:
-            self.esp.send(target, str(msg))
+            # ZSCAN/CID/SDIR lists outgrow one frame with 25+ pillars
+            frames = nara_proto.fragment(str(msg).encode(), self.frag_id)
+            if len(frames) > 1:
+                self.frag_id = (self.frag_id + 1) & 0xFF
+            for frame in frames:
+                self.peers.send(target, frame)
             if config["debug"]:
                 print(f"> {msg}")
         except Exception as e:
@@ -148,19 +223,125 @@ class SlaveNode:
         failed_macs = []
         start_tick = time.ticks_ms()
 
-        for cid in target_cids:
-            nled = NLED(cid)
-            success = False
-            if await nled.connect(timeout):
-                success = await nled.write(cmd, repeat)
-                await nled.disconnect()
+        async with self.ble_lock:
+            for cid in target_cids:
+                nled = NLED(cid)
+                success = False
+                if await nled.connect(timeout):
+                    success = await nled.write(cmd, repeat)
+                    await nled.disconnect()
 
-            if not success:
-                failed_macs.append(cid)
-            wdt.feed()
+                if not success:
+                    failed_macs.append(cid)
+                wdt.feed()
 
         return failed_macs
 
+    async def arm(self, cue, cmd, target_cids, timeout=3500):
+        # ARM: connect up to max_conn - 1 pillars ahead of time so FIRE only
+        # writes; the last link stays free for cmd_cids sweeps while the cue
+        # waits. Pillars past the limit stay staged and are swept when it fires.
+        # Returns (failed, armed/staged so far) - big fan-outs arm over several frames.
+        c = self.cue
+        if not c or c["id"] != cue:
+            await self.disarm()
+            try:
+                payload = binascii.unhexlify(nara_cmd.MELK.get(cmd.upper(), cmd))
+            except:
+                return list(target_cids), "0/0"
+            c = {"id": cue, "payload": payload, "leds": [], "t": time.time()}
+        leds, failed = c["leds"], []
+        armed = sum(1 for n in leds if n.connection)
+        async with self.ble_lock:
+            for cid in target_cids:
+                nled = NLED(cid)
+                if armed < config["max_conn"] - 1:
+                    if await nled.connect(timeout):
+                        armed += 1
+                    else:
+                        failed.append(cid)
+                leds.append(nled)
+                wdt.feed()
+        self.cue = c
+        return failed, f"{armed}/{len(leds)}"
+
+    async def disarm(self):
+        c, self.cue = self.cue, None
+        if c:
+            for nled in c["leds"]:
+                await nled.disconnect()
+
+    async def fire(self, cue, tag, at=0):
+        c = self.cue
+        if not c or c["id"] != cue:
+            return
+        self.cue = None
+        if at:
+            await asyncio.sleep(max(0, at - self.clock.now()) / 1000)
+        # Armed pillars first, all writes in flight together
+        live = [n for n in c["leds"] if n.connection]
+        sent = await asyncio.gather(*(n.send(c["payload"]) for n in live))
+        failed = []
+        async with self.ble_lock:
+            for nled, ok in zip(live, sent):
+                await nled.disconnect()
+                if not ok:
+                    failed.append(nled)
+            # Then the staged rest (and dropped links) the slow way
+            for nled in [n for n in c["leds"] if n not in live] + failed:
+                ok = await nled.connect(3500) and await nled.send(c["payload"])
+                await nled.disconnect()
+                if ok and nled in failed:
+                    failed.remove(nled)
+                elif not ok and nled not in failed:
+                    failed.append(nled)
+                wdt.feed()
+        fl = ";".join(n.cid[-4:] for n in failed)
+        resp = "OK" if not failed else "NG"
+        self.send_msg(f"RESP,{config['sid']},FIRE,{resp},{tag},{fl}")
+
+    async def hold_sync(self):
+        # Execute-at is master time: wait for the first TS sample (asked for
+        # every second after boot) rather than run it early
+        t0 = time.ticks_ms()
+        while not self.clock.synced:
+            if time.ticks_diff(time.ticks_ms(), t0) > config["sync_hold"]:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def fire_at(self, cue, tag, at):
+        if await self.hold_sync():
+            await self.fire(cue, tag, self.clock.to_local(at))
+        elif self.cue and self.cue["id"] == cue:
+            fl = ";".join(n.cid[-4:] for n in self.cue["leds"])
+            await self.disarm()
+            self.send_msg(f"RESP,{config['sid']},FIRE,NG,{tag},{fl},unsynced")
+
+    async def run_at(self, rcmd, targets, unknown, tag, at):
+        if await self.hold_sync():
+            await self.run_cmd(rcmd, targets, unknown, tag, self.clock.to_local(at))
+        else:
+            fl = ";".join(f[-4:] for f in unknown + targets)
+            self.send_msg(f"RESP,{config['sid']},{rcmd},NG,{tag},{fl},unsynced")
+
+    async def run_cmd(self, rcmd, targets, unknown, tag, at=0):
+        self.backlog += 1
+        try:
+            if at:
+                # Pre-staged: wait for the local time matching the master's execute-at
+                await asyncio.sleep(max(0, at - self.clock.now()) / 1000)
+            failed = unknown + await self.cmd_cids(rcmd, targets)
+        finally:
+            self.backlog -= 1
+        resp = "OK" if not failed else "NG"
+        if tag:
+            # Tagged by the master's completion tracker: echo tag + failed pillars
+            fl = ";".join(f[-4:] for f in failed)
+            self.send_msg(f"RESP,{config['sid']},{rcmd},{resp},{tag},{fl}")
+        else:
+            self.send_msg(f"RESP,{config['sid']},{rcmd},{resp}")
+
     async def handle_nara_cmd(self, cmd, parts, msg, peer):
         if msg.startswith("NARAINIT"):
             # Pairing
@@ -172,7 +353,8 @@ class SlaveNode:
             machine.reset()
         elif cmd == "NARA":
             bat = adc.read_uv() / 1000000 * 2
-            sm = f"S:{config['sid']},B:{bat:.2f},V:{VER}"
+            ck = self.clock
+            sm = f"S:{config['sid']},B:{bat:.2f},V:{VER},R:{ck.rtt},D:{ck.drift * 1e6:.1f}"
             self.send_msg(f"NARA,OK,{sm}", peer)
 
     async def handle_scan_cmd(self, cmd, parts):
@@ -241,6 +423,181 @@ class SlaveNode:
         elif cmd == "SDIR":
             self.send_msg(f"SDIR,{os.listdir()}")
 
+    # --- File Transfer ---
+    def fx_ack(self):
+        fx = self.fx
+        fx["count"] = 0
+        have = binascii.hexlify(fx["have"]).decode()
+        write_json_file(
+            FX_STATE,
+            {"name": fx["name"], "size": fx["size"], "crc": fx["crc"], "have": have},
+        )
+        self.send_msg(f"FX,ACK,{fx['sess']},{have}")
+
+    def fx_close(self):
+        if self.fx:
+            try:
+                self.fx["f"].close()
+            except:
+                pass
+        self.fx = None
+
+    def fx_start(self, parts):
+        # FX,START,sess,size,crc,name[,flags] - resumes the .part file if fx.json matches.
+        # M(ulticast): chunks arrive by broadcast and are only acked on FX,POLL.
+        # D(elta): the payload is a delta against the current file.
+        sess, size, crc, name = int(parts[2]), int(parts[3]), parts[4], parts[5]
+        if self.fx and self.fx["sess"] == sess:
+            self.fx_ack()
+            return
+        self.fx_close()
+        n = nara_proto.fx_chunks(size)
+        part = name + ".part"
+        st = read_json_file(FX_STATE)
+        have = None
+        if st.get("name") == name and st.get("size") == size and st.get("crc") == crc:
+            try:
+                have = bytearray(binascii.unhexlify(st["have"]))
+                f = open(part, "r+b")
+            except:
+                have = None
+        if have is None:
+            have = nara_proto.bitmap(n)
+            with open(part, "wb") as f:
+                zero = bytes(1024)
+                for _ in range(size // 1024):
+                    f.write(zero)
+                f.write(bytes(size % 1024))
+            f = open(part, "r+b")
+        self.fx = {
+            "sess": sess,
+            "name": name,
+            "size": size,
+            "crc": crc,
+            "n": n,
+            "have": have,
+            "got": nara_proto.bit_count(have, n),
+            "f": f,
+            "count": 0,
+            "quiet": len(parts) > 6 and "M" in parts[6],
+            "delta": len(parts) > 6 and "D" in parts[6],
+        }
+        self.fx_ack()
+
+    def fx_data(self, frame):
+        fx = self.fx
+        sess, seq, chunk = nara_proto.fx_parse(frame)
+        if fx is None or sess != fx["sess"] or seq >= fx["n"]:
+            return
+        if nara_proto.bit_get(fx["have"], seq):
+            if not fx["quiet"]:
+                self.fx_ack()  # a resend means our last ACK was lost
+            return
+        fx["f"].seek(seq * nara_proto.FX_CHUNK)
+        fx["f"].write(chunk)
+        nara_proto.bit_set(fx["have"], seq)
+        fx["got"] += 1
+        fx["count"] += 1
+        if fx["quiet"]:
+            return
+        if fx["count"] >= FX_ACK_EVERY or seq == fx["n"] - 1 or fx["got"] == fx["n"]:
+            self.fx_ack()
+
+    def fx_swap(self, src, name):
+        # Swap in the verified file, keeping the previous one as .bak
+        try:
+            os.remove(name + ".bak")
+        except:
+            pass
+        try:
+            os.rename(name, name + ".bak")
+        except:
+            pass
+        os.rename(src, name)
+
+    def fx_patch(self, name, part):
+        # Rebuild name from the received delta into .new, verify, then swap
+        new = name + ".new"
+        try:
+            with open(part, "rb") as f:
+                delta = f.read()
+            with open(name, "rb") as base, open(new, "wb") as out:
+                size, crc = nara_proto.delta_apply(delta, base, out)
+            with open(new, "rb") as f:
+                ok = nara_proto.file_crc(f) == (size, crc)
+        except ValueError as e:
+            ok = str(e)
+        except OSError:
+            ok = "base"  # no base file at all
+        os.remove(part)
+        if ok is True:
+            self.fx_swap(new, name)
+            return "OK"
+        try:
+            os.remove(new)
+        except:
+            pass
+        return "BASE" if ok == "base" else "NG"
+
+    def fx_hash(self, sess, name):
+        try:
+            with open(name, "rb") as f:
+                have = f"{nara_proto.file_crc(f)[1]:08x}"
+        except OSError:
+            have = "-"
+        self.send_msg(f"FX,HASH,{sess},{have}")
+
+    async def fx_end(self, sess):
+        if self.fx_done and self.fx_done[0] == sess:
+            self.send_msg(f"FX,DONE,{sess},{self.fx_done[1]}")
+            return
+        fx = self.fx
+        if fx is None or fx["sess"] != sess:
+            self.send_msg(f"FX,NOSESS,{sess}")
+            return
+        self.fx_close()
+        name = fx["name"]
+        part = name + ".part"
+        with open(part, "rb") as f:
+            crc = nara_proto.file_crc(f)[1]
+        try:
+            os.remove(FX_STATE)
+        except:
+            pass
+        if f"{crc:08x}" != fx["crc"]:
+            os.remove(part)
+            result = "NG"
+        elif fx["delta"]:
+            result = self.fx_patch(name, part)
+        else:
+            self.fx_swap(part, name)
+            result = "OK"
+        self.fx_done = (sess, result)
+        self.send_msg(f"FX,DONE,{sess},{result}")
+        if result == "OK":
+            if name == CIDS_FILE:
+                self.load_state()
+            elif name.endswith(".py"):
+                await asyncio.sleep(1)
+                machine.reset()
+
+    async def handle_fx_cmd(self, parts):
+        sub = parts[1] if len(parts) > 1 else ""
+        try:
+            if sub == "HASH":
+                self.fx_hash(parts[2], parts[3])
+            elif sub == "START":
+                self.fx_start(parts)
+            elif sub == "END":
+                await self.fx_end(int(parts[2]))
+            elif sub == "POLL":
+                if self.fx and self.fx["sess"] == int(parts[2]):
+                    self.fx_ack()
+                else:
+                    self.send_msg(f"FX,NOSESS,{parts[2]}")
+        except Exception as e:
+            self.send_msg(f"FX,ERR,{e}")
+
     async def handle_msg(self, mac, msg_bytes):
         # Security: Allow NARAINIT from anyone (for pairing), else strict check
         msg = msg_bytes.decode()
@@ -259,6 +616,27 @@ class SlaveNode:
             print(f"Recv: {msg}")
 
         # Dispatch
+        if cmd == "FX":
+            await self.handle_fx_cmd(parts)
+            return
+        if cmd == "TS" and len(parts) > 2:
+            # TS,t1,t2: reply to our sync request
+            self.clock.update(int(parts[1]), int(parts[2]), self.clock.now())
+            self.sync_wait = False
+            return
+        if cmd == "FIRE" and len(parts) > 2:
+            # FIRE,cue,tag[,at]: one broadcast frame releases an armed cue
+            at = int(parts[3]) if len(parts) > 3 and parts[3] else 0
+            if at:
+                asyncio.create_task(self.fire_at(parts[1], parts[2], at))
+            else:
+                await self.fire(parts[1], parts[2])
+            return
+        if cmd == "DISARM":
+            if self.cue and (len(parts) < 2 or parts[1] in ("", self.cue["id"])):
+                await self.disarm()
+            return
+
         # 1. Pipe-delimited format (New Master)
         if "|" in msg:
             pp = msg.split("|")
@@ -269,11 +647,14 @@ class SlaveNode:
                     pp[2],
                     (pp[3] if len(pp) > 3 else ""),
                 )
+                tag = pp[4] if len(pp) > 4 else ""
+                at = int(pp[5]) if len(pp) > 5 and pp[5] else 0
 
                 # Filter by Target/TID
                 if target == "GLOBAL" or tid == str(config["sid"]) or tid == "all":
                     # Execute
                     targets = self.cids
+                    unknown = []
                     if target == "PID" and pmac:
                         # Specific PID
                         # pmac might be full or suffix.
@@ -281,10 +662,29 @@ class SlaveNode:
                         if len(full_mac) < 12 and len(full_mac) == 8:
                             full_mac = "be28" + full_mac
                         targets = [full_mac]
-
-                    failed = await self.cmd_cids(rcmd, targets)
-                    resp = "OK" if not failed else "NG"
-                    self.send_msg(f"RESP,{config['sid']},{rcmd},{resp}")
+                    elif target == "SUB" and pmac:
+                        # Batch from the master's fan-out planner: 4-char suffixes
+                        suffixes = pmac.split(",")
+                        targets = [self.p4dict[p] for p in suffixes if p in self.p4dict]
+                        unknown = [p for p in suffixes if p not in self.p4dict]
+                    elif target == "SUBM" and pmac:
+                        # Covering for a dead slave: full MACs, not in our p4dict
+                        targets = pmac.split(",")
+
+                    if rcmd.startswith("ARM:"):
+                        # ARM:<cmd>, the tag doubles as the cue id for FIRE
+                        failed, armed = await self.arm(tag, rcmd[4:], targets)
+                        failed = unknown + failed
+                        resp = "OK" if not failed else "NG"
+                        fl = ";".join(f[-4:] for f in failed)
+                        self.send_msg(
+                            f"RESP,{config['sid']},ARM,{resp},{tag},{fl},{armed}"
+                        )
+                    elif at:
+                        # Execute-at (master clock): keep receiving while it waits
+                        asyncio.create_task(self.run_at(rcmd, targets, unknown, tag, at))
+                    else:
+                        await self.run_cmd(rcmd, targets, unknown, tag)
             return
 
         # 2. Legacy/Direct Command format (Comma separated or raw)
@@ -375,25 +775,127 @@ class SlaveNode:
             machine.reset()
         elif cmd == "STAT":
             bat = adc.read_uv() / 1000000 * 2
-            self.send_msg(f"STAT,{config['sid']},{bat:.2f}V")
+            self.send_msg(f"STAT,{config['sid']},{bat:.2f}V,{self.backlog}")
+
+    def lt_rx(self, msg):
+        # LINKTEST frames skip handle_msg: echoes go straight back, floods are
+        # counted in place (see master.py for the frame formats)
+        p = bytes(msg).split(b",", 5)
+        if len(p) < 3:
+            return
+        kind, run = p[1], int(p[2])
+        t = self.lt
+        if not t or t["run"] != run:
+            try:
+                drops = self.esp.stats()[4]
+            except:
+                drops = 0
+            t = self.lt = {"run": run, "n": 0, "recv": 0, "max": -1, "reorder": 0, "dup": 0, "drop0": drops}
+            t["t0"] = time.ticks_ms()
+        t["t1"] = time.ticks_ms()
+        if kind == b"E":
+            self.peers.send(self.master_mac, b"LT,R" + msg[4:], False)
+        elif kind == b"F" and len(p) > 4:
+            seq, n = int(p[3]), int(p[4])
+            if not t["n"]:
+                t["n"], t["seen"], t["t0"] = n, nara_proto.bitmap(n), t["t1"]
+            if seq >= t["n"]:
+                return
+            if nara_proto.bit_get(t["seen"], seq):
+                t["dup"] += 1
+                return
+            nara_proto.bit_set(t["seen"], seq)
+            t["recv"] += 1
+            if seq < t["max"]:
+                t["reorder"] += 1
+            t["max"] = max(t["max"], seq)
+            t["last"] = t["t1"]
+        elif kind == b"Q":
+            try:
+                drops = self.esp.stats()[4] - t["drop0"]
+            except:
+                drops = 0
+            span = time.ticks_diff(t.get("last", t["t0"]), t["t0"])
+            self.peers.send(
+                self.master_mac,
+                f"LT,S,{run},{t['recv']},{t['reorder']},{t['dup']},{span},{drops}",
+                False,
+            )
+        elif kind == b"U" and len(p) > 5 and not t.get("up"):
+            t["up"] = True
+            asyncio.create_task(self.lt_flood(run, int(p[3]), int(p[4]), int(p[5])))
+
+    async def lt_flood(self, run, n, size, gap):
+        sent = fail = 0
+        for seq in range(n):
+            try:
+                self.peers.send(self.master_mac, nara_proto.pad(f"LT,D,{run},{seq},{n}", size), False)
+                sent += 1
+            except OSError:
+                fail += 1
+            if gap:
+                await asyncio.sleep(gap / 1000)
+            elif seq % 8 == 7:
+                await asyncio.sleep(0)
+        for _ in range(3):
+            self.peers.send(self.master_mac, f"LT,X,{run},{sent},{fail}", False)
+            await asyncio.sleep(0.05)
+
+    async def beacon(self):
+        # Own task so long BLE sweeps in the receive loop do not look like a dead slave
+        while True:
+            try:
+                self.peers.send(self.master_mac, f"HB,{self.backlog}", False)
+            except:
+                pass
+            await asyncio.sleep(config["hb_s"])
 
     async def run(self):
         print(f"Slave {config['sid']} ({VER}) on CH {config['ch']}")
+        asyncio.create_task(self.beacon())
         last_hbeat = 0
+        last_sync = 0
+        t0 = time.time()
         while True:
-            if self.esp.any():
+            while self.esp.any():
                 mac, msg = self.esp.recv()
                 if mac:
-                    await self.handle_msg(mac, msg)
+                    msg = self.rx.feed(mac, msg)
+                    if msg and msg[0] == nara_proto.FX_DATA:
+                        # Raw file chunks skip decode/dispatch
+                        if mac == self.master_mac:
+                            self.fx_data(msg)
+                    elif msg and msg[:3] == b"LT,":
+                        if mac == self.master_mac:
+                            self.lt_rx(msg)
+                    elif msg:
+                        await self.handle_msg(mac, msg)
 
             if time.time() - last_hbeat > 60:
                 last_hbeat = time.time()
                 wdt.feed()
                 bat = adc.read_uv() / 1000000 * 2
-                self.esp.send(self.master_mac, f"status,{config['sid']},{bat:.2f}V")
+                # Sent right after boot too: the uptime lets the master spot a reset
+                self.peers.send(
+                    self.master_mac,
+                    f"status,{config['sid']},{bat:.2f}V,{self.backlog},{time.time() - t0}",
+                )
                 gc.collect()
 
-            await asyncio.sleep(0.05)
+            if self.lt and time.ticks_diff(time.ticks_ms(), self.lt["t1"]) > 5000:
+                self.lt = None
+
+            if self.cue and time.time() - self.cue["t"] > config["arm_s"]:
+                await self.disarm()
+
+            sync_s = 1 if len(self.clock.samples) < SYNC_FAST else config["sync_s"]
+            if time.time() - last_sync >= sync_s:
+                last_sync = time.time()
+                self.sync_wait = True
+                self.peers.send(self.master_mac, f"TS,{self.clock.now()}")
+
+            # Poll faster while a transfer or link test streams in, or a TS reply is due
+            await asyncio.sleep(0.002 if self.fx or self.lt or self.sync_wait else 0.05)
 
 
 async def main():
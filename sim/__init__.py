@@ -0,0 +1,6 @@
+# Host-side simulation of the NARA fleet: runs the unmodified master/slave
+# firmware under CPython with shims for the MicroPython hardware modules.
+from .host import Host, Node
+from .medium import Air
+from .ble import BleWorld, Pillar
+from .broker import Broker
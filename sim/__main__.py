@@ -0,0 +1,102 @@
+# python -m sim: master plus the slaves from firmware/master/msids.json, with
+# pillars from members.json. Prints what the master publishes.
+#
+#   python -m sim --slaves 4 --seconds 20 \
+#       --send 'nara/group/GA={"cmd": "RED"}' --send '5:nara/master/global={"cmd": "OFF"}'
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from . import vtime
+from .host import FIRMWARE_DIR, Host
+
+
+def fleet(host, n_slaves):
+    with open(os.path.join(FIRMWARE_DIR, "master", "msids.json")) as f:
+        sids = json.load(f)["sids"]
+    with open(os.path.join(FIRMWARE_DIR, "master", "members.json")) as f:
+        pids = json.load(f)["pids"]
+    host.add_master()
+    for mac, sid in list(sids.items())[:n_slaves]:
+        cids = ["a900" + e[1] for e in pids.values() if e[0] == sid]
+        host.add_slave(f"s{sid}", sid, mac, cids)
+
+
+def parse_send(spec):
+    # [seconds:]topic=json
+    at = 2.0
+    head, payload = spec.split("=", 1)
+    if ":" in head:
+        at, head = head.split(":", 1)
+    return float(at), head, json.loads(payload)
+
+
+async def drive(host, args):
+    # Start the fleet, play the --send commands (and stdin lines), print --watch
+    t0 = host.clock.monotonic()
+    host.on(args.watch, lambda topic, payload: print(f"{host.clock.monotonic() - t0:9.3f} {topic} {payload.decode()}"))
+    host.start()
+    if getattr(args, "stdin", False):
+        host.loop.add_reader(sys.stdin, read_stdin, host)
+    for at, topic, payload in sorted(parse_send(s) for s in args.send):
+        await asyncio.sleep(max(0, at - (host.clock.monotonic() - t0)))
+        print(f"{host.clock.monotonic() - t0:9.3f} >> {topic} {json.dumps(payload)}")
+        host.publish(topic, payload)
+    await asyncio.sleep(max(0, args.seconds - (host.clock.monotonic() - t0)))
+    await host.stop()
+    host.close()
+
+
+def read_stdin(host):
+    # topic={json}, as typed on stdin
+    line = sys.stdin.readline()
+    if not line:
+        host.loop.remove_reader(sys.stdin)
+        return
+    try:
+        topic, payload = line.strip().split("=", 1)
+        host.publish(topic.strip(), json.loads(payload))
+    except ValueError:
+        if line.strip():
+            print("expected topic={json}")
+
+
+def launch(run, args):
+    # Virtual time unless someone is going to type at it
+    if args.realtime or args.stdin:
+        asyncio.run(run(args))
+    else:
+        vtime.run(run(args))
+
+
+def add_args(ap):
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--send", action="append", default=[], help="[seconds:]topic=json command")
+    ap.add_argument("--stdin", action="store_true", help="also read topic=json commands from stdin (implies --realtime)")
+    ap.add_argument("--realtime", action="store_true", help="run on the wall clock instead of virtual time")
+    ap.add_argument("--watch", default="nara/master/#", help="topic filter to print")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show firmware prints")
+
+
+async def run(args):
+    host = Host(seed=args.seed, verbose=args.verbose)
+    host.air.loss = args.loss
+    host.ble.fail = args.ble_fail
+    fleet(host, args.slaves)
+    await drive(host, args)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim", description="Run the NARA firmware on the host")
+    ap.add_argument("--slaves", type=int, default=3)
+    ap.add_argument("--loss", type=float, default=0.0, help="ESP-NOW loss per transmit attempt")
+    ap.add_argument("--ble-fail", type=float, default=0.02, help="BLE connect failure rate")
+    add_args(ap)
+    launch(run, ap.parse_args())
+
+
+if __name__ == "__main__":
+    main()
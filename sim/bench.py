@@ -0,0 +1,301 @@
+# End-to-end command latency benchmark on the virtual hall.
+#
+# Each scenario publishes a dashboard command and follows it through the
+# taps of the broker, the air and the BLE world until the master reports on
+# nara/master/result. The hops are:
+#   mqtt    broker publish -> master takes it (mqtt_callback)
+#   master  mqtt_callback -> first command frame on the air
+#   down    first frame on the air -> arrival at each slave
+#   ble     arrival at the slave -> its first pillar write
+#   sweep   first -> last pillar write on a slave
+#   resp    last pillar write -> the slave's RESP on the air
+#   up      RESP on the air -> arrival at the master
+#   report  last RESP arrival -> result published
+# plus e2e per pillar (publish -> write), e2e per command (publish -> result),
+# pillars/s and the share of targeted pillars never written.
+#
+#   python -m sim.bench --out bench.json                   # compare with the baseline
+#   python -m sim.bench --update-baseline                  # after an intended change
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from . import vtime
+from .hall import build
+from .host import Host
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+HOPS = ("mqtt", "master", "down", "ble", "sweep", "resp", "up", "report")
+CMD = "RED"
+CMD_HEX = "7e000503ff0000"  # nara_cmd.MELK["RED"], what the master reports
+
+
+def stats(values):
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+
+    def pct(p):
+        return v[min(len(v) - 1, int(p * len(v)))]
+
+    return {
+        "n": len(v),
+        "mean": round(sum(v) / len(v), 1),
+        "p50": round(pct(0.5), 1),
+        "p90": round(pct(0.9), 1),
+        "p99": round(pct(0.99), 1),
+        "max": round(v[-1], 1),
+    }
+
+
+class Probe:
+    # Collects tap events for the command in flight; times are ms since publish
+    def __init__(self, host, hall):
+        self.host = host
+        self.master = host.nodes["master"].mac
+        self.sid_of = {node.mac: sid for sid, node in ((s, host.nodes[f"s{s}"]) for s, _ in hall.slaves)}
+        self.pid_of = {p.mac: pid for pid, p in hall.pillars.items()}
+        self.t0 = None
+        host.broker.taps.append(self.on_mqtt)
+        host.air.taps.append(self.on_air)
+        host.ble.taps.append(self.on_write)
+        host.on("nara/master/result", self.on_result)
+
+    def begin(self):
+        self.t0 = self.host.clock.monotonic()
+        self.taken = None
+        self.first_tx = None
+        self.down = {}  # sid: command frame arrival
+        self.writes = {}  # sid: [write times]
+        self.pillars = set()
+        self.resp = {}  # sid: (tx, arrival)
+        self.result = None
+
+    def ms(self, t):
+        return (t - self.t0) * 1000
+
+    def on_mqtt(self, t, client, topic, payload):
+        if self.t0 is not None and self.taken is None and client.startswith("NaraMaster"):
+            self.taken = self.ms(t)
+
+    def on_air(self, t, src, dst, data, at):
+        if self.t0 is None:
+            return
+        if src == self.master and b"|" in data and not data.startswith(b"TS"):
+            if self.first_tx is None:
+                self.first_tx = self.ms(t)
+            sid = self.sid_of.get(dst)
+            if at is not None and sid is not None and sid not in self.down:
+                self.down[sid] = self.ms(at)
+        elif dst == self.master and data.startswith(b"RESP,") and at is not None:
+            sid = self.sid_of.get(src)
+            if sid is not None and sid not in self.resp:
+                self.resp[sid] = (self.ms(t), self.ms(at))
+
+    def on_write(self, t, node, pillar, payload):
+        if self.t0 is None:
+            return
+        sid = int(node.lstrip("s"))
+        self.writes.setdefault(sid, []).append(self.ms(t))
+        self.pillars.add(self.pid_of[pillar.mac])
+
+    def on_result(self, topic, payload):
+        if self.t0 is None or self.result is not None:
+            return
+        try:
+            report = json.loads(payload)
+        except ValueError:
+            return
+        if report.get("cmd") == CMD_HEX:
+            self.result = (self.ms(self.host.clock.monotonic()), report)
+
+    def hops(self):
+        h = {k: [] for k in HOPS}
+        if self.taken is not None:
+            h["mqtt"].append(self.taken)
+            if self.first_tx is not None:
+                h["master"].append(self.first_tx - self.taken)
+        for sid, rx in self.down.items():
+            if self.first_tx is not None:
+                h["down"].append(rx - self.first_tx)
+            w = self.writes.get(sid)
+            if w:
+                h["ble"].append(w[0] - rx)
+                h["sweep"].append(w[-1] - w[0])
+                if sid in self.resp:
+                    h["resp"].append(self.resp[sid][0] - w[-1])
+            if sid in self.resp:
+                h["up"].append(self.resp[sid][1] - self.resp[sid][0])
+        if self.result and self.resp:
+            h["report"].append(self.result[0] - max(r[1] for r in self.resp.values()))
+        return h
+
+
+def scenarios(hall, rng):
+    # name -> factory of (topic, payload, targeted PIDs) per run
+    m = hall.members
+    by_sid = {}
+    for pid, entry in m["pids"].items():
+        by_sid.setdefault(entry[0], []).append(pid)
+    groups = sorted(m["groups"])
+    sids = sorted(by_sid)
+
+    def pid():
+        p = rng.choice(sorted(m["pids"]))
+        return "nara/slave/pid", {"target": "PID", "id": p, "cmd": CMD}, [p]
+
+    def slave():
+        s = rng.choice(sids)
+        return f"nara/slave/{s}", {"target": "Slave", "id": str(s), "cmd": CMD}, by_sid[s]
+
+    def group():
+        g = rng.choice(groups)
+        return f"nara/group/{g}", {"cmd": CMD}, m["groups"][g]
+
+    def glob():
+        return "nara/master/global", {"cmd": CMD}, list(m["pids"])
+
+    return {"pid": pid, "slave": slave, "group": group, "global": glob}
+
+
+async def bench(args):
+    host = Host(seed=args.seed)
+    hall = build(host, args.slaves, args.loss)
+    probe = Probe(host, hall)
+    rng = random.Random(f"{args.seed}/bench")
+    plans = scenarios(hall, rng)
+    runs = {"pid": args.runs, "slave": args.runs, "group": args.runs, "global": max(1, args.runs // 2)}
+    host.start()
+    await asyncio.sleep(args.warmup)  # boot, first status, time sync
+    out = {}
+    for name in args.scenarios:
+        agg = {"e2e_cmd": [], "e2e_pillar": [], "hops": {k: [] for k in HOPS}}
+        targeted = written = 0
+        busy = 0.0  # ms from publish to the last write, summed
+        incomplete = 0
+        for _ in range(runs[name]):
+            topic, payload, pids = plans[name]()
+            probe.begin()
+            host.publish(topic, payload)
+            while probe.result is None and host.clock.monotonic() - probe.t0 < args.timeout:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(args.settle)  # late writes and replies land in this run
+            t0 = probe.t0
+            hit = probe.pillars & set(pids)
+            targeted += len(pids)
+            written += len(hit)
+            for p in hit:
+                w = hall.pillars[p].writes
+                agg["e2e_pillar"].append((next(t for t, _, _ in w if t >= t0) - t0) * 1000)
+            if probe.writes:
+                busy += max(max(w) for w in probe.writes.values())
+            if probe.result:
+                agg["e2e_cmd"].append(probe.result[0])
+                if not probe.result[1].get("done"):
+                    incomplete += 1
+            else:
+                incomplete += 1
+            for k, v in probe.hops().items():
+                agg["hops"][k].extend(v)
+            probe.t0 = None
+        out[name] = {
+            "runs": runs[name],
+            "e2e_cmd": stats(agg["e2e_cmd"]),
+            "e2e_pillar": stats(agg["e2e_pillar"]),
+            "hops": {k: stats(v) for k, v in agg["hops"].items()},
+            "pillars_per_s": round(written / (busy / 1000), 2) if busy else 0.0,
+            "fail_rate": round(1 - written / targeted, 4) if targeted else 0.0,
+            "incomplete": incomplete,
+        }
+    await host.stop()
+    host.close()
+    return {
+        "meta": {
+            "seed": args.seed,
+            "runs": args.runs,
+            "slaves": len(hall.slaves),
+            "pillars": len(hall.rows),
+            "loss": args.loss,
+            "virtual_s": round(host.clock.monotonic(), 1),
+        },
+        "scenarios": out,
+    }
+
+
+def compare(result, baseline, tol):
+    # Worse than baseline by more than tol (relative, with a 5 ms floor) is a regression
+    flags = []
+    for name, cur in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for metric in ("e2e_cmd", "e2e_pillar"):
+            for p in ("p50", "p90"):
+                b, c = base[metric].get(p), cur[metric].get(p)
+                if b is not None and c is not None and c > b * (1 + tol) + 5:
+                    flags.append(f"{name} {metric} {p}: {b} -> {c} ms")
+        b, c = base["pillars_per_s"], cur["pillars_per_s"]
+        if c < b * (1 - tol):
+            flags.append(f"{name} pillars/s: {b} -> {c}")
+        b, c = base["fail_rate"], cur["fail_rate"]
+        if c > b + max(0.01, b * tol):
+            flags.append(f"{name} fail_rate: {b} -> {c}")
+    return flags
+
+
+def table(result):
+    lines = [f"{'scenario':8} {'e2e p50':>9} {'p90':>9} {'pillar p50':>10} {'p99':>9} {'pil/s':>7} {'fail':>6}"]
+    for name, s in result["scenarios"].items():
+        lines.append(
+            f"{name:8} {s['e2e_cmd'].get('p50', '-'):>9} {s['e2e_cmd'].get('p90', '-'):>9} "
+            f"{s['e2e_pillar'].get('p50', '-'):>10} {s['e2e_pillar'].get('p99', '-'):>9} "
+            f"{s['pillars_per_s']:>7} {s['fail_rate']:>6}"
+        )
+        hops = " ".join(f"{k}={v.get('p50', '-')}" for k, v in s["hops"].items())
+        lines.append(f"         hops p50 ms: {hops}")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim.bench", description="End-to-end command latency benchmark")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--runs", type=int, default=6, help="commands per scenario (global gets half)")
+    ap.add_argument("--scenarios", nargs="+", default=["pid", "slave", "group", "global"])
+    ap.add_argument("--slaves", type=int, default=None, help="first N slaves of the hall only")
+    ap.add_argument("--loss", type=float, default=0.02)
+    ap.add_argument("--warmup", type=float, default=10, help="virtual s before the first command")
+    ap.add_argument("--timeout", type=float, default=300, help="virtual s to wait for a result")
+    ap.add_argument("--settle", type=float, default=1, help="virtual s after each result")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.1, help="relative slack before flagging")
+    args = ap.parse_args()
+
+    result = vtime.run(bench(args))
+    print(table(result))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline written: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with")
+        return
+    with open(args.baseline) as f:
+        flags = compare(result, json.load(f), args.tolerance)
+    for line in flags:
+        print("REGRESSION", line)
+    if flags:
+        sys.exit(1)
+    print("no regressions against", os.path.relpath(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
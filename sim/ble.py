@@ -0,0 +1,99 @@
+# Virtual BLE world: MELK pillars the slaves connect to and write commands to.
+# Connect latency, failure rate and write time are per pillar with world-wide
+# defaults; a pillar takes one central at a time, like the real controllers.
+import asyncio
+
+
+class Pillar:
+    def __init__(self, mac, connect_ms=None, jitter_ms=None, fail=None, write_ms=None, name=None):
+        self.mac = bytes(mac)
+        self.name = name or "MELK-" + self.mac.hex()[-4:].upper()
+        self.connect_ms = connect_ms  # None: world default
+        self.jitter_ms = jitter_ms
+        self.fail = fail
+        self.write_ms = write_ms
+        self.online = True
+        self.reach = None  # names of nodes in range, None for all
+        self.owner = None  # node holding the connection
+        self.writes = []  # (clock time, node name, payload)
+        self.connects = 0
+        self.failures = 0
+
+
+class BleWorld:
+    def __init__(self, clock, rng, connect_ms=600, jitter_ms=400, fail=0.02, write_ms=15, max_conn=4):
+        self.clock = clock
+        self.rng = rng
+        self.connect_ms = connect_ms
+        self.jitter_ms = jitter_ms
+        self.fail = fail
+        self.write_ms = write_ms
+        self.max_conn = max_conn  # NimBLE central connections per node
+        self.pillars = {}  # mac: Pillar
+        self.taps = []  # f(time, node name, pillar, payload) per completed write
+        self.fault = None  # sim.faults.Injector: hung connects, links lost mid-write
+
+    def add(self, mac, **kw):
+        p = Pillar(mac, **kw)
+        self.pillars[p.mac] = p
+        return p
+
+    def _get(self, p, key):
+        v = getattr(p, key)
+        return getattr(self, key) if v is None else v
+
+    def visible(self, node):
+        return [
+            p
+            for p in self.pillars.values()
+            if p.online and p.owner is None and (p.reach is None or node.name in p.reach)
+        ]
+
+    async def connect(self, node, mac, timeout_ms):
+        if len(node.ble) >= self.max_conn:
+            raise OSError(12, "ENOMEM")
+        p = self.pillars.get(bytes(mac))
+        if (
+            p is None
+            or p not in self.visible(node)
+            or self.rng.random() < self._get(p, "fail")
+            or (self.fault and self.fault.ble_hang(node, p))
+        ):
+            # Nothing answers the connect request: the central waits it out
+            if p:
+                p.failures += 1
+            await asyncio.sleep(timeout_ms / 1000)
+            raise asyncio.TimeoutError
+        ms = self._get(p, "connect_ms") + self.rng.random() * self._get(p, "jitter_ms")
+        await asyncio.sleep(min(ms, timeout_ms) / 1000)
+        if ms > timeout_ms or p.owner is not None or not p.online:
+            p.failures += 1
+            raise asyncio.TimeoutError
+        p.owner = node
+        p.connects += 1
+        node.ble.add(p)
+        return p
+
+    def release(self, node, p):
+        if p.owner is node:
+            p.owner = None
+        node.ble.discard(p)
+
+    def release_all(self, node):
+        for p in list(node.ble):
+            self.release(node, p)
+
+    async def write(self, node, p, data):
+        ms = self._get(p, "write_ms")
+        if self.fault and p.owner is node and self.fault.ble_drop(node, p):
+            await asyncio.sleep(ms / 2000)
+            self.release(node, p)  # supervision timeout halfway through the write
+            return False
+        await asyncio.sleep(ms / 1000)
+        if p.owner is not node:
+            return False
+        now = self.clock.monotonic()
+        p.writes.append((now, node.name, bytes(data)))
+        for tap in self.taps:
+            tap(now, node.name, p, data)
+        return True
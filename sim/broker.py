@@ -0,0 +1,90 @@
+# In-process MQTT broker: topic wildcards, retained messages, outages.
+# Firmware clients (shims/umqtt) poll their inbox with check_msg; host code
+# subscribes with plain callbacks.
+import json
+
+
+def match(pattern, topic):
+    p, t = pattern.split("/"), topic.split("/")
+    for i, seg in enumerate(p):
+        if seg == "#":
+            return True
+        if i >= len(t) or (seg != "+" and seg != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def _text(v):
+    return v.decode() if isinstance(v, (bytes, bytearray)) else v
+
+
+class Broker:
+    def __init__(self, clock):
+        self.clock = clock
+        self.up = True
+        self.sessions = []  # firmware clients
+        self.subs = []  # (pattern, callback(topic, payload bytes)) from the host
+        self.taps = []  # f(time, client id, topic, payload) when a client takes a message
+        self.retained = {}
+        self.log = []  # (clock time, topic, payload bytes) while self.record
+        self.record = False
+
+    def set_up(self, flag):
+        # Going down drops every session; clients see OSError on their next call
+        self.up = bool(flag)
+        if not self.up:
+            self.drop()
+
+    def drop(self):
+        for c in self.sessions:
+            c._drop()
+        self.sessions = []
+
+    def connect(self, client):
+        if not self.up:
+            raise OSError(111, "ECONNREFUSED")
+        if client not in self.sessions:
+            self.sessions.append(client)
+
+    def disconnect(self, client):
+        if client in self.sessions:
+            self.sessions.remove(client)
+
+    def subscribe(self, client, pattern):
+        pattern = _text(pattern)
+        client._subs.append(pattern)
+        for topic, payload in self.retained.items():
+            if match(pattern, topic):
+                client._inbox.append((topic.encode(), payload))
+
+    def publish(self, topic, payload, retain=False):
+        topic = _text(topic)
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        payload = bytes(payload)
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        if self.record:
+            self.log.append((self.clock.monotonic(), topic, payload))
+        for c in self.sessions:
+            if any(match(p, topic) for p in c._subs):
+                c._inbox.append((topic.encode(), payload))
+        for pattern, cb in self.subs:
+            if match(pattern, topic):
+                cb(topic, payload)
+
+    def delivered(self, client, topic, payload):
+        for tap in self.taps:
+            tap(self.clock.monotonic(), client.client_id, _text(topic), payload)
+
+    def on(self, pattern, callback):
+        # Host-side subscription; retained matches are replayed at once
+        self.subs.append((pattern, callback))
+        for topic, payload in list(self.retained.items()):
+            if match(pattern, topic):
+                callback(topic, payload)
@@ -0,0 +1,43 @@
+# Host time source for the shims. One clock per Host; everything that reads
+# time (ticks, time.time, the radio and BLE models) goes through it.
+import asyncio
+import time
+
+VIRTUAL_EPOCH = 1767225600.0  # 2026-01-01 UTC, where virtual runs start
+
+
+class RealClock:
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+
+class VirtualClock:
+    # Advanced only by sim.vtime's loop when nothing is runnable, so a run is
+    # a pure function of its seed. Code takes no virtual time to execute.
+    def __init__(self, epoch=VIRTUAL_EPOCH):
+        self.now = 0.0
+        self.epoch = epoch
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    def sleep(self, secs):
+        # A blocking sleep stalls every node, just in virtual time
+        self.now += max(0.0, secs)
+
+
+def loop_clock():
+    # The running loop's clock under sim.vtime, the real one otherwise
+    try:
+        return getattr(asyncio.get_running_loop(), "clock", None) or RealClock()
+    except RuntimeError:
+        return RealClock()
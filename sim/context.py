@@ -0,0 +1,9 @@
+# Which firmware node the running code belongs to. Every node runs inside its
+# own contextvars.Context, so shims called from firmware can find their node.
+from contextvars import ContextVar
+
+current = ContextVar("sim_node")
+
+
+def node():
+    return current.get()
@@ -0,0 +1,381 @@
+# Fault injection for the virtual hall: a scenario file schedules faults on
+# the air, the BLE world, the broker, WiFi and single nodes, while a steady
+# command load runs. The report shows how throughput, command success and
+# latency degrade while each fault is on and how long the fleet takes to
+# complete a command again once it is off. Every random choice is drawn from
+# the seed, so a scenario replays exactly.
+#
+#   python -m sim.faults sim/scenarios/recovery.yaml --out faults.json
+#
+# Scenario (YAML or JSON):
+#   seed: 1                 # --seed overrides
+#   slaves: 6               # first N hall slaves, null for all
+#   loss: 0.02              # baseline ESP-NOW loss per attempt
+#   warmup: 10              # s before the load starts
+#   duration: 240           # s of load
+#   bucket: 10              # s per timeline row
+#   load: {every: 4, commands: [{topic: nara/group/GA, payload: {cmd: RED}}]}  # default: booth by booth
+#   faults:                 # at/for in s since boot; repeat/every for series
+#     - {kind: radio, at: 30, for: 20, nodes: [s1], loss: 0.3, drop: 0.05, dup: 0.05, reorder: 0.1, reorder_ms: 40}
+#     - {kind: ble, at: 60, for: 20, nodes: 2, timeout: 0.3, disconnect: 0.1}
+#     - {kind: broker, at: 90, for: 15}
+#     - {kind: wifi, at: 120, for: 10}
+#     - {kind: reboot, at: 140, nodes: [s2], cause: wdt, down: 5}
+#     - {kind: skew, at: 160, for: 30, nodes: [s3], offset_s: 2.5, drift_ppm: 300}
+# `nodes` is a list of node names or a count of slaves picked by the seed;
+# radio faults hit frames from or to those nodes, leaving it out means all.
+import argparse
+import asyncio
+import json
+import os
+import random
+
+try:
+    import yaml
+except ImportError:
+    yaml = None  # JSON scenarios only
+
+from . import vtime
+from .bench import stats
+from .hall import build
+from .host import Host
+
+KINDS = ("radio", "ble", "broker", "wifi", "reboot", "skew")
+
+
+def load(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError("PyYAML is needed for YAML scenarios")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand(faults, rng, slaves):
+    # -> one dict per occurrence, node names resolved, sorted by start
+    out = []
+    for i, f in enumerate(faults):
+        kind = f.get("kind")
+        if kind not in KINDS:
+            raise ValueError(f"fault {i}: unknown kind {kind!r}")
+        for k in range(int(f.get("repeat", 1))):
+            e = dict(f, id=i, at=float(f.get("at", 0)) + k * float(f.get("every", 0)))
+            nodes = f.get("nodes")
+            if isinstance(nodes, int):
+                nodes = sorted(rng.sample(slaves, min(nodes, len(slaves))), key=slaves.index)
+            e["nodes"] = list(nodes) if nodes is not None else None
+            if kind in ("reboot", "skew") and not e["nodes"]:
+                raise ValueError(f"fault {i}: {kind} needs nodes")
+            out.append(e)
+    return sorted(out, key=lambda e: e["at"])
+
+
+class Injector:
+    # Plugs into Air.fault and BleWorld.fault; broker, WiFi, reboots and skew
+    # are switched from a host task at their scheduled times
+    def __init__(self, host, faults, seed):
+        self.host = host
+        self.rng = random.Random(f"{seed}/faults")
+        self.macs = {n.mac: name for name, n in host.nodes.items()}
+        slaves = [name for name in host.nodes if name != "master"]
+        self.faults = expand(faults, self.rng, slaves)
+        self.active = []
+        self.log = []  # (clock time, "on"/"off", fault)
+        host.air.fault = self
+        host.ble.fault = self
+
+    def _hits(self, kind, *names):
+        return [f for f in self.active if f["kind"] == kind and (f["nodes"] is None or any(n in f["nodes"] for n in names))]
+
+    # --- Air ---
+    def loss(self, src, dst):
+        keep = 1.0
+        for f in self._hits("radio", self.macs.get(src), self.macs.get(dst)):
+            keep *= 1 - f.get("loss", 0)
+        return 1 - keep
+
+    def copies(self, src, dst):
+        # Extra delay in s per delivered copy: () drops the frame, (0.0,) passes it
+        out = [0.0]
+        for f in self._hits("radio", self.macs.get(src), self.macs.get(dst)):
+            if self.rng.random() < f.get("drop", 0):
+                return ()
+            if self.rng.random() < f.get("dup", 0):
+                out.append(0.0)
+            if self.rng.random() < f.get("reorder", 0):
+                out[0] = self.rng.uniform(0.001, f.get("reorder_ms", 30) / 1000)
+        return out
+
+    # --- BLE ---
+    def ble_hang(self, node, p):
+        return any(self.rng.random() < f.get("timeout", 0) for f in self._hits("ble", node.name))
+
+    def ble_drop(self, node, p):
+        return any(self.rng.random() < f.get("disconnect", 0) for f in self._hits("ble", node.name))
+
+    # --- schedule ---
+    async def run(self):
+        t0 = self.host.clock.monotonic()
+        ends = []  # (end, fault)
+        for f in self.faults:
+            await self._until(t0, f["at"], ends)
+            self.apply(f, True)
+            if f["kind"] == "reboot":
+                continue
+            if "for" in f:
+                ends.append((f["at"] + float(f["for"]), f))
+                ends.sort(key=lambda e: e[0])
+        await self._until(t0, None, ends)
+
+    async def _until(self, t0, at, ends):
+        # Switch off what ends before `at` (all of it for None), then wait for `at`
+        while ends and (at is None or ends[0][0] <= at):
+            end, f = ends.pop(0)
+            await asyncio.sleep(max(0.0, t0 + end - self.host.clock.monotonic()))
+            self.apply(f, False)
+        if at is not None:
+            await asyncio.sleep(max(0.0, t0 + at - self.host.clock.monotonic()))
+
+    def apply(self, f, on):
+        host, kind = self.host, f["kind"]
+        self.log.append((host.clock.monotonic(), "on" if on else "off", f))
+        if kind in ("radio", "ble"):
+            if on:
+                self.active.append(f)
+            else:
+                self.active.remove(f)
+        elif kind == "broker":
+            host.broker.set_up(not on)
+        elif kind == "wifi":
+            host.wifi_up = not on
+            if on:
+                host.broker.drop()  # sessions die with the link
+        elif kind == "reboot":
+            for name in f["nodes"]:
+                host.reboot(host.nodes[name], f.get("cause", "reset"), float(f.get("down", 0)))
+        elif kind == "skew":
+            sign = 1 if on else -1
+            for name in f["nodes"]:
+                node = host.nodes[name]
+                if on:
+                    f.setdefault("_ppm", {})[name] = node.drift * 1e6
+                ppm = f.get("drift_ppm")
+                node.skew(sign * f.get("offset_s", 0.0), None if ppm is None else (ppm if on else f["_ppm"][name]))
+        if host.verbose:
+            print(f"{host.clock.monotonic() - host.t0_mono:9.3f} [faults] {'on ' if on else 'off'} {describe(f)}")
+
+
+def describe(f):
+    keys = [k for k in f if k not in ("kind", "id", "at", "for", "nodes", "repeat", "every") and not k.startswith("_")]
+    nodes = ",".join(f["nodes"]) if f["nodes"] else "all"
+    return f"{f['kind']}#{f['id']} {nodes} " + " ".join(f"{k}={f[k]}" for k in keys)
+
+
+def target_id(topic, payload):
+    # The id the master puts in its result for this command
+    if topic == "nara/master/global":
+        return "ALL"
+    if topic.startswith("nara/group/"):
+        return topic.split("/")[2].upper()
+    tid = str(payload.get("id", "all")).upper()
+    return tid[1:] if payload.get("target", "").upper() == "SLAVE" and tid.startswith("S") else tid
+
+
+class Recorder:
+    # Commands as the master takes them, their results, pillar writes, live transitions
+    def __init__(self, host):
+        self.host = host
+        self.cmds = []  # {"t", "topic", "key", "taken", "result", "done"}
+        self.queue = {}  # key: commands taken and not yet reported, oldest first
+        self.writes = []
+        self.live = []  # (clock time, sid, state)
+        host.broker.taps.append(self.on_mqtt)
+        host.ble.taps.append(lambda t, node, pillar, payload: self.writes.append(t))
+        host.on("nara/master/result", self.on_result)
+        host.on("nara/master/live", self.on_live)
+
+    def send(self, topic, payload):
+        # payload: a dict, or the raw bytes of a recorded command
+        raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = {}
+        key = target_id(topic, data) if isinstance(data, dict) else None
+        self.cmds.append({"t": self.host.clock.monotonic(), "topic": topic, "raw": raw, "key": key, "taken": None, "result": None, "done": False})
+        self.host.publish(topic, raw)
+
+    def on_mqtt(self, t, client, topic, payload):
+        # Commands published while the master is offline never reach it
+        if not client.startswith("NaraMaster"):
+            return
+        for c in self.cmds:
+            if c["taken"] is None and c["topic"] == topic and c["raw"] == payload:
+                c["taken"] = t
+                self.queue.setdefault(c["key"], []).append(c)
+                return
+
+    def on_result(self, topic, payload):
+        try:
+            report = json.loads(payload)
+        except ValueError:
+            return
+        q = self.queue.get(str(report.get("id", "")).upper())
+        if q and "done" in report:
+            c = q.pop(0)
+            c["result"] = self.host.clock.monotonic()
+            c["done"] = bool(report["done"])
+
+    def on_live(self, topic, payload):
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            return
+        self.live.append((self.host.clock.monotonic(), msg.get("sid"), msg.get("state")))
+
+
+def window(rec, t0, t1):
+    # Throughput, success and latency for what happened in [t0, t1)
+    span = t1 - t0
+    cmds = [c for c in rec.cmds if t0 <= c["t"] < t1]
+    ok = [c for c in cmds if c["done"]]
+    return {
+        "cmds": len(cmds),
+        "ok": round(len(ok) / len(cmds), 3) if cmds else None,
+        "lost": sum(1 for c in cmds if c["taken"] is None),
+        "lat": stats([(c["result"] - c["t"]) * 1000 for c in ok]),
+        "writes_per_s": round(sum(1 for t in rec.writes if t0 <= t < t1) / span, 2) if span > 0 else None,
+        "suspect": sum(1 for t, _, s in rec.live if t0 <= t < t1 and s == "suspect"),
+        "dead": sum(1 for t, _, s in rec.live if t0 <= t < t1 and s == "dead"),
+    }
+
+
+async def scenario(scn, seed, verbose=False):
+    host = Host(seed=seed, verbose=verbose)
+    hall = build(host, scn.get("slaves"), scn.get("loss", 0.02))
+    inj = Injector(host, scn.get("faults", []), seed)
+    rec = Recorder(host)
+    warmup, duration = float(scn.get("warmup", 10)), float(scn.get("duration", 120))
+    load = scn.get("load", {})
+    # Default load: one booth after the other, which walks across every slave
+    commands = load.get("commands") or [{"topic": f"nara/group/{bid}", "payload": {"cmd": "RED"}} for bid in sorted(hall.members["booths"])]
+    host.start()
+    t0 = host.clock.monotonic()
+    host.spawn(inj.run())
+    await asyncio.sleep(warmup)
+    i = 0
+    while host.clock.monotonic() - t0 < warmup + duration:
+        c = commands[i % len(commands)]
+        rec.send(c["topic"], c["payload"])
+        i += 1
+        await asyncio.sleep(float(load.get("every", 4)))
+    await asyncio.sleep(float(scn.get("settle", 30)))  # let the last commands report
+    await host.stop()
+    host.close()
+
+    end = t0 + warmup + duration
+    spans = []
+    for f in inj.faults:
+        a = t0 + f["at"]
+        if f["kind"] == "reboot":
+            b = a + host.boot_s + float(f.get("down", 0))
+        else:
+            b = a + float(f.get("for", 0))
+        spans.append((f, a, b))
+    # Baseline: load time with no fault on
+    cuts = sorted([(a, b) for _, a, b in spans if b > a])
+    clean, cur, base = [], t0 + warmup, {"cmds": [], "writes": 0, "span": 0.0}
+    for a, b in cuts + [(end, end)]:
+        if a > cur:
+            clean.append((cur, min(a, end)))
+        cur = max(cur, b)
+    lat, ncmd, nok, nw, span = [], 0, 0, 0, 0.0
+    for a, b in clean:
+        w = [c for c in rec.cmds if a <= c["t"] < b]
+        ncmd += len(w)
+        nok += sum(1 for c in w if c["done"])
+        lat.extend((c["result"] - c["t"]) * 1000 for c in w if c["done"])
+        nw += sum(1 for t in rec.writes if a <= t < b)
+        span += b - a
+    faults = []
+    for f, a, b in spans:
+        after = [c for c in rec.cmds if c["t"] >= b and c["done"]]
+        faults.append(
+            {
+                "fault": describe(f),
+                "at": round(a - t0, 1),
+                "for": round(b - a, 1),
+                "during": window(rec, a, b),
+                "recovery_s": round(min(c["result"] for c in after) - b, 2) if after else None,
+            }
+        )
+    resets = {name: n.resets for name, n in host.nodes.items() if n.resets}
+    return {
+        "meta": {"seed": seed, "slaves": len(hall.slaves), "pillars": len(hall.rows), "virtual_s": round(host.clock.monotonic() - t0, 1)},
+        "baseline": {
+            "cmds": ncmd,
+            "ok": round(nok / ncmd, 3) if ncmd else None,
+            "lat": stats(lat),
+            "writes_per_s": round(nw / span, 2) if span else None,
+        },
+        "faults": faults,
+        "timeline": [
+            dict(t=round(a - t0), **window(rec, a, a + float(scn.get("bucket", 10))))
+            for a in frange(t0 + warmup, end, float(scn.get("bucket", 10)))
+        ],
+        "resets": resets,
+    }
+
+
+def frange(a, b, step):
+    while a < b:
+        yield a
+        a += step
+
+
+def table(result):
+    b = result["baseline"]
+    lines = [
+        f"baseline: {b['cmds']} cmds, ok {b['ok']}, p50 {b['lat'].get('p50', '-')} ms, {b['writes_per_s']} writes/s",
+        f"{'at':>6} {'for':>5} {'cmds':>5} {'ok':>6} {'lost':>4} {'p50':>8} {'p90':>8} {'wr/s':>7} {'dead':>4} {'recov s':>8}  fault",
+    ]
+    for f in result["faults"]:
+        d = f["during"]
+        lines.append(
+            f"{f['at']:>6} {f['for']:>5} {d['cmds']:>5} {str(d['ok']):>6} {d['lost']:>4} "
+            f"{d['lat'].get('p50', '-'):>8} {d['lat'].get('p90', '-'):>8} {str(d['writes_per_s']):>7} "
+            f"{d['dead']:>4} {str(f['recovery_s']):>8}  {f['fault']}"
+        )
+    if result["resets"]:
+        lines.append("resets: " + " ".join(f"{k}={v}" for k, v in result["resets"].items()))
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim.faults", description="Fault-injection run on the virtual hall")
+    ap.add_argument("scenario", help="YAML or JSON scenario file")
+    ap.add_argument("--seed", type=int, default=None, help="overrides the scenario seed")
+    ap.add_argument("--timeline", action="store_true", help="also print the per-bucket timeline")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print node output and fault switches")
+    args = ap.parse_args()
+
+    scn = load(args.scenario)
+    seed = args.seed if args.seed is not None else scn.get("seed", 0)
+    result = vtime.run(scenario(scn, seed, args.verbose))
+    result["meta"]["scenario"] = os.path.basename(args.scenario)
+    print(table(result))
+    if args.timeline:
+        for row in result["timeline"]:
+            print(
+                f"{row['t']:>6} cmds {row['cmds']:>3} ok {str(row['ok']):>5} p50 {row['lat'].get('p50', '-'):>8} "
+                f"wr/s {row['writes_per_s']:>6} suspect {row['suspect']} dead {row['dead']}"
+            )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
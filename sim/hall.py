@@ -0,0 +1,151 @@
+# Virtual hall from the provisioning CSVs: every slave in data/smacs.csv and
+# every pillar in data/pmacs.csv. Pillars listed in test_pids.csv keep their
+# slave/group/booth; the rest fill the slaves in PID order, a booth every
+# few pillars, groups dealt round-robin over the booths. msids.json,
+# members.json and each slave's cids.json are generated from that layout.
+#
+#   python -m sim.hall --seconds 60 --send '5:nara/group/GA={"cmd": "RED"}'
+import argparse
+import importlib.util
+import math
+import os
+import random
+
+from .__main__ import add_args, drive, launch
+from .host import ROOT, Host
+
+DATA_DIR = os.path.join(ROOT, "data")
+
+
+def provision():
+    # data/provision.py is a script, not a package
+    spec = importlib.util.spec_from_file_location("provision", os.path.join(DATA_DIR, "provision.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def sid_num(sid):
+    return int(str(sid).upper().lstrip("S"))
+
+
+def layout(prov, n_slaves=None, booth_size=4):
+    # -> [(sid, smac)], rows shaped like test_pids.csv (gid, sid, bid, pmac, pid)
+    slaves = sorted((sid_num(r["sid"]), r["smac"].lower()) for r in prov.load_csv(prov.SMACS_FILE))
+    slaves = slaves[:n_slaves] if n_slaves else slaves
+    known = {s for s, _ in slaves}
+    gids = [r["gid"].upper() for r in prov.load_csv(prov.TEST_GIDS_FILE)]
+    fixed = {}
+    for r in prov.load_csv(prov.TEST_PIDS_FILE):
+        if sid_num(r["sid"]) in known:
+            fixed[r["pmac"].replace(":", "").upper()] = r
+    rows = list(fixed.values())
+    count = {s: 0 for s, _ in slaves}
+    used = {s: set() for s, _ in slaves}  # pmac suffixes: slaves key pillars on the last 4 hex
+    for r in rows:
+        count[sid_num(r["sid"])] += 1
+        used[sid_num(r["sid"])].add(r["pmac"][-4:].lower())
+    pillars = sorted(prov.load_csv(prov.PMACS_FILE), key=lambda r: int(r["pid"].lstrip("P")))
+    order = [s for s, _ in slaves]
+    share, extra = divmod(len(pillars), len(order))
+    quota = {s: share + (i < extra) for i, s in enumerate(order)}
+    bid = 1 + max([int(r["bid"].lstrip("B")) for r in rows] or [0])
+    cur, booth, in_booth = 0, None, 0
+    for p in pillars:
+        pmac = p["pmac"].replace(":", "").upper()
+        if pmac in fixed:
+            continue
+        suffix = pmac[-4:].lower()
+        # Contiguous blocks per slave; a clashing suffix moves on to the next one with room
+        while count[order[cur]] >= quota[order[cur]] and cur < len(order) - 1:
+            cur += 1
+        free = [s for s in order[cur:] + order[:cur] if suffix not in used[s]]
+        if not free:
+            continue  # every slave already keys a pillar on this suffix: left out of the hall
+        # Over quota only when every slave with room already has this suffix
+        sid = next((s for s in free if count[s] < quota[s]), free[0])
+        if booth is None or in_booth >= booth_size or booth[1] != sid:
+            booth = (f"B{bid:03d}", sid)
+            bid += 1
+            in_booth = 0
+        in_booth += 1
+        count[sid] += 1
+        used[sid].add(suffix)
+        gid = gids[(int(booth[0][1:]) - 1) % len(gids)]
+        rows.append({"gid": gid, "sid": f"S{sid}", "bid": booth[0], "pmac": pmac, "pid": p["pid"].upper()})
+    return slaves, rows
+
+
+class Hall:
+    # The built fleet: host nodes plus PID -> sim Pillar for checking writes
+    def __init__(self, host, slaves, rows, members):
+        self.host = host
+        self.slaves = slaves
+        self.rows = rows
+        self.members = members
+        self.pillars = {r["pid"]: host.ble.pillars[bytes.fromhex(r["pmac"])] for r in rows}
+
+    def writes(self, since=0.0):
+        # PID: first write at or after host clock time `since`
+        out = {}
+        for pid, p in self.pillars.items():
+            for t, _, _ in p.writes:
+                if t >= since:
+                    out[pid] = t
+                    break
+        return out
+
+
+def build(host, n_slaves=None, loss=0.02, ble_ms=450, ble_spread=0.4, ble_fail=0.01, weak=0.05, booth_size=4, firmware=None):
+    # loss: mean ESP-NOW loss per attempt, spread over the slaves' links.
+    # BLE: each pillar's typical connect time is lognormal around ble_ms; a
+    # `weak` share of pillars (far, low battery) connect slower and fail more.
+    # firmware: a tree with master/master.py and slave/slave.py to run instead
+    prov = provision()
+    slaves, rows = layout(prov, n_slaves, booth_size)
+    members = prov.generate_members(rows)
+    rng = random.Random(f"{host.seed}/hall")
+    master_fw = os.path.join(firmware, "master", "master.py") if firmware else None
+    slave_fw = os.path.join(firmware, "slave", "slave.py") if firmware else None
+    host.add_master(files={"msids.json": {"sids": {mac: sid for sid, mac in slaves}}, "members.json": members}, firmware=master_fw)
+    master = host.nodes["master"].mac
+    sids = [s for s, _ in slaves]
+    for sid, mac in slaves:
+        cids = [r["pmac"].lower()[4:] for r in rows if sid_num(r["sid"]) == sid]
+        node = host.add_slave(f"s{sid}", sid, mac, cids, pillars=False, firmware=slave_fw, battery=round(rng.uniform(3.6, 4.1), 2))
+        link = loss * rng.uniform(0.5, 1.5)
+        host.air.link_loss[(master, node.mac)] = link
+        host.air.link_loss[(node.mac, master)] = link
+        i = sids.index(sid)
+        reach = {f"s{s}" for s in sids[max(0, i - 1) : i + 2]}  # own slave and its neighbours
+        for cid in cids:
+            slow = rng.random() < weak
+            p = host.ble.add(
+                bytes.fromhex("be28" + cid),
+                connect_ms=ble_ms * math.exp(rng.gauss(0, ble_spread)) * (2 if slow else 1),
+                jitter_ms=ble_ms * 0.5,
+                fail=0.15 if slow else ble_fail,
+            )
+            p.reach = reach
+    return Hall(host, slaves, rows, members)
+
+
+async def run(args):
+    host = Host(seed=args.seed, verbose=args.verbose)
+    hall = build(host, args.slaves, args.loss, args.ble_ms, ble_fail=args.ble_fail)
+    print(f"hall: {len(hall.slaves)} slaves, {len(hall.rows)} pillars, {len(hall.members['groups'])} groups, {len(hall.members['booths'])} booths")
+    await drive(host, args)
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim.hall", description="Run a full virtual hall")
+    ap.add_argument("--slaves", type=int, default=None, help="first N slaves only")
+    ap.add_argument("--loss", type=float, default=0.02, help="mean ESP-NOW loss per attempt")
+    ap.add_argument("--ble-ms", type=float, default=450, help="median BLE connect time")
+    ap.add_argument("--ble-fail", type=float, default=0.01, help="BLE connect failure rate")
+    add_args(ap)
+    launch(run, ap.parse_args())
+
+
+if __name__ == "__main__":
+    main()
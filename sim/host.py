@@ -0,0 +1,390 @@
+# Runs master.py / slave.py unmodified as nodes of one host process.
+#
+# Each node gets its own builtins: __import__ maps the MicroPython hardware
+# modules (and time/os/asyncio/gc) to sim.shims and loads firmware-local
+# modules (nara_proto, nara_cmd) per node, open() and os work inside the
+# node's own directory. Node code runs in the node's contextvars.Context,
+# which is how the shims know which radio, clock and files are theirs.
+import asyncio
+import builtins
+import contextvars
+import importlib
+import json
+import os
+import posixpath
+import random
+import shutil
+import tempfile
+import traceback
+
+from .ble import BleWorld
+from .broker import Broker
+from .clock import loop_clock
+from .context import current
+from .medium import Air, Radio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE_DIR = os.path.join(ROOT, "firmware")
+MASTER_MAC = "24ec4aca5e20"
+PILLAR_PREFIX = "be28"  # NLED prepends this to 8-hex cids
+
+SHIMS = {
+    "network": "sim.shims.network",
+    "espnow": "sim.shims.espnow",
+    "aioespnow": "sim.shims.aioespnow",
+    "machine": "sim.shims.machine",
+    "esp32": "sim.shims.esp32",
+    "bluetooth": "sim.shims.bluetooth",
+    "aioble": "sim.shims.aioble",
+    "umqtt": "sim.shims.umqtt",
+    "umqtt.simple": "sim.shims.umqtt.simple",
+    "time": "sim.shims.mtime",
+    "utime": "sim.shims.mtime",
+    "os": "sim.shims.mos",
+    "uos": "sim.shims.mos",
+    "asyncio": "sim.shims.masyncio",
+    "uasyncio": "sim.shims.masyncio",
+    "gc": "sim.shims.mgc",
+}
+
+RESET_CAUSES = {"power": 1, "reset": 2, "wdt": 3, "deepsleep": 4}
+
+
+class NodeReset(BaseException):
+    # machine.reset() never returns on the chip; this unwinds the calling task
+    pass
+
+
+class Node:
+    def __init__(self, host, name, firmware, mac, files=None, battery=3.9, offset_s=0.0, drift_ppm=0.0):
+        self.host = host
+        self.name = name
+        self.index = len(host.nodes)
+        self.firmware = os.path.abspath(firmware)
+        self.src = os.path.dirname(self.firmware)
+        self.mac = bytes.fromhex(mac) if isinstance(mac, str) else bytes(mac)
+        self.root = os.path.join(host.workdir, name)
+        self.cwd = "/"
+        self.battery = battery
+        self.offset = offset_s  # wall clock error against the host
+        self.drift = drift_ppm / 1e6  # crystal error, applies to ticks and time
+        self.boot = 0.0
+        self.mono0 = 0.0  # local monotonic at boot, moves when the drift changes
+        self.channel = host.wifi_channel
+        self.wlan_active = False
+        self.wlan_joined = False
+        self.radio = Radio(host.air, self)
+        host.air.attach(self.radio)
+        self.esp_obj = None
+        self.ble = set()  # pillars this node holds connections to
+        self.mqtt = []
+        self.pins = {}
+        self.nvs = {}
+        self.wdt = None  # [timeout ms, last feed]
+        self.tasks = set()
+        self.globals = None
+        self.modules = {}
+        self.running = False
+        self.rebooting = False
+        self.resets = 0
+        self.reset_cause = RESET_CAUSES["power"]
+        self.crashed = None
+        self.ctx = contextvars.Context()
+        self.ctx.run(current.set, self)
+        os.makedirs(self.root, exist_ok=True)
+        for fname, content in (files or {}).items():
+            self.write_file(fname, content)
+
+    def __repr__(self):
+        return f"<Node {self.name} {self.mac.hex()}>"
+
+    # --- clock ---
+    def local_mono(self, t):
+        return self.mono0 + (t - self.boot) * (1 + self.drift)
+
+    def local_wall(self, t):
+        return t + self.offset + (t - self.host.t0) * self.drift
+
+    def skew(self, offset_s=0.0, drift_ppm=None):
+        # Step the wall clock by offset_s and/or run at a new crystal error from
+        # now on; ticks keep counting from where they are
+        mono, wall = self.host.clock.monotonic(), self.host.clock.time()
+        if drift_ppm is not None:
+            m, w = self.local_mono(mono), self.local_wall(wall)
+            self.drift = drift_ppm / 1e6
+            self.mono0 = m - (mono - self.boot) * (1 + self.drift)
+            self.offset = w - wall - (wall - self.host.t0) * self.drift
+        self.offset += offset_s
+
+    # --- filesystem ---
+    def vpath(self, p):
+        return posixpath.normpath(posixpath.join(self.cwd, str(p) or "."))
+
+    def path(self, p=""):
+        return os.path.join(self.root, self.vpath(p).lstrip("/"))
+
+    def write_file(self, fname, content):
+        if isinstance(content, (dict, list)):
+            content = json.dumps(content)
+        mode = "wb" if isinstance(content, bytes) else "w"
+        with builtins.open(self.path(fname), mode) as f:
+            f.write(content)
+
+    def read_json(self, fname, default=None):
+        try:
+            with builtins.open(self.path(fname)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def open(self, file, mode="r", *args, **kw):
+        if isinstance(file, int):
+            return builtins.open(file, mode, *args, **kw)
+        return builtins.open(self.path(file), mode, *args, **kw)
+
+    # --- imports ---
+    def import_(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0:
+            shim = SHIMS.get(name)
+            if shim:
+                mod = importlib.import_module(shim)
+                if fromlist or "." not in name:
+                    return mod
+                return importlib.import_module(SHIMS[name.split(".")[0]])
+            if name in self.modules:
+                return self.modules[name]
+            local = os.path.join(self.src, name + ".py")
+            if "." not in name and os.path.exists(local):
+                return self.load_module(name, local)
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    def load_module(self, name, path):
+        mod = type(builtins)(name)
+        mod.__file__ = path
+        mod.__builtins__ = self.builtins
+        self.modules[name] = mod  # before exec, like sys.modules
+        exec(self.host.compiled(path), mod.__dict__)
+        return mod
+
+    def print(self, *args, sep=" ", end="\n", file=None, flush=False):
+        self.host.console(self, sep.join(str(a) for a in args))
+
+    # --- lifecycle ---
+    def call_later(self, delay, callback, *args):
+        return self.host.loop.call_later(max(0.0, delay), callback, *args, context=self.ctx)
+
+    def start(self):
+        # Fresh interpreter state: module globals, local modules, boot time
+        self.boot = self.host.clock.monotonic()
+        self.mono0 = 0.0
+        self.cwd = "/"
+        self.modules = {}
+        self.crashed = None
+        self.running = True
+        self.rebooting = False
+        b = dict(vars(builtins))
+        b.update(__import__=self.import_, open=self.open, print=self.print)
+        self.builtins = b
+        self.ctx.run(self._boot)
+
+    def _boot(self):
+        g = {"__name__": "sim_" + self.name, "__file__": self.firmware, "__builtins__": self.builtins}
+        self.globals = g
+        try:
+            exec(self.host.compiled(self.firmware), g)
+        except NodeReset:
+            return
+        except Exception:
+            self.crash()
+            return
+        self.host.loop.create_task(self._main())
+
+    async def _main(self):
+        try:
+            await self.globals["main"]()
+        except NodeReset:
+            pass
+        except Exception:
+            self.crash()
+
+    def crash(self):
+        # The chip drops to the REPL; only the watchdog brings it back
+        self.crashed = traceback.format_exc()
+        self.host.console(self, self.crashed.rstrip())
+
+    def reset(self, cause="reset"):
+        if not self.rebooting:
+            self.rebooting = True
+            self.host.spawn(self._reboot(cause))
+        raise NodeReset
+
+    async def _reboot(self, cause, down_s=0.0):
+        self.running = False
+        await self.halt()
+        await asyncio.sleep(self.host.boot_s + down_s)
+        self.resets += 1
+        self.reset_cause = RESET_CAUSES.get(cause, RESET_CAUSES["reset"])
+        self.host.console(self, f"-- reboot ({cause})")
+        self.start()
+
+    async def halt(self):
+        # Firmware loops wrap awaits in bare except: keep cancelling until done
+        # (a BLE sweep swallows one cancel per pillar)
+        for _ in range(1000):
+            live = [t for t in self.tasks if not t.done()]
+            if not live:
+                break
+            for t in live:
+                t.cancel()
+            await asyncio.sleep(0)
+        self.radio.set_active(False)
+        self.radio.irq = None
+        self.radio.event = None
+        self.host.ble.release_all(self)
+        for c in self.mqtt:
+            c.disconnect()
+        self.mqtt = []
+        self.wdt = None
+        self.wlan_active = self.wlan_joined = False
+        self.channel = self.host.wifi_channel
+
+
+class Host:
+    def __init__(self, seed=0, workdir=None, clock=None, wifi_channel=11, boot_s=1.0, verbose=False):
+        self.seed = seed
+        self.rng = random.Random(f"{seed}/host")
+        self.clock = clock or loop_clock()
+        self.t0 = self.clock.time()
+        self.air = Air(self.clock, random.Random(f"{seed}/air"))
+        self.ble = BleWorld(self.clock, random.Random(f"{seed}/ble"))
+        self.broker = Broker(self.clock)
+        self.nodes = {}
+        self.wifi_up = True
+        self.wifi_channel = wifi_channel
+        self.boot_s = boot_s
+        self.verbose = verbose
+        self.own_workdir = workdir is None
+        self.workdir = workdir or tempfile.mkdtemp(prefix="nara_sim_")
+        self.code = {}
+        self.ctx = contextvars.Context()
+        self.loop = None
+        self.bg = set()  # host tasks, referenced until done
+        self.lines = []  # (clock time, node name, text) of everything printed
+
+    def compiled(self, path):
+        if path not in self.code:
+            with open(path) as f:
+                self.code[path] = compile(f.read(), path, "exec")
+        return self.code[path]
+
+    def console(self, node, text):
+        t = self.clock.monotonic() - self.t0_mono if self.loop else 0.0
+        self.lines.append((t, node.name, text))
+        if self.verbose:
+            print(f"{t:9.3f} [{node.name}] {text}")
+
+    # --- building the fleet ---
+    def add_node(self, name, firmware, mac, files=None, **kw):
+        node = Node(self, name, firmware, mac, files, **kw)
+        self.nodes[name] = node
+        return node
+
+    def add_master(self, name="master", mac=MASTER_MAC, config=None, files=None, firmware=None):
+        src = os.path.join(FIRMWARE_DIR, "master")
+        seed = {}
+        for fname in ("nmaster.json", "msids.json", "members.json"):
+            with open(os.path.join(src, fname)) as f:
+                seed[fname] = json.load(f)
+        seed["nmaster.json"].update({"ch": self.wifi_channel, "debug": 0})
+        seed["nmaster.json"].update(config or {})
+        seed.update(files or {})
+        return self.add_node(name, firmware or os.path.join(src, "master.py"), mac, seed)
+
+    def add_slave(self, name, sid, mac, cids=(), master=MASTER_MAC, config=None, files=None, firmware=None, pillars=True, **kw):
+        seed = {
+            "nslave.json": dict({"sid": sid, "master": master, "ch": self.wifi_channel, "debug": 0}, **(config or {})),
+            "cids.json": list(cids),
+        }
+        seed.update(files or {})
+        if pillars:
+            for cid in cids:
+                mac_hex = cid.lower()
+                self.ble.add(bytes.fromhex(PILLAR_PREFIX + mac_hex if len(mac_hex) == 8 else mac_hex))
+        return self.add_node(name, firmware or os.path.join(FIRMWARE_DIR, "slave", "slave.py"), mac, seed, **kw)
+
+    # --- running ---
+    def _task_factory(self, loop, coro, context=None):
+        task = asyncio.Task(coro, loop=loop, context=context)
+        node = (contextvars.copy_context() if context is None else context).get(current, None)
+        if node is not None:
+            node.tasks.add(task)
+            task.add_done_callback(node.tasks.discard)
+        return task
+
+    def _loop_error(self, loop, ctx):
+        # Unretrieved task errors land here; resets are not errors
+        if isinstance(ctx.get("exception"), (NodeReset, asyncio.CancelledError)):
+            return
+        task = ctx.get("future")
+        node = task.get_context().get(current, None) if isinstance(task, asyncio.Task) else None
+        ex = ctx.get("exception")
+        text = ctx["message"] + (f": {ex!r}" if ex else "")
+        if node:
+            self.console(node, text)
+        else:
+            loop.default_exception_handler(ctx)
+
+    def spawn(self, coro):
+        # Host-side task, outside every node's context
+        task = self.loop.create_task(coro, context=self.ctx.copy())
+        self.bg.add(task)
+        task.add_done_callback(self.bg.discard)
+        return task
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.set_task_factory(self._task_factory)
+        self.loop.set_exception_handler(self._loop_error)
+        self.t0_mono = self.clock.monotonic()
+        for node in self.nodes.values():
+            node.start()
+        self.spawn(self._watchdog())
+
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(1)
+            now = self.clock.monotonic()
+            for node in self.nodes.values():
+                if node.running and node.wdt and now - node.wdt[1] > node.wdt[0] / 1000:
+                    self.console(node, "-- watchdog")
+                    self.reboot(node, "wdt")
+
+    def reboot(self, node, cause="reset", down_s=0.0):
+        # From outside the node (watchdog, power cut); down_s keeps it off longer
+        if not node.rebooting:
+            node.rebooting = True
+            self.spawn(node._reboot(cause, down_s))
+
+    async def run(self, seconds):
+        if self.loop is None:
+            self.start()
+        await asyncio.sleep(seconds)
+
+    async def stop(self):
+        for node in self.nodes.values():
+            node.running = False
+            await node.halt()
+        for task in list(self.bg):
+            task.cancel()
+        await asyncio.sleep(0)
+
+    def close(self):
+        if self.own_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # --- dashboard side ---
+    def publish(self, topic, payload, retain=False):
+        self.broker.publish(topic, payload, retain)
+
+    def on(self, pattern, callback):
+        self.broker.on(pattern, callback)
@@ -0,0 +1,65 @@
+# Firmware LINKTEST against the virtual air: one run per mode/size/gap
+# combination, reports as the master publishes them.
+#
+#   python -m sim.linktest --sid 3 --mode flood --size 64 200 --gap 0 2 5 --loss 0.05
+import argparse
+import asyncio
+import itertools
+import json
+
+from . import vtime
+from .hall import build
+from .host import Host
+
+
+async def linktest(args):
+    host = Host(seed=args.seed)
+    build(host, max(args.sid, args.slaves), args.loss)
+    host.air.latency_ms = args.latency
+    reports = []
+    host.on("nara/master/result", lambda topic, payload: reports.append(json.loads(payload)))
+    host.start()
+    await asyncio.sleep(5)
+    out = []
+    for mode, size, gap in itertools.product(args.mode, args.size, args.gap):
+        n = len(reports)
+        host.publish("nara/master/global", {"cmd": "LINKTEST", "args": [args.sid, mode, args.count, size, gap]})
+        t0 = host.clock.monotonic()
+        while len(reports) == n and host.clock.monotonic() - t0 < 600:
+            await asyncio.sleep(0.1)
+        new = [r for r in reports[n:] if "linktest" in r]
+        out.extend(new)
+        await asyncio.sleep(1)
+    await host.stop()
+    host.close()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim.linktest", description="Run LINKTEST on the host radio shim")
+    ap.add_argument("--sid", type=int, default=1)
+    ap.add_argument("--mode", nargs="+", default=["echo", "flood", "up"])
+    ap.add_argument("--count", type=int, default=200)
+    ap.add_argument("--size", type=int, nargs="+", default=[32, 200])
+    ap.add_argument("--gap", type=int, nargs="+", default=[0, 5], help="ms between frames")
+    ap.add_argument("--loss", type=float, default=0.02)
+    ap.add_argument("--latency", type=float, default=1.0, help="ms per frame on the air")
+    ap.add_argument("--slaves", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="print the raw reports")
+    args = ap.parse_args()
+    reports = vtime.run(linktest(args))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{'mode':6} {'size':>4} {'gap':>4} {'sent':>5} {'recv':>5} {'loss':>7} {'reord':>5} {'fps':>8} {'kbps':>7} {'rtt p50':>8} {'p99':>7} {'drops':>5}")
+    for r in reports:
+        rtt = r.get("rtt", {})
+        print(
+            f"{r['linktest']:6} {r['size']:>4} {r['gap']:>4} {r['sent']:>5} {r['recv']:>5} {r['loss']:>7} "
+            f"{r['reorder']:>5} {r['fps']:>8} {r['kbps']:>7} {rtt.get('p50', '-'):>8} {rtt.get('p99', '-'):>7} {r.get('drops', '-'):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Virtual ESP-NOW air: per-node radios, shared channel airtime, latency, loss.
+# Frames are delivered with loop.call_later inside the receiving node's
+# context, so receive callbacks and wakeups run as that node.
+import asyncio
+from collections import deque
+
+BROADCAST = b"\xff" * 6
+FRAME_OVERHEAD = 60  # MAC header, vendor action frame and ESP-NOW fields, bytes
+
+
+class Radio:
+    def __init__(self, air, node):
+        self.air = air
+        self.node = node
+        self.mac = node.mac
+        self.active = False
+        self.peers = {}  # mac: [lmk, channel, ifidx, encrypt]
+        self.rxbuf = 526  # MicroPython default ring size, bytes
+        self.rx = deque()  # (mac, msg, rssi)
+        self.rx_bytes = 0
+        self.event = None
+        self.irq = None
+        self.last_rx = {}  # mac: [rssi, time ms], the peers_table
+        self.stats = [0, 0, 0, 0, 0]  # tx_pkts, tx_responses, tx_failures, rx_packets, rx_dropped
+
+    def set_active(self, flag):
+        self.active = bool(flag)
+        if not self.active:
+            self.peers.clear()
+            self.rx.clear()
+            self.rx_bytes = 0
+
+    def deliver(self, src, data, rssi):
+        if not self.active:
+            return
+        size = len(data) + 8
+        if self.rx_bytes + size > self.rxbuf:
+            self.stats[4] += 1
+            return
+        self.rx.append((src, data, rssi))
+        self.rx_bytes += size
+        self.stats[3] += 1
+        if self.event:
+            self.event.set()
+        if self.irq:
+            self.irq(self.node.esp_obj)
+
+    def pop(self):
+        if not self.rx:
+            return None, None
+        src, data, rssi = self.rx.popleft()
+        self.rx_bytes -= len(data) + 8
+        self.last_rx[src] = [rssi, int(self.air.clock.monotonic() * 1000)]
+        return src, data
+
+    async def wait(self):
+        if self.event is None:
+            self.event = asyncio.Event()
+        while not self.rx:
+            self.event.clear()
+            await self.event.wait()
+
+
+class Air:
+    def __init__(self, clock, rng, loss=0.0, latency_ms=1.0, jitter_ms=0.5, bitrate=1000000, mac_retries=3):
+        self.clock = clock
+        self.rng = rng
+        self.loss = loss  # per attempt, every link
+        self.link_loss = {}  # (src mac, dst mac): loss overriding self.loss
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bitrate = bitrate
+        self.mac_retries = mac_retries  # unicast is retried by the MAC until acked
+        self.radios = {}  # mac: Radio
+        self.busy = {}  # channel: clock time the air is free again
+        self.last = {}  # (src, dst): delivery time, so a link never reorders
+        self.taps = []  # f(time, src mac, dst mac, data, arrival time or None when lost)
+        self.fault = None  # sim.faults.Injector: extra loss, drops, duplicates, held frames
+        self.sent = 0
+        self.lost = 0
+
+    def attach(self, radio):
+        self.radios[radio.mac] = radio
+
+    def lost_once(self, src, dst):
+        p = self.link_loss.get((src, dst), self.loss)
+        if self.fault:
+            p = 1 - (1 - p) * (1 - self.fault.loss(src, dst))
+        return p > 0 and self.rng.random() < p
+
+    def transmit(self, radio, dst, data):
+        # Returns the MAC-level ack a synchronous send would report
+        now = self.clock.monotonic()
+        ch = radio.node.channel
+        start = max(now, self.busy.get(ch, 0))
+        done = start + (len(data) + FRAME_OVERHEAD) * 8 / self.bitrate
+        self.busy[ch] = done
+        self.sent += 1
+        if dst == BROADCAST:
+            targets = [r for r in self.radios.values() if r is not radio]
+            attempts = 1
+        else:
+            r = self.radios.get(dst)
+            targets = [r] if r else []
+            attempts = 1 + self.mac_retries
+        acked = False
+        for r in targets:
+            if not r.active or r.node.channel != ch:
+                continue
+            ok = False
+            for _ in range(attempts):
+                if not self.lost_once(radio.mac, r.mac):
+                    ok = True
+                    break
+            if not ok:
+                self.lost += 1
+                for tap in self.taps:
+                    tap(now, radio.mac, r.mac, data, None)
+                continue
+            acked = True
+            # Past the MAC: the frame may still be dropped, doubled or held back
+            delays = self.fault.copies(radio.mac, r.mac) if self.fault else (0.0,)
+            if not delays:
+                self.lost += 1
+                for tap in self.taps:
+                    tap(now, radio.mac, r.mac, data, None)
+                continue
+            for extra in delays:
+                at = done + (self.latency_ms + self.rng.random() * self.jitter_ms) / 1000
+                if extra:
+                    at += extra  # later frames on the link may overtake it
+                else:
+                    at = max(at, self.last.get((radio.mac, r.mac), 0))
+                    self.last[(radio.mac, r.mac)] = at
+                for tap in self.taps:
+                    tap(now, radio.mac, r.mac, data, at)
+                rssi = -40 - int(self.rng.random() * 30)
+                r.node.call_later(at - now, r.deliver, radio.mac, bytes(data), rssi)
+        return True if dst == BROADCAST else acked
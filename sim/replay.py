@@ -0,0 +1,240 @@
+# Replays a master trace (TRACE on, see master.py) into the virtual hall.
+# Every recorded MQTT command is published again at its recorded offset,
+# divided by --speed, and results are matched to commands the same way for
+# the recording and the replay. The report puts recorded and replayed
+# command latency side by side per target kind. --baseline compares against
+# an earlier replay, e.g. of the same trace on the previous firmware.
+#
+#   python -m sim.replay trace.1.bin trace.bin --speed 4 --out replay.json
+#   python -m sim.replay trace.bin --firmware ../build/firmware --baseline replay.json
+#   python -m sim.replay trace.bin --dump | head
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+
+from . import vtime
+from .bench import stats
+from .faults import Recorder, target_id
+from .hall import build
+from .host import Host
+
+MAGIC = b"NTR1"
+HEAD = struct.Struct(">4sQ")
+REC = struct.Struct(">BIH")
+# Maintenance commands that make no sense against the simulator
+SKIP = ("MRESET", "MREBOOT", "FWSEND", "FWCAST", "TRACE", "MDEBUG", "LINKTEST")
+
+
+def read(paths):
+    # -> [(Unix ms, kind, topic or peer MAC hex or None, payload bytes)], oldest first
+    out = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEAD.size or data[:4] != MAGIC:
+            raise ValueError(f"{path}: not a trace file")
+        start = HEAD.unpack_from(data)[1]
+        i = HEAD.size
+        while i + REC.size <= len(data):
+            kind, ms, n = REC.unpack_from(data, i)
+            i += REC.size
+            body = data[i : i + n]
+            if len(body) < n:
+                break  # cut short by a reset mid-write
+            i += n
+            kind = chr(kind)
+            if kind == "M":
+                out.append((start + ms, kind, body[1 : 1 + body[0]].decode(), body[1 + body[0] :]))
+            elif kind == "R":
+                out.append((start + ms, kind, None, body))
+            elif kind in "TF":
+                out.append((start + ms, kind, body[:6].hex(), body[6:]))
+    out.sort(key=lambda r: r[0])
+    return out
+
+
+def parse(payload):
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def target_kind(topic, data):
+    if topic == "nara/master/global":
+        return "global"
+    if topic.startswith("nara/group/"):
+        return "group"
+    return str(data.get("target", "global")).lower()
+
+
+def commands(records, skip=SKIP):
+    # Recorded commands with their recorded outcome: (ms, topic, payload, kind, latency ms, done)
+    cmds, queue = [], {}
+    for ms, kind, topic, payload in records:
+        if kind == "M":
+            data = parse(payload)
+            if str(data.get("cmd", "")).upper() in skip:
+                continue
+            c = [ms, topic, payload, target_kind(topic, data), None, False]
+            cmds.append(c)
+            queue.setdefault(target_id(topic, data), []).append(c)
+        elif kind == "R":
+            report = parse(payload)
+            q = queue.get(str(report.get("id", "")).upper())
+            if q and "done" in report:
+                c = q.pop(0)
+                c[4], c[5] = ms - c[0], bool(report["done"])
+    return cmds
+
+
+def summary(rows):
+    # rows: (kind, latency ms or None, done) -> per kind success share and latency
+    out = {}
+    for kind in sorted({r[0] for r in rows}):
+        mine = [r for r in rows if r[0] == kind]
+        ok = [r[1] for r in mine if r[2]]
+        out[kind] = {"cmds": len(mine), "ok": round(len(ok) / len(mine), 3), "lat": stats(ok)}
+    return out
+
+
+async def replay(args, records):
+    cmds = commands(records)
+    if not cmds:
+        raise ValueError("no commands in the trace")
+    host = Host(seed=args.seed, verbose=args.verbose)
+    hall = build(host, args.slaves, args.loss, firmware=args.firmware)
+    rec = Recorder(host)
+    frames = {"tx": 0, "rx": 0}
+    master = host.nodes["master"].mac
+
+    def on_air(t, src, dst, data, at):
+        if src == master:
+            frames["tx"] += 1
+        elif dst == master and at is not None:
+            frames["rx"] += 1
+
+    host.air.taps.append(on_air)
+    host.start()
+    await asyncio.sleep(args.warmup)
+    t0, first = host.clock.monotonic(), cmds[0][0]
+    frames.update(tx=0, rx=0)  # boot traffic is not part of the replay
+    for ms, topic, payload, _, _, _ in cmds:
+        await asyncio.sleep(max(0.0, t0 + (ms - first) / 1000 / args.speed - host.clock.monotonic()))
+        rec.send(topic, payload)
+    span = host.clock.monotonic() - t0
+    deadline = host.clock.monotonic() + args.timeout
+    while any(c["taken"] is not None and c["result"] is None for c in rec.cmds) and host.clock.monotonic() < deadline:
+        await asyncio.sleep(0.5)
+    await host.stop()
+    host.close()
+
+    # Compared on the commands the recording has a result for; queries such as
+    # STAT are answered on the status topic and only add load
+    pairs = [(c, r) for c, r in zip(cmds, rec.cmds) if c[4] is not None]
+    sent = [(c[3], (r["result"] - r["t"]) * 1000 if r["result"] else None, r["done"]) for c, r in pairs]
+    rec_span = (records[-1][0] - records[0][0]) / 1000
+    return {
+        "meta": {
+            "trace": [os.path.basename(p) for p in args.trace],
+            "commands": len(cmds),
+            "unreported": len(cmds) - len(pairs),
+            "trace_s": round(rec_span, 1),
+            "replay_s": round(span, 1),
+            "speed": args.speed,
+            "seed": args.seed,
+            "slaves": len(hall.slaves),
+            "firmware": args.firmware or "firmware",
+        },
+        "recorded": summary([(c[3], c[4], c[5]) for c, _ in pairs]),
+        "replayed": summary(sent),
+        "lost": sum(1 for r in rec.cmds if r["taken"] is None),
+        "frames": {
+            "recorded": {"tx": sum(1 for r in records if r[1] == "T"), "rx": sum(1 for r in records if r[1] == "F")},
+            "replayed": frames,
+        },
+    }
+
+
+def compare(result, baseline, tol):
+    # Replayed latency or success worse than the baseline replay by more than tol
+    flags = []
+    for kind, cur in result["replayed"].items():
+        base = baseline.get("replayed", {}).get(kind)
+        if not base:
+            continue
+        for p in ("p50", "p90"):
+            b, c = base["lat"].get(p), cur["lat"].get(p)
+            if b is not None and c is not None and c > b * (1 + tol) + 5:
+                flags.append(f"{kind} {p}: {b} -> {c} ms")
+        if cur["ok"] < base["ok"] - max(0.01, base["ok"] * tol):
+            flags.append(f"{kind} ok: {base['ok']} -> {cur['ok']}")
+    return flags
+
+
+def table(result):
+    lines = [f"{'kind':8} {'cmds':>5} {'rec ok':>7} {'rec p50':>9} {'p90':>9} {'sim ok':>7} {'sim p50':>9} {'p90':>9}"]
+    for kind, r in result["recorded"].items():
+        s = result["replayed"].get(kind, {"ok": "-", "lat": {}})
+        lines.append(
+            f"{kind:8} {r['cmds']:>5} {r['ok']:>7} {r['lat'].get('p50', '-'):>9} {r['lat'].get('p90', '-'):>9} "
+            f"{s['ok']:>7} {s['lat'].get('p50', '-'):>9} {s['lat'].get('p90', '-'):>9}"
+        )
+    f = result["frames"]
+    lines.append(
+        f"frames tx/rx: recorded {f['recorded']['tx']}/{f['recorded']['rx']}, replayed {f['replayed']['tx']}/{f['replayed']['rx']}; "
+        f"{result['meta']['trace_s']} s of trace in {result['meta']['replay_s']} s, {result['lost']} commands lost"
+    )
+    return "\n".join(lines)
+
+
+def dump(records):
+    t0 = records[0][0] if records else 0
+    for ms, kind, who, payload in records:
+        text = payload.decode(errors="replace") if kind in "MR" or payload[:1].isalpha() else payload.hex()
+        print(f"{(ms - t0) / 1000:10.3f} {kind} {who or '-':20} {text[:120]}")
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m sim.replay", description="Replay a master trace into the virtual hall")
+    ap.add_argument("trace", nargs="+", help="trace files, oldest first (trace.1.bin trace.bin)")
+    ap.add_argument("--speed", type=float, default=1.0, help="compress the command timeline by this factor")
+    ap.add_argument("--firmware", help="tree with master/master.py and slave/slave.py to replay against")
+    ap.add_argument("--slaves", type=int, default=None, help="first N hall slaves only")
+    ap.add_argument("--loss", type=float, default=0.02)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--warmup", type=float, default=10, help="virtual s before the first command")
+    ap.add_argument("--timeout", type=float, default=300, help="s to wait for the last results")
+    ap.add_argument("--realtime", action="store_true", help="pace the replay on the wall clock")
+    ap.add_argument("--dump", action="store_true", help="print the records and exit")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="earlier replay JSON to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.1, help="relative slack before flagging")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show firmware prints")
+    args = ap.parse_args()
+
+    records = read(args.trace)
+    if args.dump:
+        dump(records)
+        return
+    result = asyncio.run(replay(args, records)) if args.realtime else vtime.run(replay(args, records))
+    print(table(result))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            flags = compare(result, json.load(f), args.tolerance)
+        for line in flags:
+            print("REGRESSION", line)
+        if flags:
+            sys.exit(1)
+        print("no regressions against", os.path.relpath(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# Stand-ins for the MicroPython modules the firmware imports. Node imports of
+# these names are redirected here by sim.host; the hardware they talk to
+# (radio medium, BLE world, broker, clock) is owned by the node's Host.
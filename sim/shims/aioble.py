@@ -0,0 +1,124 @@
+# aioble central API over the host's BLE world (sim.ble)
+import asyncio
+
+from ..context import node
+
+ADDR_PUBLIC, ADDR_RANDOM = 0, 1
+
+
+class DeviceDisconnectedError(Exception):
+    pass
+
+
+class Device:
+    def __init__(self, addr_type, addr):
+        if isinstance(addr, str):
+            addr = bytes.fromhex(addr.replace(":", ""))
+        self.addr_type = addr_type
+        self.addr = bytes(addr)
+
+    def addr_hex(self):
+        return ":".join("%02x" % b for b in self.addr)
+
+    async def connect(self, timeout_ms=10000, scan_duration_ms=None, min_conn_interval_us=None, max_conn_interval_us=None):
+        n = node()
+        pillar = await n.host.ble.connect(n, self.addr, timeout_ms)
+        return DeviceConnection(self, pillar, n)
+
+    def __eq__(self, other):
+        return isinstance(other, Device) and self.addr == other.addr
+
+    def __hash__(self):
+        return hash(self.addr)
+
+
+class DeviceConnection:
+    def __init__(self, device, pillar, n):
+        self.device = device
+        self._pillar = pillar
+        self._node = n
+
+    def is_connected(self):
+        return self._pillar.owner is self._node
+
+    async def service(self, uuid, timeout_ms=2000):
+        if not self.is_connected():
+            raise DeviceDisconnectedError
+        await asyncio.sleep(0.005)  # service discovery round trip
+        return ClientService(self, uuid)
+
+    async def disconnect(self, timeout_ms=2000):
+        self._node.host.ble.release(self._node, self._pillar)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+
+class ClientService:
+    def __init__(self, connection, uuid):
+        self.connection = connection
+        self.uuid = uuid
+
+    async def characteristic(self, uuid, timeout_ms=2000):
+        if not self.connection.is_connected():
+            raise DeviceDisconnectedError
+        return ClientCharacteristic(self, uuid)
+
+
+class ClientCharacteristic:
+    def __init__(self, service, uuid):
+        self.service = service
+        self.uuid = uuid
+
+    async def write(self, data, response=None, timeout_ms=1000):
+        c = self.service.connection
+        if not c.is_connected():
+            raise DeviceDisconnectedError
+        if not await c._node.host.ble.write(c._node, c._pillar, data):
+            raise DeviceDisconnectedError
+
+
+class ScanResult:
+    def __init__(self, pillar, rssi):
+        self.device = Device(ADDR_PUBLIC, pillar.mac)
+        self.rssi = rssi
+        self._name = pillar.name
+        self.adv_data = b""
+
+    def name(self):
+        return self._name
+
+    def services(self):
+        return iter(())
+
+    def manufacturer(self, filter=None):
+        return iter(())
+
+
+class scan:
+    def __init__(self, duration_ms, interval_us=None, window_us=None, active=False):
+        self.duration_ms = duration_ms
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def __aiter__(self):
+        return self._results()
+
+    async def _results(self):
+        n = node()
+        world = n.host.ble
+        # Each visible pillar advertises once at a random point of the window
+        seen = sorted(((world.rng.random() * self.duration_ms, p) for p in world.visible(n)), key=lambda s: s[0])
+        t = 0
+        for at, p in seen:
+            await asyncio.sleep((at - t) / 1000)
+            t = at
+            yield ScanResult(p, -45 - int(world.rng.random() * 45))
+        await asyncio.sleep((self.duration_ms - t) / 1000)
@@ -0,0 +1,20 @@
+# MicroPython aioespnow: async receive on top of the espnow shim
+from .espnow import *  # noqa: F401,F403
+from .espnow import ESPNow
+
+
+class AIOESPNow(ESPNow):
+    async def arecv(self):
+        await self._radio.wait()
+        return self.recv(0)
+
+    airecv = arecv
+
+    async def asend(self, mac, msg=None, sync=None):
+        return self.send(mac, msg, sync)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.airecv()
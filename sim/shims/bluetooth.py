@@ -0,0 +1,40 @@
+# MicroPython bluetooth: UUIDs and a do-nothing BLE object (aioble drives the world)
+FLAG_READ, FLAG_WRITE_NO_RESPONSE, FLAG_WRITE, FLAG_NOTIFY, FLAG_INDICATE = 0x02, 0x04, 0x08, 0x10, 0x20
+
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, UUID):
+            value = value.value
+        if isinstance(value, str):
+            value = value.lower()
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        v = self.value
+        return "UUID(0x%04x)" % v if isinstance(v, int) else "UUID('%s')" % v
+
+
+class BLE:
+    def __init__(self):
+        self._active = False
+
+    def active(self, flag=None):
+        if flag is not None:
+            self._active = bool(flag)
+        return self._active
+
+    def config(self, *args, **kw):
+        if args and args[0] == "mac":
+            from ..context import node
+
+            return (0, node().mac)
+
+    def irq(self, handler):
+        pass
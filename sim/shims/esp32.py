@@ -0,0 +1,41 @@
+# MicroPython esp32: the few helpers the firmware might touch
+from ..context import node
+
+
+def raw_temperature():
+    return 120
+
+
+def mcu_temperature():
+    return 49
+
+
+def wake_on_ext0(pin, level):
+    pass
+
+
+class NVS:
+    def __init__(self, namespace):
+        self.data = node().nvs.setdefault(namespace, {})
+
+    def set_i32(self, key, value):
+        self.data[key] = value
+
+    def get_i32(self, key):
+        if key not in self.data:
+            raise OSError(-4354, "ESP_ERR_NVS_NOT_FOUND")
+        return self.data[key]
+
+    def set_blob(self, key, value):
+        self.data[key] = bytes(value)
+
+    def get_blob(self, key, buf):
+        value = self.data[key]
+        buf[: len(value)] = value
+        return len(value)
+
+    def erase_key(self, key):
+        self.data.pop(key, None)
+
+    def commit(self):
+        pass
@@ -0,0 +1,137 @@
+# MicroPython espnow over the host's virtual air (sim.medium)
+from ..context import node
+from ..medium import BROADCAST
+
+MAX_DATA_LEN = 250
+ADDR_LEN = 6
+KEY_LEN = 16
+MAX_TOTAL_PEER_NUM = 20
+MAX_ENCRYPT_PEER_NUM = 6
+
+_ESPNOW_BASE = 0x3066
+_ERRORS = {
+    "ESP_ERR_ESPNOW_NOT_INIT": -(_ESPNOW_BASE + 1),
+    "ESP_ERR_ESPNOW_ARG": -(_ESPNOW_BASE + 2),
+    "ESP_ERR_ESPNOW_NO_MEM": -(_ESPNOW_BASE + 3),
+    "ESP_ERR_ESPNOW_FULL": -(_ESPNOW_BASE + 4),
+    "ESP_ERR_ESPNOW_NOT_FOUND": -(_ESPNOW_BASE + 5),
+    "ESP_ERR_ESPNOW_INTERNAL": -(_ESPNOW_BASE + 6),
+    "ESP_ERR_ESPNOW_EXIST": -(_ESPNOW_BASE + 7),
+    "ESP_ERR_ESPNOW_IF": -(_ESPNOW_BASE + 8),
+}
+
+
+def _err(name):
+    return OSError(_ERRORS[name], name)
+
+
+def _mac(mac):
+    mac = bytes(mac)
+    if len(mac) != ADDR_LEN:
+        raise ValueError("invalid peer MAC address")
+    return mac
+
+
+class ESPNow:
+    # Like the real driver this is a singleton per node: state lives in the radio
+    def __init__(self):
+        n = node()
+        self._radio = n.radio
+        n.esp_obj = self
+
+    def active(self, flag=None):
+        if flag is None:
+            return self._radio.active
+        self._radio.set_active(flag)
+        return self._radio.active
+
+    def config(self, rxbuf=None, timeout_ms=None, rate=None):
+        if rxbuf is not None:
+            self._radio.rxbuf = rxbuf
+
+    def irq(self, callback):
+        self._radio.irq = callback
+
+    def _check(self):
+        if not self._radio.active:
+            raise _err("ESP_ERR_ESPNOW_NOT_INIT")
+
+    def add_peer(self, mac, lmk=None, channel=0, ifidx=0, encrypt=None):
+        self._check()
+        mac = _mac(mac)
+        peers = self._radio.peers
+        if mac in peers:
+            raise _err("ESP_ERR_ESPNOW_EXIST")
+        if len(peers) >= MAX_TOTAL_PEER_NUM:
+            raise _err("ESP_ERR_ESPNOW_FULL")
+        peers[mac] = [lmk, channel, ifidx, bool(encrypt if encrypt is not None else lmk)]
+
+    def del_peer(self, mac):
+        self._check()
+        if self._radio.peers.pop(_mac(mac), None) is None:
+            raise _err("ESP_ERR_ESPNOW_NOT_FOUND")
+
+    def mod_peer(self, mac, lmk=None, channel=0, ifidx=0, encrypt=None):
+        self._check()
+        mac = _mac(mac)
+        if mac not in self._radio.peers:
+            raise _err("ESP_ERR_ESPNOW_NOT_FOUND")
+        self._radio.peers[mac] = [lmk, channel, ifidx, bool(encrypt)]
+
+    def get_peer(self, mac):
+        mac = _mac(mac)
+        if mac not in self._radio.peers:
+            raise _err("ESP_ERR_ESPNOW_NOT_FOUND")
+        return (mac,) + tuple(self._radio.peers[mac])
+
+    def get_peers(self):
+        return tuple((m,) + tuple(p) for m, p in self._radio.peers.items())
+
+    def peer_count(self):
+        peers = self._radio.peers.values()
+        return (len(peers), sum(1 for p in peers if p[3]))
+
+    @property
+    def peers_table(self):
+        return self._radio.last_rx
+
+    def send(self, mac, msg=None, sync=None):
+        if msg is None:
+            mac, msg = None, mac
+        self._check()
+        if isinstance(msg, str):
+            msg = msg.encode()
+        if len(msg) > MAX_DATA_LEN:
+            raise ValueError("msg too long")
+        r = self._radio
+        if mac is None:
+            dests = list(r.peers)
+        else:
+            mac = _mac(mac)
+            if mac not in r.peers:
+                raise _err("ESP_ERR_ESPNOW_NOT_FOUND")
+            dests = [mac]
+        ok = True
+        for dst in dests:
+            r.stats[0] += 1
+            acked = r.air.transmit(r, dst, msg)
+            if acked and dst != BROADCAST:
+                r.stats[1] += 1
+            elif not acked:
+                r.stats[2] += 1
+                ok = False
+        return ok if sync is not False else True
+
+    def any(self):
+        return bool(self._radio.rx)
+
+    def recv(self, timeout_ms=None):
+        # Blocking waits cannot run inside the shared host loop: an empty
+        # buffer returns at once, like timeout_ms=0
+        self._check()
+        return self._radio.pop()
+
+    irecv = recv
+
+    def stats(self):
+        return tuple(self._radio.stats)
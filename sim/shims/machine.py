@@ -0,0 +1,97 @@
+# MicroPython machine: watchdog, pins, battery ADC and resets for one node
+from ..context import node
+
+
+def reset():
+    node().reset("reset")
+
+
+soft_reset = reset
+
+
+def deepsleep(ms=0):
+    node().reset("deepsleep")
+
+
+def lightsleep(ms=0):
+    pass
+
+
+def idle():
+    pass
+
+
+def unique_id():
+    return node().mac
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def reset_cause():
+    return node().reset_cause
+
+
+PWRON_RESET, HARD_RESET, WDT_RESET, DEEPSLEEP_RESET, SOFT_RESET = 1, 2, 3, 4, 5
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.node = node()
+        self.node.wdt = [timeout, self.node.host.clock.monotonic()]
+
+    def feed(self):
+        self.node.wdt[1] = self.node.host.clock.monotonic()
+
+
+class Pin:
+    IN, OUT, OPEN_DRAIN = 1, 3, 7
+    PULL_UP, PULL_DOWN = 2, 1
+    IRQ_FALLING, IRQ_RISING = 2, 1
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.node = node()
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return self.node.pins.get(self.id, 0)
+        self.node.pins[self.id] = 1 if v else 0
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=None):
+        pass
+
+
+class ADC:
+    ATTN_0DB, ATTN_2_5DB, ATTN_6DB, ATTN_11DB = 0, 1, 2, 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin, atten=None):
+        self.node = node()
+
+    def atten(self, a):
+        pass
+
+    def width(self, w):
+        pass
+
+    def read_uv(self):
+        # Battery sits behind a 1:2 divider on the boards
+        return int(self.node.battery * 1000000 / 2)
+
+    def read_u16(self):
+        return min(65535, self.read_uv() * 65535 // 3300000)
+
+    def read(self):
+        return self.read_u16() >> 4
@@ -0,0 +1,23 @@
+# MicroPython asyncio on top of CPython asyncio
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+from asyncio import CancelledError, Event, Lock, TimeoutError  # noqa: F401
+
+
+def sleep_ms(ms):
+    return _asyncio.sleep(ms / 1000)
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
@@ -0,0 +1,32 @@
+# MicroPython gc: collection is left to CPython, memory figures are nominal
+import gc as _gc
+
+HEAP = 110000  # typical free heap on an ESP32 running the firmware
+
+
+def collect():
+    return 0  # a full CPython collection per node heartbeat only costs host time
+
+
+def enable():
+    pass
+
+
+def disable():
+    pass
+
+
+def isenabled():
+    return _gc.isenabled()
+
+
+def mem_free():
+    return HEAP
+
+
+def mem_alloc():
+    return 0
+
+
+def threshold(amount=None):
+    return -1
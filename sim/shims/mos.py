@@ -0,0 +1,69 @@
+# MicroPython os over the node's own directory (its flash filesystem)
+import os as _os
+
+from ..context import node
+
+sep = "/"
+
+
+def _path(p=""):
+    return node().path(p)
+
+
+def listdir(p=""):
+    return sorted(_os.listdir(_path(p)))
+
+
+def ilistdir(p=""):
+    for name in listdir(p):
+        full = _os.path.join(_path(p), name)
+        yield (name, 0x4000 if _os.path.isdir(full) else 0x8000, 0, _os.path.getsize(full))
+
+
+def remove(p):
+    _os.remove(_path(p))
+
+
+def rename(old, new):
+    _os.replace(_path(old), _path(new))
+
+
+def mkdir(p):
+    _os.mkdir(_path(p))
+
+
+def rmdir(p):
+    _os.rmdir(_path(p))
+
+
+def stat(p):
+    st = _os.stat(_path(p))
+    return (st.st_mode, 0, 0, 0, 0, 0, st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+
+def statvfs(p=""):
+    st = _os.statvfs(_path(p))
+    return (st.f_bsize, st.f_frsize, st.f_blocks, st.f_bfree, st.f_bavail, 0, 0, 0, 0, st.f_namemax)
+
+
+def getcwd():
+    return node().cwd
+
+
+def chdir(p):
+    n = node()
+    if not _os.path.isdir(n.path(p)):
+        raise OSError(2, "ENOENT")
+    n.cwd = n.vpath(p)
+
+
+def sync():
+    pass
+
+
+def urandom(n):
+    return bytes(node().host.rng.getrandbits(8) for _ in range(n))
+
+
+def uname():
+    return ("esp32", node().name, "1.23.0", "v1.23.0 (sim)", "ESP32 module with ESP32")
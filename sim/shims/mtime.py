@@ -0,0 +1,72 @@
+# MicroPython time: 2000 epoch, wrapping ticks, node-local clock skew/drift
+import calendar
+import time as _time
+
+from ..context import node
+
+EPOCH = 946684800  # 2000-01-01 in Unix seconds
+TICKS_MAX = 1 << 30  # ESP32 ticks wrap at 2**30
+TICKS_HALF = TICKS_MAX // 2
+
+
+def _mono():
+    n = node()
+    return n.local_mono(n.host.clock.monotonic())
+
+
+def _wall():
+    n = node()
+    return n.local_wall(n.host.clock.time())
+
+
+def ticks_ms():
+    return int(_mono() * 1000) & (TICKS_MAX - 1)
+
+
+def ticks_us():
+    return int(_mono() * 1000000) & (TICKS_MAX - 1)
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(a, b):
+    return ((a - b + TICKS_HALF) & (TICKS_MAX - 1)) - TICKS_HALF
+
+
+def ticks_add(t, delta):
+    return (t + delta) & (TICKS_MAX - 1)
+
+
+def time():
+    return int(_wall()) - EPOCH
+
+
+def time_ns():
+    return int((_wall() - EPOCH) * 1000000000)
+
+
+def gmtime(secs=None):
+    t = _time.gmtime((time() if secs is None else secs) + EPOCH)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0)) - EPOCH
+
+
+def sleep(secs):
+    # Blocks the whole host like it blocks the chip; firmware should not do this
+    node().host.clock.sleep(secs)
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000)
+
+
+def sleep_us(us):
+    sleep(us / 1000000)
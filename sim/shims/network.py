@@ -0,0 +1,57 @@
+# MicroPython network: one station interface per node on the host's access point
+from ..context import node
+
+STA_IF, AP_IF = 0, 1
+STAT_IDLE, STAT_CONNECTING, STAT_GOT_IP = 1000, 1001, 1010
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.node = node()
+        self.interface = interface
+
+    def active(self, flag=None):
+        if flag is None:
+            return self.node.wlan_active
+        self.node.wlan_active = bool(flag)
+
+    def connect(self, ssid=None, key=None, **kw):
+        n = self.node
+        if not n.wlan_active:
+            raise OSError("STA must be active")
+        n.wlan_joined = True
+        # Joining the AP moves the radio onto the AP's channel (ESP-NOW too)
+        n.channel = n.host.wifi_channel
+
+    def disconnect(self):
+        self.node.wlan_joined = False
+
+    def isconnected(self):
+        n = self.node
+        return n.wlan_active and n.wlan_joined and n.host.wifi_up
+
+    def status(self, param=None):
+        if param == "rssi":
+            return -55
+        return STAT_GOT_IP if self.isconnected() else STAT_IDLE
+
+    def ifconfig(self, *args):
+        return ("192.168.45.%d" % (10 + self.node.index), "255.255.255.0", "192.168.45.1", "192.168.45.1")
+
+    def config(self, *args, **kw):
+        n = self.node
+        if "channel" in kw:
+            if n.wlan_joined:
+                raise OSError("can't set channel while connected")
+            n.channel = kw["channel"]
+        if args:
+            key = args[0]
+            if key == "mac":
+                return n.mac
+            if key == "channel":
+                return n.channel
+            if key in ("ssid", "essid"):
+                return "nano"
+            if key == "txpower":
+                return 20
+            raise ValueError("unknown config param")
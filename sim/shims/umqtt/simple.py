@@ -0,0 +1,71 @@
+# umqtt.simple client against the host's in-process broker (sim.broker)
+from collections import deque
+
+from ...context import node
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0, ssl=None, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.node = node()
+        self.cb = None
+        self.broker = None
+        self._subs = []
+        self._inbox = deque()
+        self.node.mqtt.append(self)
+
+    def _drop(self):
+        self.broker = None
+
+    def _live(self):
+        if self.broker is None or not self.node.host.wifi_up:
+            raise OSError(104, "ECONNRESET")
+        return self.broker
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def set_last_will(self, topic, msg, retain=False, qos=0):
+        pass
+
+    def connect(self, clean_session=True, timeout=None):
+        if not self.node.host.wifi_up:
+            raise OSError(113, "EHOSTUNREACH")
+        broker = self.node.host.broker
+        broker.connect(self)
+        self.broker = broker
+        if clean_session:
+            self._subs = []
+            self._inbox.clear()
+        return 0
+
+    def disconnect(self):
+        if self.broker:
+            self.broker.disconnect(self)
+        self.broker = None
+
+    def ping(self):
+        self._live()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._live().publish(topic, msg, retain)
+
+    def subscribe(self, topic, qos=0):
+        self._live().subscribe(self, topic)
+
+    def wait_msg(self):
+        # Nothing to block on in the shared host loop: behaves like check_msg
+        broker = self._live()
+        if self._inbox:
+            topic, msg = self._inbox.popleft()
+            if broker.taps:
+                broker.delivered(self, topic, msg)
+            self.cb(topic, msg)
+
+    def check_msg(self):
+        return self.wait_msg()
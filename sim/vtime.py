@@ -0,0 +1,54 @@
+# Virtual-time event loop: when no callback is ready, time jumps straight to
+# the next timer instead of waiting for it. asyncio.sleep, call_later and
+# loop.time() all follow sim.clock.VirtualClock, which also backs the time
+# shim and the radio/BLE models, so an hour of show runs in seconds.
+#
+#   sim.vtime.run(main())   # like asyncio.run, Host() picks up the clock
+import asyncio
+import selectors
+
+from .clock import VirtualClock
+
+
+class _Selector:
+    # Polls real file descriptors without blocking; an idle wait is a time jump
+    def __init__(self, clock):
+        self.clock = clock
+        self.real = selectors.DefaultSelector()
+
+    def select(self, timeout=None):
+        # The loop's own self-pipe is always registered; only poll past it
+        if len(self.real.get_map()) > 1:
+            events = self.real.select(0)
+            if events:
+                return events
+        if timeout is None:
+            # Nothing scheduled at all: only outside input can wake us
+            return self.real.select(None)
+        self.clock.now += timeout
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock=None):
+        self.clock = clock or VirtualClock()
+        super().__init__(selector=_Selector(self.clock))
+
+    def time(self):
+        return self.clock.now
+
+
+def run(main, clock=None):
+    loop = VirtualLoop(clock)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()